@@ -1,18 +1,34 @@
-from typing import Annotated
+import cProfile
+import inspect
+from importlib.metadata import version
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from itertools import islice
+from pathlib import Path
+from typing import Annotated, Callable, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
 import rich
 import typer
-from typer import rich_utils
-from rich.progress import Progress, TimeRemainingColumn, MofNCompleteColumn, TimeElapsedColumn, BarColumn
 
-from utilities import textualize, get_texts, count_callback
-from tokenization import tokenize
-from lowercase import lowercase
-from stem import stem
-from handle_stopwords import remove_stopwords
-
-# Define certain colors and styles
-rich_utils.OPTIONS_PANEL_TITLE = "[not dim]Options"
+from cli import run_app
+from batching import TokenBatch
+from checkpoint import CHECKPOINT
+from corpus_cache import cached_texts
+from doc_term_matrix import MATRIX_FILE, WEIGHTINGS, export_matrix, weighting_callback
+from instrumentation import STATS, Snapshot
+from inverted_index import INDEX, Delta as IndexDelta, INDEX_FILE, clear_index
+from manifest import MANIFEST, Delta, content_hash, read_stage_output, stage_fingerprints
+from normalizer import NORMALIZER
+from file_writing import start_background_writer, flush_background_writer, stop_background_writer
+from sinks import get_sink, close_sinks, clear_shards, trim_shards, format_callback
+from utilities import stream_texts, count_callback, emit_callback, backend_callback, BACKENDS
+from stage_graph import DEFAULT_GRAPH, FusedStages, StageGraph, load_graph
+from stages import clean_text, lowercase_tokens, STAGE_FILES
+from stem import stemmer_callback
+from stem_cache import STEM_CACHE, STEMMERS
+from tokenization import engine_callback
+from treebank import ENGINES, TREEBANK_PATTERN
+from vocabulary import Vocabulary
+from stopword_index import StopwordIndex, load_stopwords, DEFAULT_STOPWORDS_FILE
 
 # Define Typer CLI app
 app = typer.Typer(name="Reuters Data Pipeline", rich_markup_mode='rich', no_args_is_help=True,
@@ -22,9 +38,530 @@ app = typer.Typer(name="Reuters Data Pipeline", rich_markup_mode='rich', no_args
 ARTICLE_COUNT_OPTION = typer.Option('--count', '-c', callback=count_callback,
                                     help="Specify how many articles to process and create output "
                                          "files for. Can be any number >= 1 or \"all\"")
+WORKERS_OPTION = typer.Option('--workers', '-w', min=1,
+                              help="How many processes to spread articles across. 1 processes every article "
+                                   "in this process")
+PARSE_WORKERS_OPTION = typer.Option('--parse-workers', min=1,
+                                    help="How many processes to read the corpus' .sgm files with, concurrently. "
+                                         "Articles still arrive in order")
+BACKEND_OPTION = typer.Option('--backend', '-b', callback=backend_callback,
+                              help="How to extract article text from the corpus' .sgm files. Can be one of: "
+                                   f"{', '.join(BACKENDS)}. All give the same text. \"lxml\" needs lxml installed")
+STEM_CACHE_OPTION = typer.Option('--stem-cache', help="Specify an optional file to load previously stemmed tokens "
+                                                      "from, and save newly stemmed tokens to")
+EMIT_OPTION = typer.Option('--emit', '-e', callback=emit_callback,
+                           help="Which steps to write output files for. Can be \"all\" or a comma-separated list of: "
+                                f"{', '.join(STAGE_FILES)}")
+FORMAT_OPTION = typer.Option('--format', '-f', callback=format_callback,
+                             help="How to write output. \"dirs\" writes a directory of files per article. \"jsonl\" and "
+                                  "\"binary\" append every article to a few large shards per step instead")
+WRITER_THREADS_OPTION = typer.Option('--writer-threads', min=0,
+                                     help="How many background threads write output files in each process, so "
+                                          "processing doesn't wait on the disk. 0 writes files directly")
+STATS_OPTION = typer.Option('--stats', help="Print how much time each step took, and how much work it did, at the end")
+TOKENIZER_OPTION = typer.Option('--tokenizer', '-t', callback=engine_callback,
+                                help="Which tokenizer to use. \"nltk\" is NLTK's word_tokenize(). \"regex\" gives the "
+                                     "same tokens for the pipeline's cleaned text, several times faster")
+STEMMER_OPTION = typer.Option('--stemmer', '-s', callback=stemmer_callback,
+                              help=f"Which stemmer to use. One of {', '.join(STEMMERS)}. \"wordnet\" lemmatizes "
+                                   f"instead, which is far slower")
+GRAPH_OPTION = typer.Option('--graph', '-g', exists=True, dir_okay=False,
+                            help="A TOML file of which steps to run, in what order and with what options. Options it "
+                                 "doesn't set are taken from the command line")
+PROFILE_OPTION = typer.Option('--profile', help="Save cProfile data for this process to the given file")
+CORPUS_CACHE_OPTION = typer.Option('--corpus-cache',
+                                   help="Read articles from a pre-parsed cache of the corpus instead of parsing SGML. "
+                                        "The cache is built on first use, and rebuilt whenever the corpus changes")
+TOKEN_IDS_OPTION = typer.Option('--token-ids',
+                                help="Carry tokens between steps as arrays of integer IDs into a shared vocabulary, so "
+                                     "each distinct token is only lowercased, stemmed and checked against the "
+                                     "stopwords once. The output is the same")
+INCREMENTAL_OPTION = typer.Option('--incremental', '-i',
+                                  help="Skip articles whose output is already current, and only rerun the steps whose "
+                                       "output is out of date. Only works with the \"dirs\" format")
+INDEX_OPTION = typer.Option('--index',
+                            help="Build an inverted index of every article's final tokens in output/index/, with "
+                                 "each term's postings and frequencies. Search it with inverted_index.py")
+MATRIX_OPTION = typer.Option('--matrix', '-m', callback=weighting_callback,
+                             help=f"Also export a sparse document-term matrix of every article's final tokens to "
+                                  f"{MATRIX_FILE}, weighted by one of {', '.join(WEIGHTINGS)}. Builds the index too")
+RESUME_OPTION = typer.Option('--resume', '-r',
+                             help="Pick up after the last article an interrupted run committed to its checkpoint, "
+                                  "instead of starting over. Needs the same settings as the interrupted run")
+
+# How many articles each worker process handles per task when running with more than 1 worker
+CHUNK_SIZE = 64
+
+# Only the first few articles get a detailed breakdown printed to the screen
+DETAILED_ARTICLES = 5
+BEYOND_DETAILED_STATEMENT = ("\nArticles beyond article [green bold]5[/] will be processed as well, "
+                             "and have their results saved to files. The details just won't be printed to the "
+                             "screen to avoid overwhelming the user\n")
+
+
+# The steps of the pipeline, in the order they run, and the options they run with. Set with `use_graph()`
+GRAPH = DEFAULT_GRAPH
+
+# Which tokenizer engine the "tokens" step uses. One of `tokenization.ENGINES`
+TOKENIZER_ENGINE = 'nltk'
+
+# Which files the stopwords the "final" step removes are defined in
+STOPWORDS_FILES: Tuple[Path, ...] = (DEFAULT_STOPWORDS_FILE,)
+
+# Whether steps after tokenizing pass tokens along as IDs into `VOCABULARY`, rather than as lists of strings
+TOKEN_IDS = False
+
+# The vocabulary shared by every article in this process
+VOCABULARY = Vocabulary(STEM_CACHE.stem_tokens, STEM_CACHE)
+
+
+def tokenize_text(text: str) -> List[str]:
+    """
+    :param text: The cleaned text of an article
+    :return: The tokens of the text, as given by the chosen tokenizer engine
+    """
+
+    return ENGINES[TOKENIZER_ENGINE](text)
+
+
+def stopwords() -> StopwordIndex:
+    """
+    :return: The stopwords the "final" step removes
+    """
+
+    return load_stopwords(*STOPWORDS_FILES)
+
+
+# What each operation a stage can run does to an article. Each takes the previous stage's output. Textualizing takes
+# the article itself
+OPERATIONS: Dict[str, Callable] = {
+    'textualize': clean_text,
+    'tokenize': tokenize_text,
+    'lowercase': lowercase_tokens,
+    'stem': STEM_CACHE.stem_tokens,
+    'remove_stopwords': lambda tokens: stopwords().filter(tokens),
+}
+
+# The same operations, working on IDs into `VOCABULARY` instead of strings. Give the same output once decoded
+ID_OPERATIONS: Dict[str, Callable] = {
+    'textualize': clean_text,
+    'tokenize': lambda text: VOCABULARY.intern(tokenize_text(text)),
+    'lowercase': VOCABULARY.lowercase,
+    'stem': VOCABULARY.stem,
+    'remove_stopwords': lambda ids: VOCABULARY.filter_stopwords(ids, stopwords()),
+}
+
+# The per-token operations, working on a `TokenBatch` of the IDs of many articles at once. Each already works out
+# its result once per distinct ID, so they are never fused
+ID_BATCH_OPERATIONS: Dict[str, Callable] = {
+    'lowercase': lambda batch: batch.with_tokens(VOCABULARY.lowercase(batch.tokens)),
+    'stem': lambda batch: batch.with_tokens(VOCABULARY.stem(batch.tokens)),
+    'remove_stopwords': lambda batch: VOCABULARY.filter_stopwords_batch(batch, stopwords()),
+}
+
+# The most distinct tokens each fused pass remembers what becomes of. Unbounded if None
+FUSED_MEMO_SIZE: Optional[int] = None
+
+# The passes `run_batch()` makes over a batch's tokens, by which steps' output is needed. Fused passes remember what
+# each token becomes, so they are kept for the whole run
+BATCH_PASSES: Dict[Tuple[FrozenSet[str], bool], List[Tuple[str, str, Callable]]] = {}
+
+
+def use_graph(graph: StageGraph, tokenizer_engine: str = 'nltk', stemmer: str = 'porter') -> None:
+    """
+    Run the pipeline's steps as the given stage graph says. Options the graph's stages weren't given come from the
+    pipeline's own options
+
+    :param graph: The steps to run, in order
+    :param tokenizer_engine: Which tokenizer engine to use, unless the graph's tokenize stage says
+    :param stemmer: Which of the `STEMMERS` to use, unless the graph's stem stage says
+    """
+
+    global GRAPH, TOKENIZER_ENGINE, STOPWORDS_FILES
+
+    GRAPH = graph
+    TOKENIZER_ENGINE = graph.option('tokenize', 'engine', tokenizer_engine)
+    STOPWORDS_FILES = tuple(map(Path, graph.option('remove_stopwords', 'stopwords', [DEFAULT_STOPWORDS_FILE])))
+    STEM_CACHE.use(graph.option('stem', 'stemmer', stemmer))
+    BATCH_PASSES.clear()
+
+
+def batch_passes(needed: FrozenSet[str]) -> List[Tuple[str, str, Callable]]:
+    """
+    Plan the passes `run_batch()` makes over a batch's tokens after tokenizing. Adjacent per-token stages are fused
+    into 1 pass, unless one of their outputs is needed in between, and stages no needed output depends on are left out
+
+    :param needed: The steps whose output is needed
+    :return: Each pass, in order, as (the step whose output it gives, name in statistics, function)
+    """
+
+    passes = BATCH_PASSES.get((needed, TOKEN_IDS))
+
+    if passes is None:
+        if TOKEN_IDS:
+            passes = [(stage.output, stage.operation, ID_BATCH_OPERATIONS[stage.operation])
+                      for stages in GRAPH.plan(needed) for stage in stages]
+        else:
+            passes = []
+
+            for stages in GRAPH.plan(needed):
+                fused = FusedStages(stages, STOPWORDS_FILES, FUSED_MEMO_SIZE)
+                passes.append((stages[-1].output, fused.name, fused))
+
+        BATCH_PASSES[(needed, TOKEN_IDS)] = passes
+
+    return passes
+
+
+def step_configs() -> List[str]:
+    """
+    Describe how each step of the pipeline is currently configured, so the manifest can tell when earlier output was
+    produced differently
+
+    :return: A description of each step the stage graph runs, in order
+    """
+
+    configs = {
+        'text': inspect.getsource(type(NORMALIZER)),
+        'tokens': (f"nltk {version('nltk')} word_tokenize" if TOKENIZER_ENGINE == 'nltk'
+                   else f"{TOKENIZER_ENGINE} {content_hash(TREEBANK_PATTERN.pattern)}"),
+        'lowercase': 'str.lower',
+        'stems': f"nltk {version('nltk')} {STEM_CACHE.name}",
+        'final': content_hash(b''.join(stopwords_file.read_bytes() for stopwords_file in STOPWORDS_FILES)),
+    }
+
+    return [configs[stage] for stage in GRAPH.outputs]
+
+
+def process_article(article: str, article_num: int, emit: FrozenSet[str] = frozenset(STAGE_FILES),
+                    output_format: str = 'dirs') -> None:
+    """
+    Run every step of the pipeline on a single article in one in-memory pass, then write the requested steps' output
+    to file. Steps after the last one whose output is needed aren't run.
+
+    With the manifest enabled, articles whose requested output is already current are skipped, and otherwise the
+    pipeline picks up from the last step whose output on disk is still current.
+
+    :param article: The article, as produced by `stream_texts()`
+    :param article_num: Which article this is
+    :param emit: Which steps to write output files for. All of them by default
+    :param output_format: How to write output. One of the formats in `sinks.SINKS`
+    """
+
+    # Only times the steps if statistics were asked for
+    timer = STATS.timer()
+
+    # Every step up to the last one whose output is needed, as (step, name in statistics, function)
+    operations = ID_OPERATIONS if TOKEN_IDS else OPERATIONS
+    needed = emit | {GRAPH.final} if INDEX.enabled else emit
+    last = max((position for position, stage in enumerate(GRAPH.outputs) if stage in needed), default=-1)
+    steps = [(stage.output, stage.operation, operations[stage.operation]) for stage in GRAPH.stages[:last + 1]]
+
+    value = article
+    first_step = 0
+
+    if MANIFEST.enabled:
+        article_hash = content_hash(article)
+        resume_from = MANIFEST.plan(article_num, article_hash, emit)
+
+        if resume_from is None:
+            if article_num <= DETAILED_ARTICLES:
+                rich.print("\talready up to date")
+
+            # The index is rebuilt on every run, so it still needs the final tokens already on disk
+            if INDEX.enabled:
+                INDEX.add(article_num, read_stage_output(article_num, GRAPH.final))
+            return
+
+        if resume_from >= 0:
+            value = read_stage_output(article_num, steps[resume_from][0])
+            first_step = resume_from + 1
+
+            # Tokens read back from file need IDs before the remaining steps can use them
+            if TOKEN_IDS and resume_from > 0:
+                value = VOCABULARY.intern(value)
+
+        if timer:
+            timer.lap('manifest')
+
+    # Do normal pipeline steps, in order, keeping each step's output
+    outputs = {}
+
+    for stage, name, function in steps[first_step:]:
+        value = outputs[stage] = function(value)
+
+        if timer:
+            timer.lap(name)
+
+            if stage == 'tokens':
+                STATS.count('tokens processed', len(value))
+
+    sink = get_sink(output_format)
+
+    # Only write the steps that were asked for, in the order they ran. Steps that weren't rerun are already on disk
+    written = [stage for stage in GRAPH.outputs if stage in emit and stage in outputs]
+
+    for stage in written:
+        # Don't print for any articles beyond 5
+        if article_num <= DETAILED_ARTICLES:
+            rich.print(f"\twriting to file \"{sink.describe(article_num, stage)}\"")
+
+        # IDs mean nothing outside this process, so only ever write tokens
+        if TOKEN_IDS and stage != 'text':
+            sink.write(article_num, stage, VOCABULARY.decode(outputs[stage]))
+        else:
+            sink.write(article_num, stage, outputs[stage])
+
+    if MANIFEST.enabled:
+        MANIFEST.record(article_num, article_hash, written)
+
+    if timer:
+        timer.lap('write')
+
+    if INDEX.enabled:
+        INDEX.add(article_num, VOCABULARY.decode(outputs[GRAPH.final]) if TOKEN_IDS else outputs[GRAPH.final])
+
+        if timer:
+            timer.lap('index')
+
+
+def run_batch(articles: List[str], stages: FrozenSet[str] = frozenset(STAGE_FILES)) -> Dict[str, List]:
+    """
+    Run every step of the pipeline on a batch of articles, in memory.
+
+    Articles are cleaned and tokenized 1 at a time, then their tokens are concatenated into a single `TokenBatch` so
+    lowercasing, stemming and stopword removal run over the whole batch at once. Adjacent steps whose output in between
+    isn't needed run as 1 pass, and steps after the last needed output don't run at all. See `batch_passes()`. Gives
+    the same output as `process_article()` on each article.
+
+    :param articles: The articles in the batch, in order, as produced by `stream_texts()`
+    :param stages: Which steps' output to hand back. All of them by default
+    :return: For each of the given steps, its output for each article, in order. Text for the "text" step, and lists
+        of tokens for the others
+    """
+
+    # Only times the steps if statistics were asked for
+    timer = STATS.timer()
+
+    texts = [clean_text(article) for article in articles]
+
+    if timer:
+        timer.lap('textualize', len(articles))
+
+    batch = TokenBatch.from_articles(tokenize_text(text) for text in texts)
+    if TOKEN_IDS:
+        batch = batch.with_tokens(VOCABULARY.intern(batch.tokens))
+
+    if timer:
+        timer.lap('tokenize', len(articles))
+        STATS.count('tokens processed', len(batch.tokens))
+
+    outputs = {'text': texts, 'tokens': batch}
+
+    for stage, name, function in batch_passes(frozenset(stages)):
+        batch = outputs[stage] = function(batch)
+
+        if timer:
+            timer.lap(name, len(articles))
+
+    # Only split the steps that were asked for back into articles. IDs mean nothing outside this process, so they're
+    # always decoded back into tokens
+    return {stage: texts if stage == 'text'
+            else [VOCABULARY.decode(ids) for ids in outputs[stage].articles()] if TOKEN_IDS
+            else outputs[stage].articles()
+            for stage in GRAPH.outputs if stage in stages and stage in outputs}
+
+
+def process_batch(first_article_num: int, articles: List[str], emit: FrozenSet[str] = frozenset(STAGE_FILES),
+                  output_format: str = 'dirs') -> None:
+    """
+    Run every step of the pipeline on a batch of consecutive articles with `run_batch()`, then write the requested
+    steps' output to file
+
+    :param first_article_num: The article number of the first article in the batch
+    :param articles: The articles in the batch, in order, as produced by `stream_texts()`
+    :param emit: Which steps to write output files for. All of them by default
+    :param output_format: How to write output. One of the formats in `sinks.SINKS`
+    """
+
+    # The index needs every article's final tokens, even when they aren't written
+    outputs = run_batch(articles, emit | {GRAPH.final} if INDEX.enabled else emit)
+
+    # Only times writing if statistics were asked for
+    timer = STATS.timer()
+    sink = get_sink(output_format)
+
+    for offset in range(len(articles)):
+        for stage, output in outputs.items():
+            if stage in emit:
+                sink.write(first_article_num + offset, stage, output[offset])
+
+    if timer:
+        timer.lap('write', len(articles))
+
+    if INDEX.enabled:
+        for offset, tokens in enumerate(outputs[GRAPH.final]):
+            INDEX.add(first_article_num + offset, tokens)
+
+        if timer:
+            timer.lap('index', len(articles))
+
+
+def process_articles(first_article_num: int, articles: List[str], emit: FrozenSet[str], output_format: str) -> None:
+    """
+    Run the pipeline on consecutive articles, as a single batch where possible
+
+    :param first_article_num: The article number of the first article
+    :param articles: The articles, in order
+    :param emit: Which steps to write output files for
+    :param output_format: How to write output
+    """
+
+    # The manifest decides how much of the pipeline each article needs, so those articles can't share a batch
+    if MANIFEST.enabled:
+        for offset, article in enumerate(articles):
+            process_article(article, first_article_num + offset, emit, output_format)
+    else:
+        process_batch(first_article_num, articles, emit, output_format)
 
 
-@app.command(options_metavar='[--help] [--count <NUMBER> | --count \"all\"]', epilog="Thanks for using my data pipeline! :boom:",
+def process_chunk(first_article_num: int, articles: List[str], emit: FrozenSet[str],
+                  output_format: str) -> Tuple[int, int, Tuple[Dict[str, str], int, int], Snapshot, Delta, IndexDelta]:
+    """
+    Run the pipeline on a consecutive chunk of articles. This is the unit of work given to worker processes
+
+    :param first_article_num: The article number of the first article in the chunk
+    :param articles: The articles in the chunk, in order
+    :param emit: Which steps to write output files for
+    :param output_format: How to write output
+    :return: The chunk's first article number, how many articles were processed, and what this process' stemming
+        cache, statistics, manifest and index learned meanwhile
+    """
+
+    process_articles(first_article_num, articles, emit, output_format)
+
+    # Worker processes are never told when they're done, so make sure every finished chunk is on disk
+    get_sink(output_format).flush()
+    flush_background_writer()
+
+    return first_article_num, len(articles), STEM_CACHE.drain(), STATS.drain(), MANIFEST.drain(), INDEX.drain()
+
+
+def save_checkpoint(output_format: str) -> None:
+    """
+    Save the checkpoint, once everything it covers is on disk. Worker processes already flush after every chunk
+
+    :param output_format: How output is written
+    """
+
+    get_sink(output_format).flush()
+    flush_background_writer()
+
+    # The manifest and index must cover the same articles as the checkpoint, or a resumed run would lose them
+    if MANIFEST.enabled:
+        MANIFEST.save()
+
+    # Chunks that finished before an earlier one did are past the checkpoint, and will be redone by a resumed run
+    if INDEX.enabled:
+        INDEX.write_partial(up_to=CHECKPOINT.committed)
+
+    CHECKPOINT.save()
+
+
+def commit(first_article_num: int, count: int, output_format: str) -> None:
+    """
+    Mark a chunk of articles as having all its output written, and save the checkpoint if it is due
+
+    :param first_article_num: The article number of the first article in the chunk
+    :param count: How many articles the chunk holds
+    :param output_format: How output is written
+    """
+
+    CHECKPOINT.finish(first_article_num, count)
+
+    if CHECKPOINT.enabled and CHECKPOINT.due():
+        save_checkpoint(output_format)
+
+
+def merge_chunk(result: Tuple[int, int, Tuple[Dict[str, str], int, int], Snapshot, Delta, IndexDelta],
+                output_format: str) -> int:
+    """
+    Take in what a worker process learned while processing a chunk, and commit the chunk
+
+    :param result: What `process_chunk()` returned
+    :param output_format: How output is written
+    :return: How many articles the chunk held
+    """
+
+    first_article_num, count, learned, collected, recorded, postings = result
+
+    STEM_CACHE.merge(learned)
+    STATS.merge(collected)
+    MANIFEST.merge(recorded)
+    INDEX.merge(postings)
+    commit(first_article_num, count, output_format)
+
+    return count
+
+
+def init_worker(stem_cache_file: Optional[Path], writer_threads: int, stats: bool, tokenizer_engine: str = 'nltk',
+                manifest: Optional[Tuple[Dict[str, str], Dict[str, Tuple[str, Dict[str, str]]]]] = None,
+                token_ids: bool = False, index: bool = False, stemmer: str = 'porter',
+                graph: StageGraph = DEFAULT_GRAPH) -> None:
+    """
+    Prepare a worker process, so state shared between articles is only built once per process
+
+    :param stem_cache_file: A file of previously stemmed tokens to start from, if any
+    :param writer_threads: How many background threads write output files. 0 writes files directly
+    :param stats: Whether to collect statistics
+    :param tokenizer_engine: Which tokenizer engine to use
+    :param manifest: The fingerprint of each step and the manifest's entries, if running incrementally
+    :param token_ids: Whether to pass tokens between steps as IDs into a vocabulary
+    :param index: Whether to collect postings for the inverted index
+    :param stemmer: Which of the `STEMMERS` to use
+    :param graph: The steps to run, in order
+    """
+
+    global TOKEN_IDS
+
+    use_graph(graph, tokenizer_engine, stemmer)
+    TOKEN_IDS = token_ids
+
+    # Forked workers would otherwise report their parent's statistics, manifest updates and postings again
+    STATS.drain()
+    STATS.enabled = stats
+
+    MANIFEST.drain()
+    MANIFEST.enabled = manifest is not None
+
+    INDEX.drain()
+    INDEX.enabled = index
+    if manifest is not None:
+        MANIFEST.fingerprints, MANIFEST.entries = manifest
+
+    stopwords()
+
+    if writer_threads:
+        start_background_writer(writer_threads)
+
+    if stem_cache_file:
+        STEM_CACHE.load(stem_cache_file)
+
+
+def chunked(articles: Iterator[Tuple[int, str]], size: int) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Group numbered articles into consecutive chunks
+
+    :param articles: An iterator of (article number, article) pairs
+    :param size: The maximum number of articles per chunk
+    :return: A generator of (first article number, articles) pairs
+    """
+
+    while chunk := list(islice(articles, size)):
+        yield chunk[0][0], [article for _, article in chunk]
+
+
+@app.command(options_metavar='[--help] [--count <NUMBER> | --count \"all\"] [--workers <NUMBER>] [--parse-workers <NUMBER>] [--backend <BACKEND>] [--tokenizer <ENGINE>] [--stemmer <STEMMER>] [--graph <stages.toml>] [--stem-cache <cache.json>] [--emit <STEPS>] [--format <FORMAT>] [--writer-threads <NUMBER>] [--stats] [--profile <out.prof>] [--token-ids] [--incremental] [--index] [--matrix <WEIGHTING>] [--resume] [--corpus-cache]', epilog="Thanks for using my data pipeline! :boom:",
              help="""Process requested number of articles of the required Reuters corpus.
              Run each step of the pipeline automatically.
             
@@ -32,25 +569,230 @@ ARTICLE_COUNT_OPTION = typer.Option('--count', '-c', callback=count_callback,
              Can optionally specify how many articles you want processed. The default is 5.
              Can specify any number >= a or "all" to process all articles in the corpus.
              
+             Can optionally spread articles across several processes with [bold yellow]--workers[/]. The output
+             is identical to running with a single process. With [bold yellow]--parse-workers[/], the corpus'
+             files are also read concurrently, in their own processes.
+             
+             By default, article text is extracted from the corpus with a fast regular expression scanner. With
+             [bold yellow]--backend[/], BeautifulSoup ([bold yellow]bs4[/]) or [bold yellow]lxml[/] can be used
+             instead. Every backend gives the same text.
+             
+             With [bold yellow]--tokenizer regex[/], articles are tokenized by a single regular expression
+             implementing the same rules as NLTK's [bold yellow]word_tokenize()[/], without splitting sentences
+             first. It gives the same tokens for the pipeline's cleaned text, several times faster.
+             
+             Tokens are stemmed with NLTK's Porter stemmer by default. With [bold yellow]--stemmer[/], its
+             [bold yellow]snowball[/] or [bold yellow]lancaster[/] stemmer, or its [bold yellow]wordnet[/]
+             lemmatizer, can be used instead. See [bold yellow]python benchmark.py[/] for how they compare.
+             
+             With [bold yellow]--graph[/], the steps are read from a TOML file, with a [bold yellow][[stage]][/]
+             table per step in the order they run. Lowercasing, stemming and stopword removal can be reordered or
+             left out, and each can be given its own tokenizer, stemmer or stopwords files. Adjacent steps whose
+             output isn't needed run as a single pass over each distinct token. See [bold yellow]stage_graph.py[/].
+             
+             Each distinct token is only stemmed once. With [bold yellow]--stem-cache[/], known stems are loaded
+             from and saved to the given file, so later runs can skip stemming entirely.
+             
+             With [bold yellow]--token-ids[/], each distinct token is given an integer ID in a shared vocabulary,
+             and steps after tokenizing pass compact arrays of IDs along instead of lists of strings. Lowercasing,
+             stemming and stopword removal are then worked out once per distinct token, and only looked up after.
+             
+             All steps run together in memory. Beyond the first 5 articles, articles are processed in batches:
+             lowercasing, stemming and stopword removal each run once over every token of a batch, and articles are
+             only split back apart when written. By default every step's output is written to file.
+             With [bold yellow]--emit[/], only the given steps are written, which saves a lot of disk activity.
+             
+             With [bold yellow]--format jsonl[/] or [bold yellow]--format binary[/], output is appended to a few
+             large shards per step in [bold yellow]output/shards/[/] instead of a directory per article. Use
+             [bold yellow]sinks.ShardReader[/] to read any article back out of them.
+             
+             With [bold yellow]--stats[/], a table of the time spent in each step is printed at the end. With
+             [bold yellow]--profile[/], cProfile data for the main process is saved to the given file.
+             
+             With [bold yellow]--incremental[/], a manifest of every article's content hash and how each step was
+             configured is kept in [bold yellow]output/.manifest.json[/]. Reruns skip articles whose output is
+             already current, and otherwise only rerun the steps that are out of date. i.e. after editing the
+             stopwords file, only stopword removal is redone, starting from the stemmed output already on disk.
+             
+             With [bold yellow]--index[/], an inverted index of every article's final tokens is built in
+             [bold yellow]output/index/index.idx[/]: each term's postings, as the articles it appears in and how often,
+             with each article's length. It is sorted and memory-mapped, so any term is found by binary search. See
+             [bold yellow]inverted_index.py[/] to search it.
+             
+             With [bold yellow]--matrix[/], the index is also exported as a sparse document-term matrix in
+             [bold yellow]output/matrix.npz[/], weighted by count, tf or tfidf, with its vocabulary, ready for
+             [bold yellow]scipy.sparse.load_npz()[/]. It is written straight from the index a buffer at a time, so
+             no further pass over the output files is needed. See [bold yellow]doc_term_matrix.py[/].
+             
+             Progress is committed to a checkpoint in [bold yellow]output/.checkpoint.json[/] every 1024 articles,
+             once their output is on disk. If a run is interrupted, rerunning it with [bold yellow]--resume[/] and
+             the same settings picks up after the last committed article. Corpus files holding only committed
+             articles aren't read again. The checkpoint is removed once a run finishes.
+             
+             With [bold yellow]--corpus-cache[/], articles are read from a pre-parsed, memory-mapped cache of the
+             corpus, so no SGML is parsed. See [bold yellow]corpus_cache.py[/].
+             
              Runs the following functionality:\n
-             1. Turn the given Reuters articles into a more standard textual format for easier processing
-             2. Tokenize each article
-             3. Lowercase each token for each article
-             4. Stem each token for each article
-             5. Remove stopwords for each article
+             1. Turn the given Reuters articles into a more standard textual format for easier processing [dim](text)[/]
+             2. Tokenize each article [dim](tokens)[/]
+             3. Lowercase each token for each article [dim](lowercase)[/]
+             4. Stem each token for each article [dim](stems)[/]
+             5. Remove stopwords for each article [dim](final)[/]
              
              [bold yellow]Example Usages[/]:
              python Pipeline.py
              python Pipeline.py --count 100
              python Pipeline.py --count "all"
+             python Pipeline.py --count "all" --workers 8
+             python Pipeline.py --count "all" --workers 8 --parse-workers 4
+             python Pipeline.py --count "all" --backend lxml
+             python Pipeline.py --count "all" --tokenizer regex
+             python Pipeline.py --count "all" --stemmer snowball
+             python Pipeline.py --count "all" --graph stages.toml --emit final
+             python Pipeline.py --count "all" --stem-cache stems.json
+             python Pipeline.py --count "all" --token-ids
+             python Pipeline.py --count "all" --emit final
+             python Pipeline.py --count "all" --emit tokens,final
+             python Pipeline.py --count "all" --emit final --format jsonl
+             python Pipeline.py --count "all" --stats --profile pipeline.prof
+             python Pipeline.py --count "all" --incremental
+             python Pipeline.py --count "all" --workers 8 --resume
+             python Pipeline.py --count "all" --emit final --index
+             python Pipeline.py --count "all" --emit final --matrix tfidf
+             python Pipeline.py --count "all" --corpus-cache
              """)
-def pipeline(article_count: Annotated[str, ARTICLE_COUNT_OPTION] = '5') -> None:
+def pipeline(article_count: Annotated[str, ARTICLE_COUNT_OPTION] = '5',
+             workers: Annotated[int, WORKERS_OPTION] = 1,
+             parse_workers: Annotated[int, PARSE_WORKERS_OPTION] = 1,
+             backend: Annotated[str, BACKEND_OPTION] = 'regex',
+             tokenizer_engine: Annotated[str, TOKENIZER_OPTION] = 'nltk',
+             stemmer: Annotated[str, STEMMER_OPTION] = 'porter',
+             graph_file: Annotated[Optional[Path], GRAPH_OPTION] = None,
+             stem_cache_file: Annotated[Optional[Path], STEM_CACHE_OPTION] = None,
+             emit: Annotated[str, EMIT_OPTION] = 'all',
+             output_format: Annotated[str, FORMAT_OPTION] = 'dirs',
+             writer_threads: Annotated[int, WRITER_THREADS_OPTION] = 1,
+             stats: Annotated[bool, STATS_OPTION] = False,
+             profile: Annotated[Optional[Path], PROFILE_OPTION] = None,
+             token_ids: Annotated[bool, TOKEN_IDS_OPTION] = False,
+             incremental: Annotated[bool, INCREMENTAL_OPTION] = False,
+             index: Annotated[bool, INDEX_OPTION] = False,
+             matrix: Annotated[Optional[str], MATRIX_OPTION] = None,
+             resume: Annotated[bool, RESUME_OPTION] = False,
+             corpus_cache: Annotated[bool, CORPUS_CACHE_OPTION] = False) -> None:
     """
     Run each step of the pipeline automatically
 
     :param article_count: The number of articles requested to process. Can be any number >= 1 or "all". Default is 5
+    :param workers: How many processes to spread the articles across. Default is 1
+    :param parse_workers: How many processes to read the corpus' files with. Default is 1
+    :param backend: How to extract article text from the corpus. "bs4", "lxml" or "regex". Default is "regex"
+    :param tokenizer_engine: Which tokenizer engine to use. "nltk" or "regex". Default is "nltk"
+    :param stemmer: Which stemmer to use. One of `STEMMERS`. Default is "porter"
+    :param graph_file: A TOML file of the steps to run, if not the default ones. See `stage_graph.load_graph()`
+    :param stem_cache_file: A file to load known stems from before processing, and save them to after
+    :param emit: Which steps to write output files for. "all" or a comma-separated list of steps. Default is "all"
+    :param output_format: How to write output. "dirs", "jsonl" or "binary". Default is "dirs"
+    :param writer_threads: How many background threads write output files in each process. Default is 1
+    :param stats: Whether to print statistics about each step at the end. Default is False
+    :param profile: A file to save cProfile data for this process to
+    :param token_ids: Whether to pass tokens between steps as IDs into a shared vocabulary. Default is False
+    :param incremental: Whether to skip work whose output is already current. Default is False
+    :param index: Whether to build an inverted index of every article's final tokens. Default is False
+    :param matrix: How to weight a document-term matrix exported from the index, if one should be. One of "count",
+        "tf" or "tfidf"
+    :param resume: Whether to pick up after the last article an interrupted run committed. Default is False
+    :param corpus_cache: Whether to read articles from a pre-parsed cache of the corpus. Default is False
     """
 
+    # The manifest reads earlier output back from per-article files, which shards don't have
+    if incremental and output_format != 'dirs':
+        rich.print("\n[red bold]--incremental only works with the[/] dirs [red bold]format[/]\n")
+        raise typer.Exit(1)
+
+    try:
+        graph = load_graph(graph_file) if graph_file else DEFAULT_GRAPH
+    except ValueError as error:
+        rich.print(f"\n[red bold]Can't use the stage graph:[/] {error}\n")
+        raise typer.Exit(1)
+
+    # The graph can pick the stemmer too, which needs the same checks as --stemmer
+    stemmer_callback(graph.option('stem', 'stemmer', stemmer))
+
+    global TOKEN_IDS
+
+    # Before anything is stemmed, or the steps are fingerprinted, since each stage's options are part of its config
+    use_graph(graph, tokenizer_engine, stemmer)
+    TOKEN_IDS = token_ids
+    STATS.enabled = stats
+
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+
+    # Determine which steps' output gets written to file
+    EMIT: FrozenSet[str] = (frozenset(graph.outputs) if emit.lower() == 'all'
+                            else frozenset(stage.strip().lower() for stage in emit.split(',')))
+
+    skipped = [stage for stage in STAGE_FILES if stage in EMIT and stage not in graph.outputs]
+    if skipped:
+        rich.print(f"\n[red bold]The stage graph doesn't run the steps for:[/] {', '.join(skipped)}\n")
+        raise typer.Exit(1)
+
+    # The matrix is exported from the index
+    index = index or matrix is not None
+
+    # Articles the manifest skips are only indexed from their final output on disk
+    if incremental and index and graph.final not in EMIT:
+        rich.print(f"\n[red bold]--incremental with --index or --matrix needs the[/] {graph.final} [red bold]step, "
+                   f"the last in the stage graph, to be emitted[/]\n")
+        raise typer.Exit(1)
+
+    # Write output files in the background while articles are processed
+    if writer_threads:
+        start_background_writer(writer_threads)
+
+    # Only a run with the same settings can be resumed, or articles before and after the checkpoint would differ
+    CHECKPOINT.enabled = True
+    CHECKPOINT.settings = {'count': article_count.lower(), 'emit': sorted(EMIT), 'format': output_format,
+                           'index': index, 'steps': stage_fingerprints(step_configs(), graph.outputs)}
+
+    if resume:
+        try:
+            resumed = CHECKPOINT.load()
+        except ValueError as error:
+            rich.print(f"\n[red bold]Can't resume:[/] {error}\n")
+            raise typer.Exit(1)
+
+        if resumed:
+            rich.print(f"\n[bold blue]Resuming:[/] articles up to [bold green]{CHECKPOINT.committed}[/] are already done")
+        else:
+            rich.print("\n[bold blue]Resuming:[/] no interrupted run to resume, so starting from the first article")
+    else:
+        CHECKPOINT.clear()
+
+    # Shards are only ever appended to, so start from scratch, or from the last article a resumed run committed
+    if output_format != 'dirs':
+        if CHECKPOINT.committed:
+            trim_shards(list(EMIT), CHECKPOINT.committed)
+        else:
+            clear_shards(list(EMIT))
+
+    # The index is rebuilt from every article. A resumed run keeps the partial indexes of the articles it committed
+    INDEX.enabled = index
+    if index and not CHECKPOINT.committed:
+        clear_index()
+
+    if stem_cache_file:
+        STEM_CACHE.load(stem_cache_file)
+
+    if incremental:
+        MANIFEST.enabled = True
+        MANIFEST.fingerprints = stage_fingerprints(step_configs(), graph.outputs)
+        MANIFEST.load()
+
+    from rich.progress import Progress, TimeRemainingColumn, MofNCompleteColumn, TimeElapsedColumn, BarColumn
+
     # Create progress bar
     progress_bar = Progress('[progress.description]{task.description}', BarColumn(),
                             MofNCompleteColumn(), '|',
@@ -58,52 +800,122 @@ def pipeline(article_count: Annotated[str, ARTICLE_COUNT_OPTION] = '5') -> None:
                             'Estimated Time Remaining:', TimeRemainingColumn(compact=True)
                             )
 
-    # Will need to print a statement indicating that articles beyond 5 won't be printed to the screen,
-    # but only show this message once
-    statement_printed = False
-
     # Determine if we're using all articles
     USING_ALL_ARTICLES = article_count.isalpha() and article_count.lower() == 'all'
 
-    # Get all requested articles
-    ALL_ARTICLES = get_texts(article_count=article_count)
+    # Lazily read requested articles, numbering them as they arrive. Each one is processed as soon as it has been read
+    # A resumed run leaves out the articles already committed, and the corpus files holding only those aren't read
+    texts = (cached_texts(article_count=article_count, skip=CHECKPOINT.committed) if corpus_cache
+             else stream_texts(article_count=article_count, parse_workers=parse_workers, backend=backend,
+                               skip=CHECKPOINT.committed, file_counts=CHECKPOINT.file_counts))
+    ALL_ARTICLES = enumerate(STATS.timed('read', texts), start=CHECKPOINT.committed + 1)
+
+    # The total is only known up front when a definite number of articles is requested
+    TOTAL = None if USING_ALL_ARTICLES else int(article_count)
+
+    # Keep track of how many articles were actually processed
+    processed = 0
 
     # Do all processing within the context of the progress bar, so it updates properly
     with progress_bar as progress:
-        task = progress.add_task("Processing all articles...", total=len(ALL_ARTICLES))
-
-        # Loop through each article and process it
-        for i, article in enumerate(ALL_ARTICLES, start=1):
-
-            # Only print detailed breakdowns for first 5 articles
-            if i <= 5:
-                rich.print(f"Article [bold green]{i}[/]:")
-            else:
-                if USING_ALL_ARTICLES or (article_count.isnumeric() and i > 5):
-                    if not statement_printed:
-                        rich.print("\nArticles beyond article [green bold]5[/] will be processed as well, "
-                                   "and have their results saved to files. The details just won't be printed to the "
-                                   "screen to avoid overwhelming the user\n")
-                        statement_printed = True
-
-            # Dome some helpful preprocessing to have text that can be saved to a file as initial text
-            this_article = textualize(article, i)
-
-            # Do normal pipeline steps, in order
-            tokenized = tokenize(this_article, i, pipeline=True)
-            lower_cased = lowercase(tokenized, i, pipeline=True)
-            stemmed = stem(lower_cased, i, pipeline=True)
-            _ = remove_stopwords(stemmed, i, pipeline=True)
-
-            # For formatting
-            if i == len(ALL_ARTICLES) and len(ALL_ARTICLES) <= 5:
-                print()
+        task = progress.add_task("Processing all articles...", total=TOTAL, completed=CHECKPOINT.committed)
+
+        # Print detailed breakdowns for the first few articles. These are always processed in this process, so
+        # their output isn't interleaved
+        for i, article in islice(ALL_ARTICLES, max(DETAILED_ARTICLES - CHECKPOINT.committed, 0)):
+            rich.print(f"Article [bold green]{i}[/]:")
+
+            process_article(article, i, EMIT, output_format)
+            commit(i, 1, output_format)
+            processed += 1
 
             # Advance the progress bar
             progress.update(task, advance=1)
 
+        # Spread any remaining articles across worker processes, in chunks
+        if workers > 1:
+            # Anything still buffered would otherwise be copied into, and written again by, forked workers
+            get_sink(output_format).flush()
+            flush_background_writer()
+
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(stem_cache_file, writer_threads, stats, tokenizer_engine,
+                                               (MANIFEST.fingerprints, MANIFEST.entries) if incremental else None,
+                                               token_ids, index, stemmer, graph)
+                                     ) as executor:
+                pending = set()
+
+                for first_article_num, articles in chunked(ALL_ARTICLES, CHUNK_SIZE):
+                    if first_article_num == DETAILED_ARTICLES + 1:
+                        rich.print(BEYOND_DETAILED_STATEMENT)
+
+                    pending.add(executor.submit(process_chunk, first_article_num, articles, EMIT, output_format))
+
+                    # Only read ahead of the workers by a bounded amount, so memory use stays flat
+                    if len(pending) >= workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            count = merge_chunk(future.result(), output_format)
+                            processed += count
+                            progress.update(task, advance=count)
+
+                for future in as_completed(pending):
+                    count = merge_chunk(future.result(), output_format)
+                    processed += count
+                    progress.update(task, advance=count)
+
+        # Otherwise, process any remaining articles here, a chunk at a time
+        else:
+            for first_article_num, articles in chunked(ALL_ARTICLES, CHUNK_SIZE):
+                # Will need to print a statement indicating that articles beyond 5 won't be printed to the screen,
+                # but only show this message once
+                if first_article_num == DETAILED_ARTICLES + 1:
+                    rich.print(BEYOND_DETAILED_STATEMENT)
+
+                process_articles(first_article_num, articles, EMIT, output_format)
+                commit(first_article_num, len(articles), output_format)
+                processed += len(articles)
+                progress.update(task, advance=len(articles))
+
+        # The corpus may hold fewer articles than requested, so the bar should end full either way
+        progress.update(task, total=CHECKPOINT.committed, completed=CHECKPOINT.committed)
+
+        # For formatting
+        if processed <= DETAILED_ARTICLES:
+            print()
+
+    close_sinks()
+    stop_background_writer()
+
+    if index:
+        rich.print(f"[bold blue]Index:[/] [bold green]{INDEX.finish()}[/] terms in \"{INDEX_FILE}\"")
+
+    if matrix:
+        rows, columns, values = export_matrix(INDEX_FILE, MATRIX_FILE, matrix)
+        rich.print(f"[bold blue]Matrix:[/] {rows} articles x {columns} terms, [bold green]{values}[/] non-zero, "
+                   f"in \"{MATRIX_FILE}\"")
+
+    # The run finished, so there is nothing left to resume
+    CHECKPOINT.clear()
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(profile)
+        rich.print(f"Saved profile to \"{profile}\"")
+
+    if stats:
+        rich.print(STATS.table())
+
+    if stem_cache_file:
+        STEM_CACHE.save(stem_cache_file)
+
+    rich.print(f"[bold blue]Stemming cache:[/] {STEM_CACHE.summary()}")
+
+    if incremental:
+        MANIFEST.save()
+        rich.print(f"[bold blue]Manifest:[/] {MANIFEST.summary()}")
     rich.print("\n[bold green]DONE![/] Thanks for using my data pipeline! :boom:")
 
 
 if __name__ == '__main__':
-    app()
+    run_app(app)
@@ -0,0 +1,126 @@
+import importlib.util
+from array import array
+from itertools import accumulate, chain, compress
+from typing import Iterable, List, Sequence
+
+from stopword_index import StopwordIndex
+
+# NumPy is optional, and only imported when a batch is actually filtered with it
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
+
+
+class TokenBatch:
+    """
+    The tokens of many articles, concatenated into 1 sequence, with an array of offsets marking where each article
+    starts and ends. Article `i` is `tokens[offsets[i]:offsets[i + 1]]`.
+
+    Steps that work token by token can then run over a whole batch at once, and articles are only split back apart
+    when their output is written. Tokens can be strings, or IDs into a `Vocabulary`.
+    """
+
+    __slots__ = ('tokens', 'offsets')
+
+    def __init__(self, tokens: Sequence, offsets: array):
+        """
+        :param tokens: The tokens of every article, 1 after another
+        :param offsets: Where each article starts in `tokens`, followed by where the last one ends
+        """
+
+        self.tokens = tokens
+        self.offsets = offsets
+
+    @classmethod
+    def from_articles(cls, articles: Iterable[Sequence]) -> 'TokenBatch':
+        """
+        :param articles: The tokens of each article
+        :return: A batch of the given articles, in order
+        """
+
+        articles = list(articles)
+        offsets = array('Q', accumulate(map(len, articles), initial=0))
+
+        return cls(list(chain.from_iterable(articles)), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> Sequence:
+        """
+        :param index: Which article of the batch to get, counting from 0
+        :return: The article's tokens
+        """
+
+        return self.tokens[self.offsets[index]: self.offsets[index + 1]]
+
+    def articles(self) -> List[Sequence]:
+        """
+        :return: The tokens of each article, split back apart
+        """
+
+        tokens, offsets = self.tokens, self.offsets
+        return [tokens[start: end] for start, end in zip(offsets, offsets[1:])]
+
+    def with_tokens(self, tokens: Sequence) -> 'TokenBatch':
+        """
+        :param tokens: A replacement for every token of the batch, in order. i.e. each one stemmed
+        :return: A batch of the same articles, holding the given tokens instead
+        """
+
+        return TokenBatch(tokens, self.offsets)
+
+
+def lowercase_batch(batch: TokenBatch) -> TokenBatch:
+    """
+    :param batch: The tokens of several articles
+    :return: The same batch, with every token lowercased
+    """
+
+    # A single pass in C over every token of the batch, rather than a Python loop per article
+    return batch.with_tokens(list(map(str.lower, batch.tokens)))
+
+
+def filter_stopwords_batch(batch: TokenBatch, index: StopwordIndex) -> TokenBatch:
+    """
+    Remove every stopword from a batch, keeping each article's remaining tokens in their original order
+
+    :param batch: The tokens of several articles
+    :param index: The stopwords to remove
+    :return: A batch of the same articles, without their stopwords
+    """
+
+    stopwords = index.stopwords
+    mask = [token not in stopwords for token in batch.tokens]
+
+    # How many tokens are kept before each position, which is where each article now starts
+    kept_before = list(accumulate(mask, initial=0))
+
+    return TokenBatch(list(compress(batch.tokens, mask)), array('Q', map(kept_before.__getitem__, batch.offsets)))
+
+
+def filter_ids_batch(batch: TokenBatch, keep: bytearray) -> TokenBatch:
+    """
+    Remove every stopword from a batch of token IDs, keeping each article's remaining IDs in their original order
+
+    :param batch: The IDs of the tokens of several articles, in an array('I')
+    :param keep: 1 byte per ID, which is 1 if the token with that ID is kept and 0 if not
+    :return: A batch of the same articles, without their stopwords
+    """
+
+    # Without NumPy, the same mask is applied 1 ID at a time
+    if not NUMPY_AVAILABLE:
+        mask = list(map(keep.__getitem__, batch.tokens))
+        kept_before = list(accumulate(mask, initial=0))
+
+        return TokenBatch(array('I', compress(batch.tokens, mask)),
+                          array('Q', map(kept_before.__getitem__, batch.offsets)))
+
+    import numpy
+
+    ids = numpy.frombuffer(batch.tokens, dtype=numpy.uint32)
+    mask = numpy.frombuffer(keep, dtype=bool)[ids]
+
+    # How many IDs are kept before each position, which is where each article now starts
+    kept_before = numpy.concatenate((numpy.zeros(1, dtype=numpy.uint64), numpy.cumsum(mask, dtype=numpy.uint64)))
+    offsets = kept_before[numpy.frombuffer(batch.offsets, dtype=numpy.uint64)]
+
+    return TokenBatch(array('I', ids[mask].tobytes()), array('Q', offsets.tobytes()))
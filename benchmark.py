@@ -0,0 +1,462 @@
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Annotated, Callable, Dict, List, Optional
+
+import rich
+import typer
+from rich.table import Table
+
+from nltk import PorterStemmer, word_tokenize
+
+from cli import run_app
+from file_writing import write_to_file
+from Pipeline import CHUNK_SIZE, DETAILED_ARTICLES, chunked, process_article, process_articles
+from stages import clean_text, STAGE_FILES
+from stem_cache import StemCache, STEMMERS
+from stopword_index import load_stopwords, DEFAULT_STOPWORDS_FILE
+from treebank import regex_tokenize, diff_report
+from utilities import stream_texts, get_texts
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Define benchmark app
+bench = typer.Typer(add_completion=False, rich_markup_mode='rich')
+
+# Define certain app arguments and options. Makes later code cleaner
+ARTICLES_OPTION = typer.Option('--articles', '-a', min=1, help="How many synthetic articles to generate.")
+CORPUS_OPTION = typer.Option('--corpus', help="Benchmark a real corpus directory instead of a synthetic one.")
+REPEAT_OPTION = typer.Option('--repeat', '-r', min=1, help="How many times to time each stage. The fastest is kept.")
+SAVE_OPTION = typer.Option('--save', help="Save the results as a JSON baseline.")
+COMPARE_OPTION = typer.Option('--compare', help="Compare the results to a JSON baseline, and fail on regressions.")
+TOLERANCE_OPTION = typer.Option('--tolerance', min=0.0, max=1.0,
+                                help="How much slower than the baseline a stage may be before it counts as a "
+                                     "regression, as a fraction.")
+
+# The modules each stage CLI, or a library user, imports. Timed for how long they take to import from cold
+COLD_START_MODULES = ['stages', 'lowercase', 'handle_stopwords', 'stem', 'tokenization', 'Pipeline']
+
+# The dependencies that make up most of an import's time, when pulled in
+SLOW_IMPORTS = ['typer', 'rich', 'nltk', 'bs4']
+
+# Words for the synthetic corpus, most common first. Drawn with a Zipfian distribution, like real text
+VOCABULARY = ("the of to and a in said for it's on is mln dlrs vs pct from company its by at will year with be "
+              "U.S. was share billion would shares has an net inc that quarter stock which bank oil market trade "
+              "prices government last new corp sales rate March/April exchange once-in-a-lifetime week price "
+              "officials federal foreign profit dollar growth rose fell earnings report increase spokesman "
+              "agreement Japan Bahia cocoa drought temporao Comissaria arrivals cumulative export coffee "
+              "sugar wheat grain tonnes analysts February Reuters budget deficit interest debt").split()
+
+ARTICLE_TEMPLATE = """<REUTERS TOPICS="YES" LEWISSPLIT="TRAIN" CGISPLIT="TRAINING-SET" OLDID="{old_id}" NEWID="{new_id}">
+<DATE>26-FEB-1987 15:01:01.79</DATE>
+<TOPICS><D>cocoa</D></TOPICS>
+<UNKNOWN>
+&#5;&#5;&#5;C T
+&#22;&#22;&#1;f0704&#31;reute
+u f BC-SYNTHETIC-{new_id}   02-26 0105</UNKNOWN>
+<TEXT>&#2;
+<TITLE>{title}</TITLE>
+<DATELINE>    SALVADOR, Feb 26 - </DATELINE><BODY>{body}
+ Reuter
+&#3;</BODY></TEXT>
+</REUTERS>
+"""
+
+
+def generate_corpus(directory: Path, article_count: int = 2000, articles_per_file: int = 1000,
+                    seed: int = 21578) -> List[Path]:
+    """
+    Write a synthetic corpus of Reuters-style `.sgm` files, so benchmarks don't need the real corpus
+
+    :param directory: Where to write the `.sgm` files
+    :param article_count: How many articles to generate
+    :param articles_per_file: How many articles to put in each file. The real corpus has 1000
+    :param seed: The random seed, so the same corpus is generated every time
+    :return: The generated files
+    """
+
+    generator = random.Random(seed)
+    weights = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+    directory.mkdir(parents=True, exist_ok=True)
+    files = []
+
+    for file_num, first in enumerate(range(0, article_count, articles_per_file)):
+        file = directory / f"reut2-{file_num:03}.sgm"
+
+        with open(file, "w") as f:
+            f.write('<!DOCTYPE lewis SYSTEM "lewis.dtd">\n')
+
+            for new_id in range(first + 1, min(first + articles_per_file, article_count) + 1):
+                sentences = []
+
+                for _ in range(generator.randint(3, 12)):
+                    words = generator.choices(VOCABULARY, weights, k=generator.randint(8, 25))
+                    number = f"{generator.randint(1, 9999):,}.{generator.randint(0, 99)}"
+                    words.insert(generator.randrange(len(words)), number)
+                    words[0] = words[0].capitalize()
+                    sentences.append(' '.join(words) + generator.choice(('.', '.', '...', ' -- &lt;ABC>.', '?')))
+
+                title = ' '.join(generator.choices(VOCABULARY, weights, k=5)).upper()
+                f.write(ARTICLE_TEMPLATE.format(old_id=new_id + 5000, new_id=new_id, title=title,
+                                                body='\n'.join(sentences)))
+
+        files.append(file)
+
+    return files
+
+
+def peak_memory_mb() -> Optional[float]:
+    """
+    :return: The most memory this process has used so far, in MB. None where this can't be measured
+    """
+
+    if resource is None:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(function: Callable[[], object], repeat: int) -> float:
+    """
+    Time the given function
+
+    :param function: What to time
+    :param repeat: How many times to time it
+    :return: The fastest time taken, in seconds
+    """
+
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def run_benchmarks(corpus: Path, repeat: int = 3) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Time each stage of the pipeline, and the whole pipeline, over the given corpus
+
+    :param corpus: A directory of `.sgm` files
+    :param repeat: How many times to time each stage. The fastest is kept
+    :return: For each stage, its time in seconds, articles/sec, tokens/sec, MB/sec and the peak memory use so far
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        articles = list(stream_texts(str(corpus), 'all'))
+
+    texts = [clean_text(article) for article in articles]
+    tokens = [word_tokenize(text) for text in texts]
+    lower_cased = [[token.lower() for token in article] for article in tokens]
+    stemmer = StemCache(PorterStemmer())
+    stemmed = [stemmer.stem_tokens(article) for article in lower_cased]
+
+    article_count = len(articles)
+    token_count = sum(len(article) for article in tokens)
+    megabytes = sum(len(article.encode('utf-8')) for article in articles) / 1e6
+
+    def read_streaming():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in stream_texts(str(corpus), 'all'):
+                pass
+
+    def read_beautifulsoup():
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_texts(str(corpus), 'all')
+
+    def read_lxml():
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_texts(str(corpus), 'all', backend='lxml')
+
+    def stem_cold():
+        cache = StemCache(PorterStemmer())
+        for article in lower_cased:
+            cache.stem_tokens(article)
+
+    def remove_stopwords():
+        index = load_stopwords(DEFAULT_STOPWORDS_FILE)
+        for article in stemmed:
+            index.filter(article)
+
+    def write_files():
+        for i, article in enumerate(stemmed, start=1):
+            write_to_file(Path(f"article{i}/5. No-stopword-output.txt"), article)
+
+    # As the pipeline runs in 1 process: the first few articles 1 at a time, then the rest in batches
+    def end_to_end():
+        with contextlib.redirect_stdout(io.StringIO()):
+            numbered = enumerate(stream_texts(str(corpus), 'all'), start=1)
+
+            for i, article in islice(numbered, DETAILED_ARTICLES):
+                process_article(article, i)
+
+            for first_article_num, batch in chunked(numbered, CHUNK_SIZE):
+                process_articles(first_article_num, batch, frozenset(STAGE_FILES), 'dirs')
+
+    def end_to_end_per_article():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i, article in enumerate(stream_texts(str(corpus), 'all'), start=1):
+                process_article(article, i)
+
+    stages: Dict[str, Callable[[], object]] = {
+        'get_texts (streaming)': read_streaming,
+        'get_texts (BeautifulSoup)': read_beautifulsoup,
+        'get_texts (lxml)': read_lxml,
+        'textualize': lambda: [clean_text(article) for article in articles],
+        'tokenize': lambda: [word_tokenize(text) for text in texts],
+        'tokenize (regex)': lambda: [regex_tokenize(text) for text in texts],
+        'lowercase': lambda: [[token.lower() for token in article] for article in tokens],
+        'stem': stem_cold,
+        'remove_stopwords': remove_stopwords,
+        'write_to_file': write_files,
+        'end_to_end': end_to_end,
+        'end_to_end (per article)': end_to_end_per_article,
+    }
+
+    # lxml is optional, so only benchmark it where it is installed
+    if importlib.util.find_spec('lxml') is None:
+        del stages['get_texts (lxml)']
+
+    results: Dict[str, Dict[str, Optional[float]]] = {}
+
+    # Write files into a scratch directory, so benchmarks never touch real output
+    original_directory = os.getcwd()
+    stopwords_file = DEFAULT_STOPWORDS_FILE.resolve()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        Path(DEFAULT_STOPWORDS_FILE).write_bytes(stopwords_file.read_bytes())
+
+        try:
+            for name, function in stages.items():
+                seconds = measure(function, repeat)
+                results[name] = {
+                    'seconds': seconds,
+                    'articles_per_sec': article_count / seconds,
+                    'tokens_per_sec': token_count / seconds,
+                    'mb_per_sec': megabytes / seconds,
+                    'peak_rss_mb': peak_memory_mb(),
+                }
+        finally:
+            os.chdir(original_directory)
+
+    return results
+
+
+def compare_stemmers(articles: List[List[str]], repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    """
+    Time each stemmer over the same tokens, and measure how far each one shrinks the vocabulary
+
+    :param articles: The lowercased tokens of each article, as the stem step receives them
+    :param repeat: How many times to time each stemmer. The fastest is kept
+    :return: For each stemmer that can run here, its time in seconds with a fresh cache, tokens/sec, distinct tokens
+        stemmed/sec without a cache, how many distinct tokens and stems there are, and the fraction of the vocabulary
+        stemming removed
+    """
+
+    token_count = sum(len(article) for article in articles)
+    distinct = list({token for article in articles for token in article})
+    results = {}
+
+    for name, stemmer in STEMMERS.items():
+        # Each is created up front, so creating it isn't timed. The lemmatizer only loads WordNet when first used
+        engine = stemmer.factory()
+
+        try:
+            engine.stem('tokens')
+        except LookupError:
+            # WordNet's data isn't installed
+            continue
+
+        def stem_cached():
+            cache = StemCache(engine)
+            for article in articles:
+                cache.stem_tokens(article)
+
+        seconds = measure(stem_cached, repeat)
+        uncached = measure(lambda: [engine.stem(token) for token in distinct], repeat)
+        stems = len({engine.stem(token) for token in distinct})
+
+        results[name] = {
+            'seconds': seconds,
+            'tokens_per_sec': token_count / seconds,
+            'distinct_per_sec': len(distinct) / uncached,
+            'distinct_tokens': len(distinct),
+            'distinct_stems': stems,
+            'reduction': 1 - stems / len(distinct) if distinct else 0.0,
+        }
+
+    return results
+
+
+def cold_start(modules: List[str]) -> Dict[str, Dict[str, object]]:
+    """
+    Time how long each module takes to import in a fresh interpreter, as each stage CLI pays this on every run
+
+    :param modules: The modules to import
+    :return: For each module, the seconds its import took, and which of the slow dependencies it pulled in
+    """
+
+    results = {}
+
+    for module in modules:
+        # -X importtime reports each import on stderr. The last line is the module itself, including everything it
+        # imported. Its second column is that cumulative time, in microseconds
+        report = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, check=True).stderr.splitlines()
+
+        imported = {line.rsplit('|', 1)[-1].strip() for line in report}
+        results[module] = {
+            'seconds': int(report[-1].split('|')[1]) / 1_000_000,
+            'imports': [dependency for dependency in SLOW_IMPORTS if dependency in imported],
+        }
+
+    return results
+
+
+def compare(results: Dict[str, Dict[str, Optional[float]]], baseline: Dict[str, Dict[str, Optional[float]]],
+            tolerance: float) -> List[str]:
+    """
+    Find the stages that got slower than a baseline allows
+
+    :param results: The results of this run
+    :param baseline: The results of an earlier run
+    :param tolerance: How much slower a stage may be, as a fraction
+    :return: The names of the stages that regressed
+    """
+
+    return [name for name, result in results.items()
+            if name in baseline and result['articles_per_sec'] < baseline[name]['articles_per_sec'] * (1 - tolerance)]
+
+
+@bench.command(epilog="Thanks for using my benchmarks! :boom:",
+               help="""Time each step of the pipeline, and the whole pipeline.
+
+               [not dim]
+               By default, a synthetic Reuters-style corpus is generated, so the real corpus isn't needed. Reports
+               articles/sec, tokens/sec, MB/sec of article text, and the peak memory use of the process after each
+               step.
+
+               [bold yellow]get_texts[/] is timed with each extraction backend, lxml only if it is installed. Both
+               tokenizer engines are timed, and any tokens they disagree on are reported. How long each stage module takes
+               to import in a fresh interpreter is reported too, as every CLI run pays for it.
+
+               The whole pipeline is timed as it runs in 1 process, with all but the first few articles in batches,
+               and again 1 article at a time.
+
+               Every stemmer the pipeline can use is compared on the same tokens: how fast it is through the stem
+               cache, as the pipeline runs it, and without it, and how much it shrinks the vocabulary. The wordnet
+               lemmatizer is left out where NLTK's WordNet data isn't installed.
+
+               Results can be saved as a JSON baseline, and later runs compared against it. Any step slower than the
+               baseline by more than the tolerance counts as a regression, and makes the command fail.
+
+               [bold yellow]Example Usages[/]:
+               python benchmark.py
+               python benchmark.py --articles 5000 --save baseline.json
+               python benchmark.py --compare baseline.json --tolerance 0.1
+               python benchmark.py --corpus ../reuters21578
+               """)
+def benchmark(article_count: Annotated[int, ARTICLES_OPTION] = 2000,
+              corpus: Annotated[Optional[Path], CORPUS_OPTION] = None,
+              repeat: Annotated[int, REPEAT_OPTION] = 3,
+              save: Annotated[Optional[Path], SAVE_OPTION] = None,
+              baseline: Annotated[Optional[Path], COMPARE_OPTION] = None,
+              tolerance: Annotated[float, TOLERANCE_OPTION] = 0.2) -> None:
+    """
+    Time each step of the pipeline, and the whole pipeline
+
+    :param article_count: How many synthetic articles to generate
+    :param corpus: A real corpus directory to use instead of a synthetic one
+    :param repeat: How many times to time each stage
+    :param save: Where to save the results as JSON
+    :param baseline: A JSON baseline to compare the results to
+    :param tolerance: How much slower than the baseline a stage may be, as a fraction
+    """
+
+    with tempfile.TemporaryDirectory() as synthetic:
+        if corpus is None:
+            corpus = Path(synthetic)
+            generate_corpus(corpus, article_count)
+
+        results = run_benchmarks(corpus, repeat)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            texts = [clean_text(article) for article in stream_texts(str(corpus), 'all')]
+
+            # Show how far the faster tokenizer strays from the exact one, on the same cleaned text the pipeline
+            # tokenizes
+            report = diff_report(texts)
+
+        stemmers = compare_stemmers([[token.lower() for token in word_tokenize(text)] for text in texts], repeat)
+
+    table = Table(title="Benchmark results")
+    for column in ("Stage", "Seconds", "Articles/sec", "Tokens/sec", "MB/sec", "Peak RSS (MB)"):
+        table.add_column(column, justify="right" if column != "Stage" else "left")
+
+    for name, result in results.items():
+        peak = result['peak_rss_mb']
+        table.add_row(name, f"{result['seconds']:.3f}", f"{result['articles_per_sec']:,.0f}",
+                      f"{result['tokens_per_sec']:,.0f}", f"{result['mb_per_sec']:.2f}",
+                      f"{peak:.0f}" if peak is not None else "n/a")
+
+    rich.print(table)
+
+    rich.print(f"\n[bold blue]Tokenizer differences:[/] \"regex\" differs from \"nltk\" on "
+               f"[bold green]{report['texts_differing']}[/] of {report['texts']} articles, and "
+               f"[bold green]{report['tokens_differing']}[/] of {report['reference_tokens']} tokens")
+
+    for expected, actual in report['examples']:
+        rich.print(f"\t{expected} -> {actual}")
+
+    table = Table(title="Stemmers")
+    for column in ("Stemmer", "Seconds", "Tokens/sec", "Uncached tokens/sec", "Distinct tokens", "Distinct stems",
+                   "Vocabulary reduction"):
+        table.add_column(column, justify="right" if column != "Stemmer" else "left")
+
+    for name, result in stemmers.items():
+        table.add_row(name, f"{result['seconds']:.3f}", f"{result['tokens_per_sec']:,.0f}",
+                      f"{result['distinct_per_sec']:,.0f}", f"{result['distinct_tokens']:,}",
+                      f"{result['distinct_stems']:,}", f"{result['reduction']:.1%}")
+
+    rich.print(table)
+
+    table = Table(title="Cold start")
+    for column in ("Module", "Import seconds", "Imports"):
+        table.add_column(column, justify="right" if column == "Import seconds" else "left")
+
+    for module, result in cold_start(COLD_START_MODULES).items():
+        table.add_row(module, f"{result['seconds']:.3f}", ', '.join(result['imports']) or "-")
+
+    rich.print(table)
+
+    if save:
+        save.write_text(json.dumps(results, indent=2))
+        rich.print(f"\nSaved results to \"{save}\"")
+
+    if baseline:
+        regressions = compare(results, json.loads(baseline.read_text()), tolerance)
+
+        if regressions:
+            rich.print(f"\n[red bold]Slower than the baseline:[/] {', '.join(regressions)}")
+            raise typer.Exit(1)
+
+        rich.print("\n[bold green]No regressions[/] compared to the baseline")
+
+
+if __name__ == '__main__':
+    run_app(bench)
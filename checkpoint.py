@@ -0,0 +1,111 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, List
+
+# Where the checkpoint of an unfinished run is kept
+CHECKPOINT_FILE = Path("output/.checkpoint.json")
+
+# How many more articles must be committed before the checkpoint is saved again. Saving makes every process' output
+# reach the disk first, so doing it after every chunk would stall the background writers
+CHECKPOINT_INTERVAL = 1024
+
+
+class Checkpoint:
+    """
+    Remembers how far a run has got, so a run that was interrupted can be resumed instead of started over.
+
+    Every article up to `committed` has all its output written. Chunks of articles can finish out of order across
+    worker processes, so a chunk only counts once every chunk before it has finished too. Also remembers how many
+    articles each corpus file holds, so a resumed run can skip the files it already processed without reading them.
+    Disabled by default.
+    """
+
+    def __init__(self):
+        self.enabled = False
+
+        # The settings of the run. A run can only be resumed with the same settings, or its output would be mixed
+        self.settings: Dict[str, object] = {}
+        self.committed = 0
+        self.file_counts: Dict[str, List[int]] = {}
+
+        # Chunks that finished before an earlier chunk did, as how many articles each holds by its first article
+        self.finished: Dict[int, int] = {}
+
+        # How far the run had got the last time the checkpoint was saved
+        self.saved = 0
+
+    def load(self, checkpoint_file: Path = CHECKPOINT_FILE) -> bool:
+        """
+        Pick up from the checkpoint saved by an interrupted run, if there is one
+
+        :param checkpoint_file: Where the checkpoint was saved
+        :return: Whether there was a checkpoint to resume from
+        :raises ValueError: If the checkpoint was saved by a run with different settings
+        """
+
+        if not checkpoint_file.is_file():
+            return False
+
+        with open(checkpoint_file, "r", encoding="utf-8") as file:
+            saved = json.load(file)
+
+        if saved['settings'] != self.settings:
+            changed = [name for name in self.settings if saved['settings'].get(name) != self.settings[name]]
+            raise ValueError(f"the interrupted run used different settings for: {', '.join(changed)}")
+
+        self.committed = self.saved = saved['committed']
+        self.file_counts = saved['file_counts']
+        return True
+
+    def finish(self, first_article_num: int, count: int) -> None:
+        """
+        Mark a chunk of articles as having all its output written
+
+        :param first_article_num: The article number of the first article in the chunk
+        :param count: How many articles the chunk holds
+        """
+
+        self.finished[first_article_num] = count
+
+        while self.committed + 1 in self.finished:
+            self.committed += self.finished.pop(self.committed + 1)
+
+    def due(self) -> bool:
+        """
+        :return: Whether enough articles have been committed since the last save to save again
+        """
+
+        return self.committed - self.saved >= CHECKPOINT_INTERVAL
+
+    def save(self, checkpoint_file: Path = CHECKPOINT_FILE) -> None:
+        """
+        Save the checkpoint. It is written to a temporary file first, then moved over the old one, so an interruption
+        partway through saving still leaves the previous checkpoint intact
+
+        :param checkpoint_file: Where to save the checkpoint
+        """
+
+        checkpoint_file.parent.mkdir(parents=True, exist_ok=True)
+        temporary = checkpoint_file.with_suffix(".tmp")
+
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump({'settings': self.settings, 'committed': self.committed, 'file_counts': self.file_counts}, file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        os.replace(temporary, checkpoint_file)
+        self.saved = self.committed
+
+    def clear(self, checkpoint_file: Path = CHECKPOINT_FILE) -> None:
+        """
+        Remove the checkpoint, once the run it belongs to has finished
+
+        :param checkpoint_file: Where the checkpoint was saved
+        """
+
+        checkpoint_file.unlink(missing_ok=True)
+
+
+# The checkpoint of the run in this process
+CHECKPOINT = Checkpoint()
@@ -0,0 +1,64 @@
+import os
+import sys
+from typing import Callable, List
+
+import rich
+import typer
+
+from streaming import stream, STREAM_BATCH_SIZE
+
+# Define certain colors and styles, for every app's help
+HELP_STYLES = {
+    'OPTIONS_PANEL_TITLE': "[not dim]Options",
+    'ARGUMENTS_PANEL_TITLE': "[not dim]Arguments",
+    'STYLE_REQUIRED_LONG': 'not dim red',
+    'STYLE_OPTION_DEFAULT': 'not dim white',
+}
+
+# Define the options every stage app has for streaming. Makes later code cleaner
+JSONL_OPTION = typer.Option('--jsonl', help="When streaming, read and write 1 JSON record per line, instead of plain "
+                                            "text or space-separated tokens.")
+BATCH_SIZE_OPTION = typer.Option('--batch-size', min=1, help="When streaming, how many lines to process at a time.")
+
+
+def run_app(app: typer.Typer) -> None:
+    """
+    Run a Typer app from the command line. Typer's rich help formatting takes longer to import than the rest of Typer,
+    so it is only styled, and imported, when help is going to be shown
+
+    :param app: The app to run
+    """
+
+    if len(sys.argv) == 1 or '--help' in sys.argv[1:]:
+        from typer import rich_utils
+
+        for name, style in HELP_STYLES.items():
+            setattr(rich_utils, name, style)
+
+    app()
+
+
+def stream_stage(process: Callable[[list], List[List[str]]], key: str, jsonl: bool,
+                 batch_size: int = STREAM_BATCH_SIZE) -> None:
+    """
+    Run a stage app over stdin, writing its results to stdout. Errors are printed to stderr, so they never end up
+    mixed in with the results
+
+    :param process: The stage. Takes the text or tokens of a batch of records, and returns the tokens of each
+    :param key: What the stage reads. "text" for a string, or "tokens" for a list of strings
+    :param jsonl: Whether each line is JSON
+    :param batch_size: How many lines to process at a time
+    """
+
+    try:
+        stream(process, key, jsonl, batch_size)
+
+    except ValueError as error:
+        rich.print(f"\n[red bold]Bad input:[/] {error}", file=sys.stderr)
+        raise typer.Exit(1)
+
+    # The next command in the pipeline stopped reading, like `head` does. Point stdout at nothing, so Python doesn't
+    # complain again when it flushes stdout on exit
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        raise typer.Exit(1)
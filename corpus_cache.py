@@ -0,0 +1,302 @@
+import json
+import mmap
+import os
+import re
+from array import array
+from pathlib import Path
+from typing import Annotated, Dict, Iterator, List, Optional, Union
+
+import rich
+import typer
+
+from cli import run_app
+from utilities import corpus_files, reuters_blocks, _join_children, TEXT_PATTERN
+
+# Define corpus cache app
+compiler = typer.Typer(add_completion=False, rich_markup_mode='rich')
+
+# Define certain app arguments and options. Makes later code cleaner
+DIRECTORY_OPTION = typer.Option('--directory', '-d', help="Where the Reuters corpus is.")
+CACHE_FILE_OPTION = typer.Option('--cache-file', help="Where to write the corpus cache.")
+FORCE_OPTION = typer.Option('--force', help="Rebuild the cache even if it is up to date.")
+
+# Where the corpus cache is kept by default
+CORPUS_CACHE_FILE = Path("output/.corpus-cache.bin")
+
+# Identifies a corpus cache file, and the version of its layout
+MAGIC = b'REUTCC01'
+
+# The attributes of each <REUTERS> start tag, i.e. NEWID="1"
+ATTRIBUTE_PATTERN = re.compile(r'([A-Za-z]+)="([^"]*)"')
+
+
+def source_fingerprint(files: List[Path]) -> List[List[Union[str, int]]]:
+    """
+    :param files: The `.sgm` files of the corpus
+    :return: The path, size and modification time of each file, so a stale cache can be spotted without reading them
+    """
+
+    return [[f"{file.resolve()}", file.stat().st_size, file.stat().st_mtime_ns] for file in files]
+
+
+def _aligned(position: int) -> int:
+    # Arrays are memory-mapped in place, so each one must start on an 8 byte boundary
+    return (position + 7) // 8 * 8
+
+
+def layout(header: Dict[str, object], sections: Dict[str, bytes], magic: bytes = MAGIC, tail: str = 'texts') -> bytes:
+    """
+    Work out where each section of a file starts, after its magic number, header length and JSON header, and record
+    those positions in the header
+
+    :param header: The header. Each section's position is added to it, as is the position of the tail
+    :param sections: The bytes of each section, in the order they are written
+    :param magic: The magic number the file starts with
+    :param tail: What to call the position of whatever is written after the last section
+    :return: The encoded header
+    """
+
+    header_bytes = b''
+
+    while True:
+        position = _aligned(len(magic) + 8 + len(header_bytes))
+        for name, data in sections.items():
+            header[name] = position
+            position = _aligned(position + len(data))
+        header[tail] = position
+
+        # Positions depend on the header's own length, so repeat until encoding it gives the header it describes
+        encoded_header = json.dumps(header).encode('utf-8')
+        if encoded_header == header_bytes:
+            return header_bytes
+        header_bytes = encoded_header
+
+
+def compile_corpus(directory: str = "../reuters21578", cache_file: Path = CORPUS_CACHE_FILE) -> int:
+    """
+    Extract the text and metadata of every article in the corpus into a single cache file, so later runs never parse
+    SGML again.
+
+    The file holds a small JSON header, an array of offsets into the text blob, an array of NEWIDs, every article's
+    metadata as JSON, and finally every article's text as 1 blob of UTF-8. Everything after the header is read by
+    memory-mapping the file, so none of it is copied or parsed until it is used.
+
+    :param directory: Where the reuters corpus is
+    :param cache_file: Where to write the cache
+    :return: How many articles were cached
+    """
+
+    files = corpus_files(directory)
+
+    offsets = array('Q', [0])
+    new_ids = array('I')
+    metadata: List[Dict[str, str]] = []
+    texts: List[bytes] = []
+
+    for block in reuters_blocks(files):
+        attributes = dict(ATTRIBUTE_PATTERN.findall(block[:block.index('>')]))
+
+        for inner in TEXT_PATTERN.findall(block):
+            encoded = _join_children(inner).encode('utf-8')
+            texts.append(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            new_ids.append(int(attributes.get('NEWID', 0)))
+            metadata.append(attributes)
+
+    encoded_metadata = json.dumps(metadata).encode('utf-8')
+
+    # Lay out every section after the header, then write the header describing where each one starts
+    header: Dict[str, object] = {'sources': source_fingerprint(files), 'count': len(texts)}
+    sections = {'offsets': offsets.tobytes(), 'new_ids': new_ids.tobytes(), 'metadata': encoded_metadata}
+    header['metadata_length'] = len(encoded_metadata)
+    header_bytes = layout(header, sections)
+
+    # Write to a temporary file first, so a process reading the old cache never sees a half written one
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    temporary = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+
+        for name, data in sections.items():
+            f.write(b'\0' * (header[name] - f.tell()))
+            f.write(data)
+
+        f.write(b'\0' * (header['texts'] - f.tell()))
+        for text in texts:
+            f.write(text)
+
+    os.replace(temporary, cache_file)
+
+    return len(texts)
+
+
+class CorpusCache:
+    """
+    Reads articles out of a corpus cache written by `compile_corpus()`.
+
+    The file is memory-mapped, and the offsets and NEWIDs are viewed in place, so opening a cache costs the same no
+    matter how big the corpus is. Each article is only decoded when it is asked for.
+    """
+
+    def __init__(self, cache_file: Path = CORPUS_CACHE_FILE):
+        """
+        :param cache_file: Where the cache was written
+        """
+
+        self.file = open(cache_file, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"\"{cache_file}\" is not a corpus cache")
+
+        header_length = int.from_bytes(self.map[len(MAGIC): len(MAGIC) + 8], 'little')
+        self.header = json.loads(self.map[len(MAGIC) + 8: len(MAGIC) + 8 + header_length])
+
+        count = self.header['count']
+        self.view = memoryview(self.map)
+        self.offsets = self.view[self.header['offsets']: self.header['offsets'] + 8 * (count + 1)].cast('Q')
+        self.new_ids = self.view[self.header['new_ids']: self.header['new_ids'] + 4 * count].cast('I')
+        self.texts = self.header['texts']
+        self._metadata: Optional[List[Dict[str, str]]] = None
+
+    def is_current(self, directory: str = "../reuters21578") -> bool:
+        """
+        :param directory: Where the reuters corpus is
+        :return: Whether the cache still matches the corpus' `.sgm` files
+        """
+
+        return self.header['sources'] == source_fingerprint(corpus_files(directory))
+
+    def __len__(self) -> int:
+        return self.header['count']
+
+    def __getitem__(self, index: int) -> str:
+        """
+        :param index: Which article to read, counting from 0
+        :return: The article's text, as `stream_texts()` produces it
+        """
+
+        # Decoded straight from the map, without copying the bytes out first
+        return str(self.view[self.texts + self.offsets[index]: self.texts + self.offsets[index + 1]], 'utf-8')
+
+    def metadata(self, index: int) -> Dict[str, str]:
+        """
+        :param index: Which article to describe, counting from 0
+        :return: The attributes of the article's <REUTERS> tag, like NEWID, OLDID and LEWISSPLIT
+        """
+
+        # Only parsed if it is ever asked for, since most runs never need it
+        if self._metadata is None:
+            start = self.header['metadata']
+            self._metadata = json.loads(self.map[start: start + self.header['metadata_length']])
+
+        return self._metadata[index]
+
+    def close(self) -> None:
+        # Views of the map must be released before it can be closed
+        for view in ('offsets', 'new_ids', 'view'):
+            if hasattr(self, view):
+                getattr(self, view).release()
+
+        self.map.close()
+        self.file.close()
+
+
+def open_corpus_cache(directory: str = "../reuters21578", cache_file: Path = CORPUS_CACHE_FILE) -> CorpusCache:
+    """
+    Open the corpus cache, building it first if it is missing or the corpus has changed since it was built
+
+    :param directory: Where the reuters corpus is
+    :param cache_file: Where the cache is kept
+    :return: The open cache
+    """
+
+    if cache_file.is_file():
+        try:
+            cache = CorpusCache(cache_file)
+        except ValueError:
+            cache = None
+
+        if cache is not None:
+            if cache.is_current(directory):
+                return cache
+            cache.close()
+
+    rich.print("\nBuilding corpus cache...")
+    rich.print(f"Cached [bold green]{compile_corpus(directory, cache_file)}[/] articles in \"{cache_file}\"")
+
+    return CorpusCache(cache_file)
+
+
+def cached_texts(directory: str = "../reuters21578", article_count: Union[str, int] = 'all',
+                 cache_file: Path = CORPUS_CACHE_FILE, skip: int = 0) -> Iterator[str]:
+    """
+    Lazily read articles from the corpus cache, one at a time. A drop-in replacement for `stream_texts()`, which never
+    parses SGML once the cache has been built
+
+    :param directory: Optionally specify where the reuters corpus is
+    :param article_count: How many articles to retrieve. "all" or a number >= 1
+    :param cache_file: Where the cache is kept
+    :param skip: How many articles at the start of the corpus to leave out. They still count towards `article_count`
+    :return: A generator of articles, already joined into text, as `textualize()` accepts them
+    """
+
+    cache = open_corpus_cache(directory, cache_file)
+
+    rich.print(f"\nUsing corpus cache \"{cache_file}\"")
+    print()
+
+    LIMIT = int(article_count) if str(article_count).isnumeric() else None
+    found = min(len(cache), LIMIT) if LIMIT is not None else len(cache)
+
+    try:
+        for index in range(skip, found):
+            yield cache[index]
+    finally:
+        cache.close()
+
+    # Print a message if the user requested more articles than exist
+    if LIMIT is not None and LIMIT > found:
+        rich.print(f"You asked for [green bold]{article_count}[/] articles,"
+                   f" but only [green bold]{found}[/] found\n")
+    else:
+        rich.print(f"Number of articles found: [bold green]{found}[/]\n")
+
+
+@compiler.command(epilog="Thanks for using my data pipeline! :boom:",
+                  help="""Compile the Reuters corpus into a cache, so later runs skip SGML parsing entirely.
+
+                  [not dim]
+                  Every article's text and metadata is extracted once into a single file, which
+                  [bold yellow]Pipeline.py --corpus-cache[/] then memory-maps. The cache is rebuilt automatically
+                  whenever the corpus' [bold yellow].sgm[/] files change, so running this first is optional.
+
+                  [bold yellow]Example Usages[/]:
+                  python corpus_cache.py
+                  python corpus_cache.py --directory ../reuters21578 --force
+                  """)
+def compile_command(directory: Annotated[str, DIRECTORY_OPTION] = "../reuters21578",
+                    cache_file: Annotated[Path, CACHE_FILE_OPTION] = CORPUS_CACHE_FILE,
+                    force: Annotated[bool, FORCE_OPTION] = False) -> None:
+    """
+    Compile the Reuters corpus into a cache
+
+    :param directory: Where the reuters corpus is
+    :param cache_file: Where to write the cache
+    :param force: Whether to rebuild the cache even if it is up to date
+    """
+
+    if force and cache_file.is_file():
+        cache_file.unlink()
+
+    cache = open_corpus_cache(directory, cache_file)
+    rich.print(f"\n[bold green]{len(cache)}[/] articles cached in \"{cache_file}\"")
+    cache.close()
+
+
+if __name__ == '__main__':
+    run_app(compiler)
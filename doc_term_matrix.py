@@ -0,0 +1,260 @@
+import math
+import zipfile
+from array import array
+from pathlib import Path
+from typing import Annotated, Dict, Iterable, Iterator, Optional, Tuple
+
+import rich
+import typer
+
+from cli import run_app
+from inverted_index import INDEX_FILE, InvertedIndex
+
+# Define matrix app
+exporter = typer.Typer(add_completion=False, rich_markup_mode='rich')
+
+# Where the matrix is written
+MATRIX_FILE = Path("output/matrix.npz")
+
+# How each article's term counts can be weighted. "count" is the raw counts, "tf" divides them by the article's length,
+# and "tfidf" matches scikit-learn's `TfidfVectorizer()` defaults: counts times smoothed IDF, with each row scaled to
+# unit length
+WEIGHTINGS = ('count', 'tf', 'tfidf')
+
+# How many bytes of the matrix are gathered in memory before they are compressed and written out
+MATRIX_BUFFER_SIZE = 1 << 20
+
+
+def weighting_callback(weighting: Optional[str]) -> Optional[str]:
+    """
+    A callback function for Typer apps, to validate how the user wants the matrix weighted.
+
+    :param weighting: The value the user entered for the weighting
+    :return: The value, if it was valid
+    """
+
+    if weighting is not None and weighting not in WEIGHTINGS:
+        rich.print(f"\n[red bold]Only the weightings[/] {', '.join(WEIGHTINGS)} [red bold]are permitted[/]\n")
+        raise typer.Exit(1)
+
+    return weighting
+
+
+# Define certain app arguments and options. Makes later code cleaner
+INDEX_FILE_OPTION = typer.Option('--index-file', help="Where the index built by the pipeline is.")
+OUTPUT_OPTION = typer.Option('--output', '-o', help="Where to write the matrix.")
+WEIGHTING_OPTION = typer.Option('--weighting', '-w', callback=weighting_callback,
+                                help=f"How to weight each term count. One of {', '.join(WEIGHTINGS)}.")
+MEMORY_BUDGET_OPTION = typer.Option('--memory-budget', min=1,
+                                    help="How many MiB of the matrix to hold in memory at a time while writing it.")
+
+
+def _npy_header(descr: str, shape: Tuple[int, ...]) -> bytes:
+    """
+    :param descr: The NumPy type of the array, like "<f4"
+    :param shape: The shape of the array
+    :return: The header of a version 1.0 `.npy` file holding such an array
+    """
+
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': shape}).encode('latin1')
+
+    # The data after the header must start on a 64 byte boundary
+    padding = -(len(header) + 11) % 64
+    header += b' ' * padding + b'\n'
+
+    return b'\x93NUMPY\x01\x00' + len(header).to_bytes(2, 'little') + header
+
+
+def _write_array(archive: zipfile.ZipFile, name: str, descr: str, shape: Tuple[int, ...], chunks: Iterable[bytes],
+                 buffer_size: int) -> None:
+    """
+    Stream an array into a `.npz` archive as a `.npy` member, holding at most about `buffer_size` bytes at a time
+
+    :param archive: The archive
+    :param name: The array's name, which `numpy.load()` will give it
+    :param descr: The NumPy type of the array, like "<f4"
+    :param shape: The shape of the array
+    :param chunks: The array's bytes, in order
+    :param buffer_size: How many bytes to gather before writing them
+    """
+
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as member:
+        member.write(_npy_header(descr, shape))
+        buffer = bytearray()
+
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= buffer_size:
+                member.write(buffer)
+                buffer.clear()
+
+        member.write(buffer)
+
+
+def _slices(index: InvertedIndex, size: int) -> Iterator[Tuple[int, memoryview, memoryview]]:
+    """
+    :param index: The index
+    :param size: The most postings to hand out at a time
+    :return: Each term's position, with a slice of its articles and term frequencies, in term order
+    """
+
+    offsets = index.postings_offsets
+
+    for position in range(len(index)):
+        for start in range(offsets[position], offsets[position + 1], size):
+            end = min(start + size, offsets[position + 1])
+            yield position, index.articles[start:end], index.frequencies[start:end]
+
+
+def _weights(index: InvertedIndex, rows: Dict[int, int], weighting: str, size: int) -> Iterator[bytes]:
+    """
+    :param index: The index
+    :param rows: Each article's row in the matrix
+    :param weighting: One of `WEIGHTINGS`, other than "count"
+    :param size: The most postings to weight at a time
+    :return: The weight of every posting, as 32 bit floats, in term order
+    """
+
+    documents = len(rows)
+    offsets = index.postings_offsets
+
+    if weighting == 'tf':
+        lengths = index.lengths
+        for _, articles, frequencies in _slices(index, size):
+            yield array('f', (frequency / lengths[rows[article]]
+                              for article, frequency in zip(articles, frequencies))).tobytes()
+        return
+
+    # Smoothed, as if every term appeared in 1 more article, so no term's IDF is ever 0 or undefined
+    idfs = array('d', (math.log((1 + documents) / (1 + offsets[position + 1] - offsets[position])) + 1
+                       for position in range(len(index))))
+
+    # The length of each row has to be known before any of its weights, so it takes 1 pass to work them out first
+    norms = array('d', bytes(8 * documents))
+    for position, articles, frequencies in _slices(index, size):
+        idf = idfs[position]
+        for article, frequency in zip(articles, frequencies):
+            norms[rows[article]] += (frequency * idf) ** 2
+
+    norms = array('d', map(math.sqrt, norms))
+
+    for position, articles, frequencies in _slices(index, size):
+        idf = idfs[position]
+        yield array('f', (frequency * idf / norms[rows[article]]
+                          for article, frequency in zip(articles, frequencies))).tobytes()
+
+
+def export_matrix(index_file: Path = INDEX_FILE, matrix_file: Path = MATRIX_FILE, weighting: str = 'count',
+                  buffer_size: int = MATRIX_BUFFER_SIZE) -> Tuple[int, int, int]:
+    """
+    Write the document-term matrix of an index as a `.npz` file.
+
+    The matrix has a row for every indexed article, in article order, and a column for every term, in term order. It is
+    written in the layout of `scipy.sparse.save_npz()` for a CSC matrix, which is how the index already stores it, so
+    `scipy.sparse.load_npz()` reads it back, and `.tocsr()` turns it row major. The file also holds the "vocabulary",
+    the term of each column, and the "articles", the article number of each row. `numpy.load()` reads every array
+    without SciPy. Neither is needed to write it: every array is read straight from the memory-mapped index, and
+    compressed into the file a buffer at a time, so the whole matrix is never held in memory
+
+    :param index_file: Where the index is
+    :param matrix_file: Where to write the matrix
+    :param weighting: One of `WEIGHTINGS`
+    :param buffer_size: How many bytes of the matrix to gather in memory before writing them
+    :return: How many rows, columns and non-zero values the matrix has
+    """
+
+    index = InvertedIndex(index_file)
+
+    try:
+        documents, terms, postings = (index.header['document_count'], len(index), index.header['posting_count'])
+        rows = {article: row for row, article in enumerate(index.documents)}
+        size = max(buffer_size // 8, 1)
+
+        if weighting == 'count':
+            descr, data = '<u4', (bytes(frequencies) for _, _, frequencies in _slices(index, size))
+        else:
+            descr, data = '<f4', _weights(index, rows, weighting, size)
+
+        # NumPy strings are fixed width, as UTF-32, so every term takes as much room as the longest
+        width = max((len(index.term(position)) for position in range(terms)), default=1) or 1
+
+        # Write to a temporary file first, so a process reading the old matrix never sees a half written one
+        matrix_file.parent.mkdir(parents=True, exist_ok=True)
+        temporary = matrix_file.with_name(f"{matrix_file.name}.tmp")
+
+        # The fastest compression level. Higher ones take twice as long, for little gain on arrays of numbers
+        with zipfile.ZipFile(temporary, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+            _write_array(archive, 'format', '|S3', (), [b'csc'], buffer_size)
+            _write_array(archive, 'shape', '<i8', (2,), [array('q', (documents, terms)).tobytes()], buffer_size)
+            _write_array(archive, 'indptr', '<i8', (terms + 1,),
+                         (bytes(index.postings_offsets[start: start + size])
+                          for start in range(0, terms + 1, size)), buffer_size)
+            _write_array(archive, 'indices', '<i4', (postings,),
+                         (array('i', map(rows.__getitem__, articles)).tobytes()
+                          for _, articles, _ in _slices(index, size)), buffer_size)
+            _write_array(archive, 'data', descr, (postings,), data, buffer_size)
+            _write_array(archive, 'vocabulary', f'<U{width}', (terms,),
+                         (index.term(position).encode('utf-32-le').ljust(4 * width, b'\0')
+                          for position in range(terms)), buffer_size)
+            _write_array(archive, 'articles', '<u4', (documents,), [bytes(index.documents)], buffer_size)
+
+        temporary.replace(matrix_file)
+
+    finally:
+        index.close()
+
+    return documents, terms, postings
+
+
+@exporter.command(epilog="Thanks for using my data pipeline! :boom:",
+                  options_metavar='[--help] [--index-file <index.idx>] [--output <matrix.npz>] [--weighting <WEIGHTING>] '
+                                  '[--memory-budget <MiB>]',
+                  help="""Export the document-term matrix of an index built by the pipeline, for vectorizers and models.
+
+                  [not dim]
+                  Build the index first with [bold yellow]python Pipeline.py --index[/], or build both at once with
+                  [bold yellow]python Pipeline.py --matrix <WEIGHTING>[/].
+
+                  The matrix is written as a [bold yellow].npz[/] file, with a row per article and a column per term.
+                  Read it with [bold yellow]scipy.sparse.load_npz()[/], or read its arrays, including the
+                  [bold yellow]vocabulary[/] and the [bold yellow]articles[/] of each row, with
+                  [bold yellow]numpy.load()[/]. Neither is needed to write it.
+
+                  [bold yellow]Weightings[/]:
+                  count: how often each term appears in each article
+                  tf: the counts, divided by how many tokens the article has
+                  tfidf: the counts times each term's smoothed IDF, with each row scaled to unit length, as scikit-learn's
+                  TfidfVectorizer does by default
+
+                  [bold yellow]Example Usages[/]:
+                  python doc_term_matrix.py
+                  python doc_term_matrix.py --weighting tfidf --output tfidf.npz
+                  """)
+def export(index_file: Annotated[Path, INDEX_FILE_OPTION] = INDEX_FILE,
+           matrix_file: Annotated[Path, OUTPUT_OPTION] = MATRIX_FILE,
+           weighting: Annotated[str, WEIGHTING_OPTION] = 'count',
+           memory_budget: Annotated[int, MEMORY_BUDGET_OPTION] = MATRIX_BUFFER_SIZE >> 20) -> Tuple[int, int, int]:
+    """
+    Export the document-term matrix of an index
+
+    :param index_file: Where the index is
+    :param matrix_file: Where to write the matrix
+    :param weighting: One of `WEIGHTINGS`
+    :param memory_budget: How many MiB of the matrix to hold in memory at a time
+    :return: How many rows, columns and non-zero values the matrix has
+    """
+
+    if not index_file.is_file():
+        rich.print(f"\n[red bold]There is no index at[/] \"{index_file}\"[red bold]. Run[/] python Pipeline.py --index "
+                   f"[red bold]first[/]\n")
+        raise typer.Exit(1)
+
+    shape = export_matrix(index_file, matrix_file, weighting, memory_budget << 20)
+    rich.print(f"\n[bold blue]Matrix:[/] {shape[0]} articles x {shape[1]} terms, [bold green]{shape[2]}[/] non-zero, "
+               f"in \"{matrix_file}\"")
+
+    return shape
+
+
+if __name__ == '__main__':
+    run_app(exporter)
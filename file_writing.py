@@ -1,6 +1,168 @@
-from typing import Union
+import os
+from queue import Queue
+from threading import Thread
+from typing import List, Optional, Set, Union
 from pathlib import Path
 
+from instrumentation import STATS
+
+# Directories already known to exist, so each one is only created once per process
+_CREATED_DIRECTORIES: Set[Path] = set()
+
+# Files are written on background threads while other steps run, or else as part of the pipeline's own "write" step
+STATS.overlapping.add('file writes')
+
+
+def _write(file_name: Path, content: str) -> None:
+    """
+    Write the given content to the given file, creating its directory first if needed
+
+    :param file_name: The full path of the file to write
+    :param content: Everything to write, already joined into 1 string
+    """
+
+    timer = STATS.timer()
+    data = content.encode('utf-8')
+
+    # Ensure the path to the desired file (and all its parents) exists before writing to it
+    if file_name.parent not in _CREATED_DIRECTORIES:
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        _CREATED_DIRECTORIES.add(file_name.parent)
+
+    try:
+        file = open(file_name, "wb")
+
+    # The directory was removed since it was created, so create it again
+    except FileNotFoundError:
+        file_name.parent.mkdir(parents=True, exist_ok=True)
+        file = open(file_name, "wb")
+
+    with file:
+        file.write(data)
+
+    if timer:
+        timer.lap('file writes')
+        STATS.count('bytes written', len(data))
+
+
+class BackgroundWriter:
+    """
+    Writes files on background threads, so processing can carry on while the disk catches up.
+
+    Files are handed over through a bounded queue. If the disk falls too far behind, handing over a file blocks until
+    there is room again, so memory use stays bounded.
+    """
+
+    def __init__(self, threads: int = 1, max_pending: int = 1024):
+        """
+        :param threads: How many threads write files
+        :param max_pending: How many files may be waiting to be written before handing over another one blocks
+        """
+
+        self.pid = os.getpid()
+        self.queue: Queue = Queue(maxsize=max_pending)
+        self.errors: List[BaseException] = []
+        self.threads = [Thread(target=self._drain, daemon=True) for _ in range(threads)]
+
+        for thread in self.threads:
+            thread.start()
+
+    def _drain(self) -> None:
+        """
+        Write files from the queue until told to stop
+        """
+
+        while True:
+            item = self.queue.get()
+
+            try:
+                if item is None:
+                    return
+
+                _write(*item)
+
+            except BaseException as error:
+                self.errors.append(error)
+
+            finally:
+                self.queue.task_done()
+
+    def submit(self, file_name: Path, content: str) -> None:
+        """
+        Hand over a file to be written
+
+        :param file_name: The full path of the file to write
+        :param content: Everything to write, already joined into 1 string
+        """
+
+        self.queue.put((file_name, content))
+
+    def flush(self) -> None:
+        """
+        Wait until every file handed over so far has been written. Re-raises the first error any write ran into
+        """
+
+        self.queue.join()
+
+        if self.errors:
+            error, self.errors = self.errors[0], []
+            raise error
+
+    def close(self) -> None:
+        """
+        Write everything still waiting, then stop all threads
+        """
+
+        try:
+            self.flush()
+        finally:
+            for _ in self.threads:
+                self.queue.put(None)
+
+            for thread in self.threads:
+                thread.join()
+
+
+# The background writer `write_to_file()` hands files to, if one has been started
+_WRITER: Optional[BackgroundWriter] = None
+
+
+def start_background_writer(threads: int = 1, max_pending: int = 1024) -> BackgroundWriter:
+    """
+    Make `write_to_file()` write files on background threads from now on
+
+    :param threads: How many threads write files
+    :param max_pending: How many files may be waiting to be written before `write_to_file()` blocks
+    :return: The new background writer
+    """
+
+    global _WRITER
+
+    _WRITER = BackgroundWriter(threads, max_pending)
+    return _WRITER
+
+
+def flush_background_writer() -> None:
+    """
+    Wait until every file handed to the background writer has been written, if one is running in this process
+    """
+
+    if _WRITER is not None and _WRITER.pid == os.getpid():
+        _WRITER.flush()
+
+
+def stop_background_writer() -> None:
+    """
+    Write everything still waiting, and make `write_to_file()` write files directly again
+    """
+
+    global _WRITER
+
+    writer, _WRITER = _WRITER, None
+
+    if writer is not None and writer.pid == os.getpid():
+        writer.close()
+
 
 def write_to_file(file_path: Path, what_to_write: Union[list, str]) -> None:
     """
@@ -11,21 +173,28 @@ def write_to_file(file_path: Path, what_to_write: Union[list, str]) -> None:
     File paths will have `output/` prepended, thus saving to the `output/` folder. So a given file name of
     `my_folder/my_subfolder/file.txt` will save as `output/my_folder/my_subfolder/file.txt`
 
+    If a background writer has been started, the file is only handed over to be written later. Use
+    `flush_background_writer()` to wait until it has been written.
+
     :param file_path: Where to write to. Always writes in the `output/` directory
     :param what_to_write: The content to write. Can be a string or list of strings
     """
 
     FILENAME = "output" / file_path
 
-    # Ensure the path to the desired file (and all its parents) exists before writing to it
-    Path(FILENAME.parent).mkdir(parents=True, exist_ok=True)
+    # If a string is given to write, simply write it
+    if type(what_to_write) is str:
+        content = what_to_write
+
+    # If a list of strings is given, write it line by line, joined into a single buffer
+    elif type(what_to_write) is list:
+        content = '\n'.join(what_to_write) + '\n' if what_to_write else ''
 
-    # Write to file
-    with open(FILENAME, "w+t", encoding="utf-8") as file:
-        # If a string is given to write, simply write it
-        if type(what_to_write) is str:
-            file.writelines(what_to_write)
+    else:
+        content = ''
 
-        # If a list of strings is given, write it line by line
-        elif type(what_to_write) is list:
-            file.writelines([i + '\n' for i in what_to_write])
+    # Threads don't survive a fork, so a worker process must never use a writer inherited from its parent
+    if _WRITER is not None and _WRITER.pid == os.getpid():
+        _WRITER.submit(FILENAME, content)
+    else:
+        _write(FILENAME, content)
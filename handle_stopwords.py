@@ -4,15 +4,12 @@ from typing_extensions import Annotated
 
 import rich
 import typer
-from typer import rich_utils
 
+from batching import TokenBatch, filter_stopwords_batch
+from cli import run_app, stream_stage, JSONL_OPTION, BATCH_SIZE_OPTION
 from file_writing import write_to_file
-
-# Define certain colors and styles
-rich_utils.OPTIONS_PANEL_TITLE = "[not dim]Options"
-rich_utils.ARGUMENTS_PANEL_TITLE = "[not dim]Arguments"
-rich_utils.STYLE_REQUIRED_LONG = 'not dim red'
-rich_utils.STYLE_OPTION_DEFAULT = 'not dim white'
+from stopword_index import StopwordIndex, load_stopwords, DEFAULT_STOPWORDS_FILE
+from streaming import STDIN, STREAM_BATCH_SIZE
 
 # Define remover app
 remover = typer.Typer(add_completion=False, rich_markup_mode='rich', no_args_is_help=True)
@@ -20,12 +17,13 @@ remover = typer.Typer(add_completion=False, rich_markup_mode='rich', no_args_is_
 # Define certain app arguments and options. Makes later code cleaner
 TOKENS_ARGUMENT = typer.Argument(help="The tokens to use.", show_default=False)
 ARTICLE_NUM_OPTION = typer.Option(help="Declare which article number this should be.", hidden=True)
-STOPWORDS_OPTION = typer.Option('--stopwords', "-s", help="The file to find stopwords in.")
+STOPWORDS_OPTION = typer.Option('--stopwords', "-s", show_default=str(DEFAULT_STOPWORDS_FILE),
+                                help="The file to find stopwords in. Can be given more than once to combine files.")
 FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to save this result to.")
 
 
 @remover.command(short_help="Removes stopwords from a given list of tokens.", no_args_is_help=True,
-                 options_metavar='[--help] [--file <dir/file.txt>] [--stopwords <stopfile.txt>]',
+                 options_metavar='[--help] [--file <dir/file.txt>] [--stopwords <stopfile.txt>]... [--jsonl]',
                  epilog="Thanks for using my stopwords-remover! :boom:",
                  help="""
                  Removes stopwords from a given list of tokens.
@@ -34,7 +32,7 @@ FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to sav
                  Stopwords are extremely common words that can perhaps be ignored when doing NLP tasks, because they
                  don't differentiate texts from each other. This command reads a file of stopwords to eliminate from
                  a given list of token strings, and eliminates them. It's even possible to specify a custom stopwords
-                 file.
+                 file, or several at once to combine them.
                  
                  It is possible to specify a custom file to save results to. Files should always look like: [bold yellow]<nested/directories/file.txt>[/].
                  Regardless of the nesting of directories and filename you specify, results will always be saved to the [bold yellow]output/[/] directory.
@@ -45,28 +43,39 @@ FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to sav
                    
                  will save to [bold yellow]output/my_article/removed.txt[/]. If no file is specified, it will save to
                  [bold yellow]output/custom_article/4. No-stopword-output.txt[/]
-                 
+
+                 With [bold yellow]-[/] as the only token, lines are read from stdin and each is written to stdout
+                 once its stopwords are removed, instead of to a file. Each line is space-separated tokens, or a JSON list of tokens with
+                 [bold yellow]--jsonl[/]. This chains with the other steps, without any temporary files.
+                                  
                  [bold yellow]Example Usages[/]:
                  python handle_stopwords.py where are you at for once
                  python handle_stopwords.py these are other tokens perhaps with stopwords --stopwords my_file.txt
                  python handle_stopwords.py where are you at for once --file my_article/removed.txt
                  python handle_stopwords.py where are you at for once --file my_article/removed.txt --stopwords my_file.txt
+                 python handle_stopwords.py where are you at for once --stopwords my_file.txt --stopwords other_file.txt
+                 python stem.py - < tokens.txt | python handle_stopwords.py - > final.txt
                  """)
 def remove_stopwords(
         tokens: Annotated[List[str], TOKENS_ARGUMENT],
         article_num: Annotated[Optional[int], ARTICLE_NUM_OPTION] = 0,
-        stopwords_file: Annotated[Optional[Path], STOPWORDS_OPTION] = Path("Stopwords-used-for-output.txt"),
+        stopwords_files: Annotated[Optional[List[Path]], STOPWORDS_OPTION] = None,
         file_path: Annotated[Optional[Path], FILE_OPTION] = None,
-        pipeline: Annotated[bool, typer.Option(hidden=True)] = False
+        pipeline: Annotated[bool, typer.Option(hidden=True)] = False,
+        jsonl: Annotated[bool, JSONL_OPTION] = False,
+        batch_size: Annotated[int, BATCH_SIZE_OPTION] = STREAM_BATCH_SIZE
 ) -> List[str]:
     """
     As the final step, remove all words from the list of tokens that are stopwords
 
     :param tokens: The list of tokens to filter stopwords out of
     :param article_num: Which article this is
-    :param stopwords_file: The file where stopwords are defined
+    :param stopwords_files: The files where stopwords are defined. A single path is also accepted. Defaults to
+        `Stopwords-used-for-output.txt`
     :param pipeline: Whether this command is running as part of the pipeline. Changes file writing
     :param file_path: A file path to save the file to. Must take form of directory/file.txt
+    :param jsonl: When streaming, whether each line is a JSON record
+    :param batch_size: When streaming, how many lines to process at a time
     """
 
     # Ensure list of tokens is not blank
@@ -74,17 +83,28 @@ def remove_stopwords(
         rich.print("\n[red bold]Empty list of tokens is not permitted.")
         raise typer.Exit(1)
 
-    # Ensure the stopwords file actually exists before trying to read from it. If it doesn't, cleanly exit the app
-    if not stopwords_file.is_file():
-        rich.print(f"\n[red bold]The stopwords file you specified:[/] \"{stopwords_file}\"[red bold], does not exist")
-        raise typer.Exit(1)
+    if not stopwords_files:
+        stopwords_files = [DEFAULT_STOPWORDS_FILE]
+    elif isinstance(stopwords_files, (str, Path)):
+        stopwords_files = [Path(stopwords_files)]
+
+    # Ensure the stopwords files actually exist before trying to read from them. If one doesn't, cleanly exit the app
+    for stopwords_file in stopwords_files:
+        if not Path(stopwords_file).is_file():
+            rich.print(f"\n[red bold]The stopwords file you specified:[/] \"{stopwords_file}\"[red bold], does not exist")
+            raise typer.Exit(1)
+
+    # Get the stopwords of the given files, which are only read again if they have changed
+    STOPWORDS: StopwordIndex = load_stopwords(*stopwords_files)
 
-    # Read the given stopwords file and create a list of the stopwords within
-    with open(stopwords_file, "r") as file:
-        STOPWORDS: List[str] = [word.strip() for word in file.readlines()]
+    # Filter the stopwords out of each line of stdin, instead of the given tokens
+    if tokens == [STDIN]:
+        stream_stage(lambda articles: filter_stopwords_batch(TokenBatch.from_articles(articles), STOPWORDS).articles(),
+                     'tokens', jsonl, batch_size)
+        return []
 
     # Filter out the stopwords
-    FINAL: List[str] = [word for word in tokens if word not in STOPWORDS]
+    FINAL: List[str] = STOPWORDS.filter(tokens)
 
     # If this is running as the pipeline, this will be the 5th file written
     if pipeline:
@@ -116,4 +136,4 @@ def remove_stopwords(
 
 
 if __name__ == '__main__':
-    remover()
+    run_app(remover)
@@ -0,0 +1,166 @@
+import time
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+T = TypeVar('T')
+
+# What `Stats.drain()` hands back: the time spent in each stage, and every counter
+Snapshot = Tuple[Dict[str, List[float]], Dict[str, int]]
+
+
+class Timer:
+    """
+    Times consecutive stages of work. Each call to `lap()` charges the time since the previous lap to a stage
+    """
+
+    __slots__ = ('stats', 'wall', 'cpu')
+
+    def __init__(self, stats: 'Stats'):
+        self.stats = stats
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def lap(self, stage: str, calls: int = 1) -> None:
+        """
+        Charge the time since the last lap to the given stage
+
+        :param stage: The stage that just finished
+        :param calls: How many calls of the stage this covers. i.e. the number of articles in a batch
+        """
+
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self.stats.record(stage, wall - self.wall, cpu - self.cpu, calls)
+        self.wall, self.cpu = wall, cpu
+
+
+class Stats:
+    """
+    Collects the cumulative wall time, CPU time and number of calls of each stage of the pipeline, along with counters
+    like how many tokens were processed and how many bytes were written.
+
+    Disabled by default. While disabled, `timer()` gives None, so instrumented code only pays for a single truth test per
+    stage.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = Lock()
+        self.stages: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+
+        # Stages whose time is also part of another stage's, or spent on a background thread at the same time as other
+        # stages. Left out of the share of wall time, so nothing is counted twice
+        self.overlapping: Set[str] = set()
+
+    def timer(self) -> Optional[Timer]:
+        """
+        :return: A timer that starts now, or None if instrumentation is disabled
+        """
+
+        return Timer(self) if self.enabled else None
+
+    def record(self, stage: str, wall: float, cpu: float, calls: int = 1) -> None:
+        """
+        Add time spent in a stage
+
+        :param stage: The name of the stage
+        :param wall: The wall time spent, in seconds
+        :param cpu: The CPU time the thread spent, in seconds
+        :param calls: How many calls of the stage this covers
+        """
+
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0.0, 0.0, 0])
+            totals[0] += wall
+            totals[1] += cpu
+            totals[2] += calls
+
+    def count(self, counter: str, amount: int) -> None:
+        """
+        Add to a counter
+
+        :param counter: The name of the counter
+        :param amount: How much to add
+        """
+
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def timed(self, stage: str, items: Iterable[T]) -> Iterable[T]:
+        """
+        Charge the time spent producing each item of the given iterable to a stage. Useful for lazy readers
+
+        :param stage: The name of the stage
+        :param items: The iterable to time
+        :return: The same items, if instrumentation is enabled. Otherwise, the iterable itself, untouched
+        """
+
+        return self._timed(stage, items) if self.enabled else items
+
+    def _timed(self, stage: str, items: Iterable[T]) -> Iterator[T]:
+        iterator = iter(items)
+
+        while True:
+            timer = Timer(self)
+
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+
+            timer.lap(stage)
+            yield item
+
+    def drain(self) -> Snapshot:
+        """
+        Take everything collected so far, and start again from nothing. Lets worker processes send their stats back
+
+        :return: The time spent in each stage, and every counter
+        """
+
+        with self.lock:
+            snapshot = (self.stages, self.counters)
+            self.stages, self.counters = {}, {}
+
+        return snapshot
+
+    def merge(self, snapshot: Snapshot) -> None:
+        """
+        Add in what another process collected, as returned by its `drain()`
+
+        :param snapshot: The time spent in each stage, and every counter
+        """
+
+        stages, counters = snapshot
+
+        for stage, (wall, cpu, calls) in stages.items():
+            self.record(stage, wall, cpu, int(calls))
+
+        for counter, amount in counters.items():
+            self.count(counter, amount)
+
+    def table(self):
+        """
+        :return: A `rich` table summarising everything collected
+        """
+
+        from rich.table import Table
+
+        table = Table(title="Pipeline statistics")
+        for column in ("Stage", "Wall time (s)", "CPU time (s)", "Calls", "Share of wall time"):
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+
+        total = sum(wall for stage, (wall, _, _) in self.stages.items() if stage not in self.overlapping) or 1
+
+        for stage, (wall, cpu, calls) in self.stages.items():
+            share = "[dim]overlaps[/]" if stage in self.overlapping else f"{wall / total:.1%}"
+            table.add_row(stage, f"{wall:.3f}", f"{cpu:.3f}", f"{int(calls):,}", share)
+
+        for counter, amount in self.counters.items():
+            table.add_row(f"[dim]{counter}[/]", "", "", f"{amount:,}", "")
+
+        return table
+
+
+# Statistics shared by everything in this process
+STATS = Stats()
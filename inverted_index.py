@@ -0,0 +1,549 @@
+import heapq
+import json
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Annotated, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import rich
+import typer
+
+from cli import run_app
+from corpus_cache import layout
+from stem import stemmer_callback
+from stem_cache import STEM_CACHE, STEMMERS
+
+# Define index app
+searcher = typer.Typer(add_completion=False, rich_markup_mode='rich', no_args_is_help=True)
+
+# Define certain app arguments and options. Makes later code cleaner
+WORDS_ARGUMENT = typer.Argument(help="The words every matching article must contain.", show_default=False)
+INDEX_FILE_OPTION = typer.Option('--index-file', help="Where the index is.")
+LIMIT_OPTION = typer.Option('--limit', '-l', min=1, help="How many matching articles to list.")
+STEMMER_OPTION = typer.Option('--stemmer', '-s', callback=stemmer_callback,
+                              help=f"Which stemmer the index was built with. One of {', '.join(STEMMERS)}.")
+
+# Where the index, and the partial indexes it is merged from, are kept
+INDEX_DIRECTORY = Path("output/index")
+INDEX_FILE = INDEX_DIRECTORY / "index.idx"
+
+# Identifies an index file, and the version of its layout
+MAGIC = b'REUTIX01'
+
+# The sections of an index file after its header, in order, with the type of array each one holds. The terms
+# themselves come last, as 1 blob of UTF-8
+SECTIONS = {
+    'term_offsets': 'Q',
+    'postings_offsets': 'Q',
+    'articles': 'I',
+    'frequencies': 'I',
+    'documents': 'I',
+    'lengths': 'I',
+}
+
+# What `IndexBuilder.drain()` hands back: each term's postings, and each article's length
+Delta = Tuple[Dict[str, array], Dict[int, int]]
+
+
+def sorted_postings(frequencies: Dict[int, int]) -> Tuple[array, array]:
+    """
+    :param frequencies: How often a term appears in each article it appears in
+    :return: The articles, in order, and how often the term appears in each
+    """
+
+    articles = array('I', sorted(frequencies))
+    return articles, array('I', map(frequencies.__getitem__, articles))
+
+
+def write_index(index_file: Path, postings: Iterable[Tuple[str, array, array]], lengths: Dict[int, int]) -> int:
+    """
+    Write an index file.
+
+    The file holds a small JSON header, then arrays of offsets into the terms and into the postings, every posting's
+    article and term frequency, every indexed article and its length, and finally every term as 1 blob of UTF-8. Terms
+    are sorted, and each term's postings are sorted by article, so any term can be found by binary search, and indexes
+    can be merged without sorting again. Everything after the header is read by memory-mapping the file.
+
+    :param index_file: Where to write the index
+    :param postings: Each term, with the articles it appears in and how often it appears in each, in term order
+    :param lengths: How many tokens each indexed article has
+    :return: How many terms were written
+    """
+
+    arrays = {name: array(typecode) for name, typecode in SECTIONS.items()}
+    arrays['term_offsets'].append(0)
+    arrays['postings_offsets'].append(0)
+    terms: List[bytes] = []
+
+    for term, articles, frequencies in postings:
+        encoded = term.encode('utf-8')
+        terms.append(encoded)
+        arrays['term_offsets'].append(arrays['term_offsets'][-1] + len(encoded))
+        arrays['articles'].extend(articles)
+        arrays['frequencies'].extend(frequencies)
+        arrays['postings_offsets'].append(len(arrays['articles']))
+
+    for article in sorted(lengths):
+        arrays['documents'].append(article)
+        arrays['lengths'].append(lengths[article])
+
+    # Lay out every section after the header, then write the header describing where each one starts
+    header: Dict[str, object] = {'term_count': len(terms), 'posting_count': len(arrays['articles']),
+                                 'document_count': len(arrays['documents']), 'token_count': sum(lengths.values())}
+    sections = {name: data.tobytes() for name, data in arrays.items()}
+
+    header_bytes = layout(header, sections, MAGIC, tail='blob')
+
+    # Write to a temporary file first, so a process reading the old index never sees a half written one
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    temporary = index_file.with_name(f"{index_file.name}.{os.getpid()}.tmp")
+
+    with open(temporary, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+
+        for name, data in sections.items():
+            f.write(b'\0' * (header[name] - f.tell()))
+            f.write(data)
+
+        f.write(b'\0' * (header['blob'] - f.tell()))
+        for term in terms:
+            f.write(term)
+
+    os.replace(temporary, index_file)
+
+    return len(terms)
+
+
+class InvertedIndex:
+    """
+    Reads an index written by `write_index()`.
+
+    The file is memory-mapped, and every array is viewed in place, so opening an index costs the same no matter how
+    big it is. A term is found by binary search over the sorted terms, and only its own postings are ever read.
+    """
+
+    def __init__(self, index_file: Path = INDEX_FILE):
+        """
+        :param index_file: Where the index was written
+        """
+
+        self.file = open(index_file, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"\"{index_file}\" is not an index")
+
+        header_length = int.from_bytes(self.map[len(MAGIC): len(MAGIC) + 8], 'little')
+        self.header = json.loads(self.map[len(MAGIC) + 8: len(MAGIC) + 8 + header_length])
+
+        self.view = memoryview(self.map)
+        terms, postings, documents = (self.header['term_count'], self.header['posting_count'],
+                                      self.header['document_count'])
+        counts = {'term_offsets': terms + 1, 'postings_offsets': terms + 1, 'articles': postings,
+                  'frequencies': postings, 'documents': documents, 'lengths': documents}
+
+        for name, typecode in SECTIONS.items():
+            start = self.header[name]
+            setattr(self, name, self.view[start: start + array(typecode).itemsize * counts[name]].cast(typecode))
+
+        self.blob = self.header['blob']
+
+    def __len__(self) -> int:
+        return self.header['term_count']
+
+    def term(self, position: int) -> str:
+        """
+        :param position: Where the term is in sorted order, counting from 0
+        :return: The term
+        """
+
+        return str(self.view[self.blob + self.term_offsets[position]: self.blob + self.term_offsets[position + 1]],
+                   'utf-8')
+
+    def find(self, term: str) -> Optional[int]:
+        """
+        :param term: The term to look for
+        :return: Where the term is in sorted order, or None if no article contains it
+        """
+
+        # Terms are sorted by their UTF-8 bytes, which is the same order as sorting them as strings
+        encoded = term.encode('utf-8')
+        offsets = self.term_offsets
+        low, high = 0, len(self)
+
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self.view[self.blob + offsets[middle]: self.blob + offsets[middle + 1]]) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low if low < len(self) and self.term(low) == term else None
+
+    def __contains__(self, term: str) -> bool:
+        return self.find(term) is not None
+
+    def postings(self, term: str) -> Tuple[memoryview, memoryview]:
+        """
+        :param term: The term to look up
+        :return: The articles containing the term, in order, and how often it appears in each. Both are empty if no
+            article contains it
+        """
+
+        position = self.find(term)
+        if position is None:
+            return self.articles[0:0], self.frequencies[0:0]
+
+        start, end = self.postings_offsets[position], self.postings_offsets[position + 1]
+        return self.articles[start:end], self.frequencies[start:end]
+
+    def document_frequency(self, term: str) -> int:
+        """
+        :param term: The term to look up
+        :return: How many articles contain the term
+        """
+
+        position = self.find(term)
+        return 0 if position is None else self.postings_offsets[position + 1] - self.postings_offsets[position]
+
+    def collection_frequency(self, term: str) -> int:
+        """
+        :param term: The term to look up
+        :return: How often the term appears across every article
+        """
+
+        return sum(self.postings(term)[1])
+
+    def length(self, article: int) -> int:
+        """
+        :param article: Which article to look up
+        :return: How many tokens the article has in the index. 0 if it wasn't indexed
+        """
+
+        position = bisect_left(self.documents, article)
+        return self.lengths[position] if position < len(self.documents) and self.documents[position] == article else 0
+
+    def search(self, *terms: str) -> List[int]:
+        """
+        Find the articles containing every given term
+
+        :param terms: The terms to look for, as they appear in the index
+        :return: The matching articles, in order
+        """
+
+        if not terms:
+            return []
+
+        # Start from the rarest term, so every later step has the fewest candidates to check
+        postings = sorted((self.postings(term)[0] for term in set(terms)), key=len)
+        matches = list(postings[0])
+
+        for articles in postings[1:]:
+            # Both lists are sorted, so each search can start where the previous one ended
+            found, low = [], 0
+
+            for article in matches:
+                low = bisect_left(articles, article, low)
+                if low == len(articles):
+                    break
+                if articles[low] == article:
+                    found.append(article)
+
+            matches = found
+
+        return matches
+
+    def __iter__(self) -> Iterator[Tuple[str, memoryview, memoryview]]:
+        """
+        :return: Each term, with its articles and term frequencies, in term order
+        """
+
+        for position in range(len(self)):
+            start, end = self.postings_offsets[position], self.postings_offsets[position + 1]
+            yield self.term(position), self.articles[start:end], self.frequencies[start:end]
+
+    def close(self) -> None:
+        # Views of the map must be released before it can be closed
+        for view in (*SECTIONS, 'view'):
+            if hasattr(self, view):
+                getattr(self, view).release()
+
+        self.map.close()
+        self.file.close()
+
+
+class IndexBuilder:
+    """
+    Collects the postings of articles as they are processed, to be written out as an index.
+
+    Worker processes each build their own, and hand what they collected to the main process with `drain()`. The main
+    process writes what it has collected as a partial index every time the run is checkpointed, and merges every
+    partial index into one at the end. Disabled by default.
+    """
+
+    def __init__(self):
+        self.enabled = False
+
+        # Each term's postings, as article and term frequency pairs, in the order they were added
+        self.postings: Dict[str, array] = defaultdict(lambda: array('I'))
+        self.lengths: Dict[int, int] = {}
+
+    def add(self, article_num: int, tokens: List[str]) -> None:
+        """
+        Index an article
+
+        :param article_num: Which article this is
+        :param tokens: The article's final tokens
+        """
+
+        postings = self.postings
+
+        for term, frequency in Counter(tokens).items():
+            postings[term].extend((article_num, frequency))
+
+        self.lengths[article_num] = len(tokens)
+
+    def drain(self) -> Delta:
+        """
+        Take everything collected since the last call
+
+        :return: Each term's postings, and each article's length
+        """
+
+        delta = (dict(self.postings), self.lengths)
+        self.postings, self.lengths = defaultdict(lambda: array('I')), {}
+        return delta
+
+    def merge(self, delta: Delta) -> None:
+        """
+        Take in what another process collected, as returned by its `drain()`
+
+        :param delta: Each term's postings, and each article's length
+        """
+
+        postings, lengths = delta
+
+        for term, pairs in postings.items():
+            self.postings[term].extend(pairs)
+
+        self.lengths.update(lengths)
+
+    def sorted_postings(self) -> Iterator[Tuple[str, array, array]]:
+        """
+        :return: Each term, with the articles it appears in and how often it appears in each, in term and article order
+        """
+
+        for term in sorted(self.postings):
+            pairs = self.postings[term]
+
+            # Chunks from worker processes arrive in any order. An article indexed twice keeps its latest postings
+            yield (term, *sorted_postings(dict(zip(pairs[0::2], pairs[1::2]))))
+
+    def write_partial(self, directory: Path = INDEX_DIRECTORY, up_to: Optional[int] = None) -> Optional[Path]:
+        """
+        Write everything collected so far as a partial index, and start collecting afresh
+
+        :param directory: Where partial indexes are kept
+        :param up_to: Only write the articles up to this one, and keep collecting the rest. All of them by default
+        :return: The partial index, or None if there was nothing to write
+        """
+
+        if up_to is not None and any(article > up_to for article in self.lengths):
+            postings, lengths = self.drain()
+            written = IndexBuilder()
+
+            for term, pairs in postings.items():
+                for article, frequency in zip(pairs[0::2], pairs[1::2]):
+                    (written if article <= up_to else self).postings[term].extend((article, frequency))
+
+            for article, length in lengths.items():
+                (written if article <= up_to else self).lengths[article] = length
+
+            return written.write_partial(directory)
+
+        if not self.lengths:
+            return None
+
+        # Numbered after every partial already written, even by an earlier run that was resumed, so a later partial's
+        # postings replace an earlier one's. The process ID keeps processes writing at the same time apart
+        partial = directory / f"partial.{next_partial_number(directory):07}.{os.getpid()}.idx"
+        write_index(partial, self.sorted_postings(), self.lengths)
+        self.drain()
+
+        return partial
+
+    def finish(self, index_file: Path = INDEX_FILE) -> int:
+        """
+        Write what is left as a partial index, then merge every partial index into the final one, and remove them
+
+        :param index_file: Where to write the index. Partial indexes are kept alongside it
+        :return: How many terms the index holds
+        """
+
+        self.write_partial(index_file.parent)
+
+        partials = sorted(index_file.parent.glob("partial.*.idx"), key=partial_number)
+        terms = merge_indexes(partials, index_file)
+
+        for partial in partials:
+            partial.unlink()
+
+        return terms
+
+
+def partial_number(partial: Path) -> int:
+    """
+    :param partial: A partial index
+    :return: Its place in the order partial indexes were written in
+    """
+
+    return int(partial.name.split('.')[1])
+
+
+def next_partial_number(directory: Path = INDEX_DIRECTORY) -> int:
+    """
+    :param directory: Where partial indexes are kept
+    :return: The number of the next partial index to write, after every one already there
+    """
+
+    return max(map(partial_number, directory.glob("partial.*.idx")), default=0) + 1
+
+
+def merge_indexes(sources: List[Path], index_file: Path) -> int:
+    """
+    Merge several indexes into 1. Each is already sorted, so they are merged term by term without loading any of them
+    whole. An article indexed in more than 1 of them keeps only its postings from the last one, so an index can be
+    updated by merging in a newer index of just the articles that changed
+
+    :param sources: The indexes to merge, oldest first
+    :param index_file: Where to write the merged index
+    :return: How many terms the merged index holds
+    """
+
+    indexes = [InvertedIndex(source) for source in sources]
+
+    try:
+        # The articles each index holds that a later one replaces
+        replaced: List[Set[int]] = []
+        newer: Set[int] = set()
+
+        for index in reversed(indexes):
+            documents = set(index.documents)
+            replaced.append(documents & newer)
+            newer |= documents
+
+        replaced.reverse()
+
+        lengths: Dict[int, int] = {}
+        for index, stale in zip(indexes, replaced):
+            lengths.update((article, length) for article, length in zip(index.documents, index.lengths)
+                           if article not in stale)
+
+        def postings() -> Iterator[Tuple[str, array, array]]:
+            def entries(number: int) -> Iterator[Tuple[str, int, memoryview, memoryview]]:
+                for term, articles, frequencies in indexes[number]:
+                    yield term, number, articles, frequencies
+
+            # Every index's terms, in 1 sorted stream. Ties come out oldest index first
+            merged = heapq.merge(*(entries(number) for number in range(len(indexes))), key=lambda entry: entry[:2])
+
+            current, pairs = None, {}
+
+            for term, number, articles, frequencies in merged:
+                if term != current:
+                    if pairs:
+                        yield (current, *sorted_postings(pairs))
+                    current, pairs = term, {}
+
+                stale = replaced[number]
+                pairs.update((article, frequency) for article, frequency in zip(articles, frequencies)
+                             if article not in stale)
+
+            if pairs:
+                yield (current, *sorted_postings(pairs))
+
+        return write_index(index_file, postings(), lengths)
+
+    finally:
+        for index in indexes:
+            index.close()
+
+
+def clear_index(directory: Path = INDEX_DIRECTORY) -> None:
+    """
+    Remove the index and any partial indexes left over from an earlier run
+
+    :param directory: Where the index is kept
+    """
+
+    for path in directory.glob("*.idx"):
+        path.unlink()
+
+
+# The index builder shared by everything in this process
+INDEX = IndexBuilder()
+
+
+@searcher.command(epilog="Thanks for using my data pipeline! :boom:", no_args_is_help=True,
+                  options_metavar='[--help] [--index-file <index.idx>] [--limit <NUMBER>] [--stemmer <STEMMER>]',
+                  help="""Find the articles containing every given word, in an index built by the pipeline.
+
+                  [not dim]
+                  Build the index first with [bold yellow]python Pipeline.py --index[/]. Each word is lowercased and
+                  stemmed, as the pipeline does, before it is looked up, so "Banking" finds articles containing
+                  "banks". Stopwords were never indexed, so they match nothing. If the pipeline was run with
+                  [bold yellow]--stemmer[/], search with the same one.
+
+                  Prints how many articles contain each word, and then the articles containing all of them.
+
+                  [bold yellow]Example Usages[/]:
+                  python inverted_index.py bank
+                  python inverted_index.py interest rates --limit 20
+                  """)
+def search(words: Annotated[List[str], WORDS_ARGUMENT],
+           index_file: Annotated[Path, INDEX_FILE_OPTION] = INDEX_FILE,
+           limit: Annotated[int, LIMIT_OPTION] = 10,
+           stemmer: Annotated[str, STEMMER_OPTION] = 'porter') -> List[int]:
+    """
+    Search the index for articles containing every given word
+
+    :param words: The words to look for
+    :param index_file: Where the index is
+    :param limit: How many matching articles to list
+    :param stemmer: Which of the `STEMMERS` the index was built with
+    :return: The matching articles, in order
+    """
+
+    if not index_file.is_file():
+        rich.print(f"\n[red bold]There is no index at[/] \"{index_file}\"[red bold]. Run[/] python Pipeline.py --index "
+                   f"[red bold]first[/]\n")
+        raise typer.Exit(1)
+
+    index = InvertedIndex(index_file)
+    STEM_CACHE.use(stemmer)
+    terms = STEM_CACHE.stem_tokens([word.lower() for word in words])
+
+    rich.print(f"\n[bold blue]Index:[/] {len(index)} terms across {index.header['document_count']} articles\n")
+
+    for word, term in zip(words, terms):
+        rich.print(f"\t{word} -> {term}: in [bold green]{index.document_frequency(term)}[/] articles, "
+                   f"[bold green]{index.collection_frequency(term)}[/] times")
+
+    matches = index.search(*terms)
+    index.close()
+
+    rich.print(f"\n[bold blue]Articles containing every word:[/] [bold green]{len(matches)}[/]")
+    if matches:
+        rich.print(f"\t{', '.join(map(str, matches[:limit]))}{', ...' if len(matches) > limit else ''}")
+
+    return matches
+
+
+if __name__ == '__main__':
+    run_app(searcher)
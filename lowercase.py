@@ -3,16 +3,12 @@ from typing import List, Optional
 from typing_extensions import Annotated
 
 import typer
-from typer import rich_utils
 import rich
 
+from batching import TokenBatch, lowercase_batch
+from cli import run_app, stream_stage, JSONL_OPTION, BATCH_SIZE_OPTION
 from file_writing import write_to_file
-
-# Define certain colors and styles
-rich_utils.OPTIONS_PANEL_TITLE = "[not dim]Options"
-rich_utils.ARGUMENTS_PANEL_TITLE = "[not dim]Arguments"
-rich_utils.STYLE_REQUIRED_LONG = 'not dim red'
-rich_utils.STYLE_OPTION_DEFAULT = 'not dim white'
+from streaming import STDIN, STREAM_BATCH_SIZE
 
 # Define lowercaser app
 lowercaser = typer.Typer(add_completion=False, rich_markup_mode='rich', no_args_is_help=True)
@@ -24,7 +20,7 @@ FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to sav
 
 
 @lowercaser.command(short_help="Makes all tokens lowercase.", epilog="Thanks for using my token lower-caser! :boom:",
-                    options_metavar='[--help] [--file <dir/file.txt>]', no_args_is_help=True,
+                    options_metavar='[--help] [--file <dir/file.txt>] [--jsonl]', no_args_is_help=True,
                     help="""Makes all tokens lowercase.
                     
                     [not dim]
@@ -39,16 +35,23 @@ FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to sav
                    
                     will save to [bold yellow]output/my_article/lowercase.txt[/]. If no file is specified, it will save to
                     [bold yellow]output/custom_article/2. Lowercased-output.txt[/]
+                    
+                    With [bold yellow]-[/] as the only token, lines are read from stdin and each is written to stdout
+                    once lowercased, instead of to a file. Each line is space-separated tokens, or a JSON list of
+                    tokens with [bold yellow]--jsonl[/]. This chains with the other steps, without any temporary files.
                    
                     [bold yellow]Example Usages[/]:
                     python lowercase.py THESE ARE SOME TOKENS
                     python lowercase.py THESE ARE SOME TOKENS --file my_article/lowercase.txt
+                    python tokenization.py - < articles.txt | python lowercase.py - | python stem.py -
                     """)
 def lowercase(
         tokens: Annotated[List[str], TOKENS_ARGUMENT],
         article_num: Annotated[Optional[int], ARTICLE_NUM_OPTION] = 0,
         file_path: Annotated[Optional[Path], FILE_OPTION] = None,
-        pipeline: Annotated[bool, typer.Option(hidden=True)] = False
+        pipeline: Annotated[bool, typer.Option(hidden=True)] = False,
+        jsonl: Annotated[bool, JSONL_OPTION] = False,
+        batch_size: Annotated[int, BATCH_SIZE_OPTION] = STREAM_BATCH_SIZE
 ) -> List[str]:
     """
     Turn the tokens of the article all lowercase
@@ -57,9 +60,17 @@ def lowercase(
     :param article_num: Which article this is
     :param file_path: A file path to save the file to. Must take form of directory/file.txt
     :param pipeline: Whether this command is running as part of the pipeline. Changes file writing
-    :return: The list of tokens, all lowercase
+    :param jsonl: When streaming, whether each line is a JSON record
+    :param batch_size: When streaming, how many lines to process at a time
+    :return: The list of tokens, all lowercase. Empty when streaming, as the results are written to stdout instead
     """
 
+    # Lowercase each line of stdin, instead of the given tokens
+    if tokens == [STDIN]:
+        stream_stage(lambda articles: lowercase_batch(TokenBatch.from_articles(articles)).articles(), 'tokens', jsonl,
+                     batch_size)
+        return []
+
     # Ensure list of tokens is not blank
     if not all(token.strip() for token in tokens if token.strip() == ''):
         rich.print("\n[red bold]Empty list of tokens is not permitted.")
@@ -98,4 +109,4 @@ def lowercase(
 
 
 if __name__ == '__main__':
-    lowercaser()
+    run_app(lowercaser)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from stages import STAGE_FILES
+
+# Where the manifest of a run's output is kept
+MANIFEST_FILE = Path("output/.manifest.json")
+
+# What `Manifest.drain()` hands back: updated entries, articles skipped entirely and steps reused from file
+Delta = Tuple[Dict[str, Tuple[str, Dict[str, str]]], int, int]
+
+
+def content_hash(content: Union[str, bytes]) -> str:
+    """
+    :param content: Anything to hash
+    :return: A short, stable hash of the given content
+    """
+
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def stage_fingerprints(configs: Sequence[str], stages: Sequence[str] = tuple(STAGE_FILES)) -> Dict[str, str]:
+    """
+    Fingerprint each step of the pipeline from its configuration. Each step's fingerprint also covers every step before
+    it, so changing how one step works makes the output of every later step stale too
+
+    :param configs: A description of how each step is configured, in order
+    :param stages: The steps, in the order they run. Default is every step in `STAGE_FILES`, in order
+    :return: The fingerprint of each step, in order
+    """
+
+    fingerprints: Dict[str, str] = {}
+    previous = ''
+
+    for stage, config in zip(stages, configs):
+        previous = fingerprints[stage] = content_hash(f"{previous}|{stage}|{config}")
+
+    return fingerprints
+
+
+def read_stage_output(article_num: int, stage: str) -> Union[str, List[str]]:
+    """
+    Read back a step's output for an article, as written by `write_to_file()`
+
+    :param article_num: Which article this is
+    :param stage: Which step of the pipeline the output is from
+    :return: A string for the "text" step, and a list of tokens for the others
+    """
+
+    with open(Path(f"output/article{article_num}/{STAGE_FILES[stage]}"), "r", encoding="utf-8", newline='') as file:
+        content = file.read()
+
+    if stage == 'text':
+        return content
+
+    # Lists are written 1 token per line, with a newline after the last one
+    return content[:-1].split('\n') if content else []
+
+
+class Manifest:
+    """
+    Remembers, for each article, a hash of its content and the fingerprint of each step whose output was written.
+
+    Lets a rerun skip articles whose output is already current, or pick up from the last step whose output is still
+    current, instead of reprocessing everything. Disabled by default.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.fingerprints: Dict[str, str] = {}
+        self.entries: Dict[str, Tuple[str, Dict[str, str]]] = {}
+
+        # What changed since the last call to `drain()`. Lets worker processes send their updates back
+        self.updated: Dict[str, Tuple[str, Dict[str, str]]] = {}
+        self.skipped = 0
+        self.reused = 0
+
+    def load(self, manifest_file: Path = MANIFEST_FILE) -> None:
+        """
+        Load the manifest written by an earlier run, if there is one
+
+        :param manifest_file: Where the manifest was saved
+        """
+
+        if manifest_file.is_file():
+            with open(manifest_file, "r", encoding="utf-8") as file:
+                self.entries = {key: (value[0], value[1]) for key, value in json.load(file).items()}
+
+    def save(self, manifest_file: Path = MANIFEST_FILE) -> None:
+        """
+        Save the manifest, so the next run can use it
+
+        :param manifest_file: Where to save the manifest
+        """
+
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(manifest_file, "w", encoding="utf-8") as file:
+            json.dump(self.entries, file)
+
+    def plan(self, article_num: int, article_hash: str, emit: Sequence[str]) -> Optional[int]:
+        """
+        Work out how much of the pipeline needs to run for an article
+
+        :param article_num: Which article this is
+        :param article_hash: The hash of the article's content
+        :param emit: Which steps' output is wanted
+        :return: None if every wanted output is already current. Otherwise, the index in `fingerprints` of the last
+            step whose output is current and can be read back instead of being recomputed, or -1 if there is none
+        """
+
+        entry = self.entries.get(str(article_num))
+
+        if entry is None or entry[0] != article_hash:
+            return -1
+
+        recorded = entry[1]
+        # In the order the steps run, which is the order they were fingerprinted in
+        stages = list(self.fingerprints)
+
+        def current(stage: str) -> bool:
+            return (recorded.get(stage) == self.fingerprints[stage]
+                    and Path(f"output/article{article_num}/{STAGE_FILES[stage]}").is_file())
+
+        if all(current(stage) for stage in emit):
+            self.skipped += 1
+            return None
+
+        # Resume from the latest current output that comes before the first stale step that is wanted
+        first_stale = min(stages.index(stage) for stage in emit if not current(stage))
+
+        for index in range(first_stale - 1, -1, -1):
+            if current(stages[index]):
+                self.reused += 1
+                return index
+
+        return -1
+
+    def record(self, article_num: int, article_hash: str, written: Sequence[str]) -> None:
+        """
+        Remember which steps' output was just written for an article
+
+        :param article_num: Which article this is
+        :param article_hash: The hash of the article's content
+        :param written: The steps whose output was written
+        """
+
+        key = str(article_num)
+        entry = self.entries.get(key)
+
+        # Outputs written for other content are worthless, so forget them
+        recorded = dict(entry[1]) if entry is not None and entry[0] == article_hash else {}
+        recorded.update((stage, self.fingerprints[stage]) for stage in written)
+
+        self.entries[key] = self.updated[key] = (article_hash, recorded)
+
+    def drain(self) -> Delta:
+        """
+        Take everything this manifest learned since the last call, and reset those counts
+
+        :return: The updated entries, the number of articles skipped and the number of steps reused
+        """
+
+        delta = (self.updated, self.skipped, self.reused)
+        self.updated, self.skipped, self.reused = {}, 0, 0
+        return delta
+
+    def merge(self, delta: Delta) -> None:
+        """
+        Take in what another process' manifest learned, as returned by its `drain()`
+
+        :param delta: The updated entries, the number of articles skipped and the number of steps reused
+        """
+
+        updated, skipped, reused = delta
+        self.entries.update(updated)
+        self.skipped += skipped
+        self.reused += reused
+
+    def summary(self) -> str:
+        """
+        :return: A short description of how much work was saved
+        """
+
+        return (f"[bold green]{self.skipped}[/] articles already up to date, "
+                f"[bold green]{self.reused}[/] articles picked up from earlier output")
+
+
+# The manifest shared by everything in this process
+MANIFEST = Manifest()
@@ -0,0 +1,401 @@
+import json
+import socket
+import socketserver
+import threading
+from http import HTTPStatus
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Annotated, Any, Callable, Dict, List, Optional, Union
+
+import rich
+import typer
+
+from cli import run_app
+import Pipeline
+from batching import TokenBatch, lowercase_batch, filter_stopwords_batch
+from stages import STAGE_FILES
+from stem_cache import STEM_CACHE
+from stopword_index import load_stopwords, DEFAULT_STOPWORDS_FILE
+from tokenization import engine_callback
+from treebank import tokenize_batch, ENGINES
+
+# Define server app
+server_app = typer.Typer(add_completion=False, rich_markup_mode='rich')
+
+# Define certain app arguments and options. Makes later code cleaner
+HOST_OPTION = typer.Option('--host', help="The address to listen on over HTTP.")
+PORT_OPTION = typer.Option('--port', '-p', min=0, max=65535, help="The port to listen on over HTTP.")
+SOCKET_OPTION = typer.Option('--socket', '-s', help="Listen on this Unix socket instead of over TCP.")
+TOKENIZER_OPTION = typer.Option('--tokenizer', '-t', callback=engine_callback,
+                                help="Which tokenizer the pipeline uses, and tokenizing uses by default. \"nltk\" or "
+                                     "\"regex\"")
+STEM_CACHE_OPTION = typer.Option('--stem-cache', help="Specify an optional file to load previously stemmed tokens "
+                                                      "from at startup, and save newly stemmed tokens to at shutdown")
+CACHE_SIZE_OPTION = typer.Option('--stem-cache-size', min=1,
+                                 help="The most distinct tokens to remember stems, and the pipeline's results, for. The "
+                                      "least recently used are forgotten beyond it. Unbounded if not given")
+
+# Which tokenizer engine requests use unless they ask for another
+DEFAULT_ENGINE = 'nltk'
+
+# Requests are answered on 1 thread per connection, but the stemming cache, the pipeline's fused passes and the
+# vocabulary they learn from are shared, and not safe to change from 2 threads at once. Only 1 request runs at a time.
+# The GIL would keep them from running in parallel anyway
+PIPELINE_LOCK = threading.Lock()
+
+
+def _inputs(payload: Dict[str, Any], kind: type) -> List:
+    """
+    :param payload: A request's JSON body
+    :param kind: What each input should be. `str` for texts, and `list` for lists of tokens
+    :return: The request's inputs, once they are known to be the right shape
+    """
+
+    inputs = payload.get('inputs')
+
+    if not isinstance(inputs, list):
+        raise ValueError("\"inputs\" must be a list")
+
+    for item in inputs:
+        if not isinstance(item, kind) or (kind is list and not all(isinstance(token, str) for token in item)):
+            raise ValueError(f"Every input must be {'a string' if kind is str else 'a list of strings'}")
+
+    return inputs
+
+
+def tokenize_request(payload: Dict[str, Any]) -> List[List[str]]:
+    """
+    :param payload: Texts to tokenize as "inputs", and optionally which "engine" to use
+    :return: The tokens of each text
+    """
+
+    engine = payload.get('engine', DEFAULT_ENGINE)
+    if not isinstance(engine, str) or engine not in ENGINES:
+        raise ValueError(f"\"engine\" must be one of: {', '.join(ENGINES)}")
+
+    return tokenize_batch(_inputs(payload, str), engine)
+
+
+def lowercase_request(payload: Dict[str, Any]) -> List[List[str]]:
+    """
+    :param payload: Lists of tokens to lowercase as "inputs"
+    :return: Each list of tokens, lowercased
+    """
+
+    return lowercase_batch(TokenBatch.from_articles(_inputs(payload, list))).articles()
+
+
+def stem_request(payload: Dict[str, Any]) -> List[List[str]]:
+    """
+    :param payload: Lists of tokens to stem as "inputs"
+    :return: Each list of tokens, stemmed
+    """
+
+    batch = TokenBatch.from_articles(_inputs(payload, list))
+    return batch.with_tokens(STEM_CACHE.stem_tokens(batch.tokens)).articles()
+
+
+def remove_stopwords_request(payload: Dict[str, Any]) -> List[List[str]]:
+    """
+    :param payload: Lists of tokens as "inputs", and optionally a list of "stopwords" files on the server to use
+    :return: Each list of tokens, without its stopwords
+    """
+
+    stopwords_files = payload.get('stopwords', [str(DEFAULT_STOPWORDS_FILE)])
+
+    if not isinstance(stopwords_files, list) or not stopwords_files:
+        raise ValueError("\"stopwords\" must be a list of files")
+
+    for stopwords_file in stopwords_files:
+        if not isinstance(stopwords_file, str) or not Path(stopwords_file).is_file():
+            raise ValueError(f"The stopwords file \"{stopwords_file}\" does not exist")
+
+    batch = TokenBatch.from_articles(_inputs(payload, list))
+    return filter_stopwords_batch(batch, load_stopwords(*map(Path, stopwords_files))).articles()
+
+
+def pipeline_request(payload: Dict[str, Any]) -> List[Dict[str, Union[str, List[str]]]]:
+    """
+    :param payload: Articles to run the whole pipeline on as "inputs", and optionally which steps to "emit"
+    :return: For each article, the output of each step that was asked for
+    """
+
+    emit = payload.get('emit', list(STAGE_FILES))
+
+    if not isinstance(emit, list) or not all(isinstance(stage, str) and stage in STAGE_FILES for stage in emit):
+        raise ValueError(f"\"emit\" must be a list of steps from: {', '.join(STAGE_FILES)}")
+
+    articles = _inputs(payload, str)
+    outputs = Pipeline.run_batch(articles, frozenset(emit))
+
+    return [{stage: output[i] for stage, output in outputs.items()} for i in range(len(articles))]
+
+
+# Every request the server accepts, keyed by its path. Each takes the request's JSON body, and gives its outputs
+STAGES: Dict[str, Callable[[Dict[str, Any]], List]] = {
+    'tokenize': tokenize_request,
+    'lowercase': lowercase_request,
+    'stem': stem_request,
+    'remove_stopwords': remove_stopwords_request,
+    'pipeline': pipeline_request,
+}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers JSON requests for any step of the pipeline, or the whole thing.
+
+    `POST /<stage>` with a body like `{"inputs": [...]}` gives back `{"outputs": [...]}`, with 1 output per input.
+    `GET /health` says whether the server is up, and which stages it serves.
+    """
+
+    server_version = "ReutersPreprocessor/1.0"
+
+    # Lets clients keep 1 connection open for many requests
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body are written separately, so Nagle's algorithm would hold the body back until the client
+    # acknowledged the headers, adding tens of milliseconds to every response
+    disable_nagle_algorithm = True
+
+    def respond(self, status: HTTPStatus, body: Dict[str, Any]) -> None:
+        """
+        :param status: The status of the response
+        :param body: What to send back, as JSON
+        """
+
+        encoded = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self) -> None:
+        if self.path != '/health':
+            self.respond(HTTPStatus.NOT_FOUND, {'error': f"Unknown path \"{self.path}\""})
+            return
+
+        self.respond(HTTPStatus.OK, {'status': 'ok', 'stages': list(STAGES)})
+
+    def do_POST(self) -> None:
+        handler = STAGES.get(self.path.strip('/'))
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            if length < 0:
+                raise ValueError("Content-Length can't be negative")
+
+        # Without the body's length, there's no telling where the next request starts
+        except ValueError as error:
+            self.close_connection = True
+            self.respond(HTTPStatus.BAD_REQUEST, {'error': f"Bad Content-Length: {error}"})
+            return
+
+        # The body must always be read, or it would be mistaken for the start of the next request
+        body = self.rfile.read(length)
+
+        if handler is None:
+            self.respond(HTTPStatus.NOT_FOUND,
+                         {'error': f"Unknown stage \"{self.path}\". Use 1 of: {', '.join(STAGES)}"})
+            return
+
+        try:
+            payload = json.loads(body or b'{}')
+            if not isinstance(payload, dict):
+                raise ValueError("The request body must be a JSON object")
+
+            with PIPELINE_LOCK:
+                outputs = handler(payload)
+
+        except (ValueError, TypeError) as error:
+            self.respond(HTTPStatus.BAD_REQUEST, {'error': str(error)})
+            return
+
+        # Data the server needs is missing, like the Punkt model NLTK's tokenizer loads
+        except LookupError as error:
+            self.respond(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(error).strip()})
+            return
+
+        self.respond(HTTPStatus.OK, {'outputs': outputs})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Logging every request to the terminal would take longer than answering most of them
+        pass
+
+
+class UnixRequestHandler(RequestHandler):
+    """Answers the same requests as `RequestHandler`, over a Unix socket"""
+
+    # Unix sockets have no Nagle's algorithm to disable
+    disable_nagle_algorithm = False
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves HTTP over a Unix socket, handling each connection in its own thread"""
+
+    daemon_threads = True
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """An `HTTPConnection` to a server listening on a Unix socket, for use with `call()`"""
+
+    def __init__(self, socket_path: Union[str, Path], timeout: Optional[float] = None):
+        """
+        :param socket_path: Where the server's socket is
+        :param timeout: How long to wait on the socket, in seconds. Waits forever if not given
+        """
+
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = str(socket_path)
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def call(connection: HTTPConnection, stage: str, inputs: List, **options: Any) -> List:
+    """
+    Send a request to a running server, reusing the given connection
+
+    :param connection: An open connection to the server. An `HTTPConnection`, or a `UnixHTTPConnection`
+    :param stage: Which stage to run. One of `STAGES`
+    :param inputs: What to run it on
+    :param options: Anything else the stage accepts, like `engine` or `emit`
+    :return: The stage's output for each input
+    """
+
+    connection.request('POST', f"/{stage}", json.dumps({'inputs': inputs, **options}),
+                       {'Content-Type': 'application/json'})
+
+    response = connection.getresponse()
+    body = json.loads(response.read())
+
+    if response.status != HTTPStatus.OK:
+        raise ValueError(body['error'])
+
+    return body['outputs']
+
+
+def warm_up(tokenizer_engine: str, cache_size: Optional[int] = None) -> None:
+    """
+    Load everything requests need up front, like the tokenizer's models and the default stopwords, so the first
+    request is as fast as the rest
+
+    :param tokenizer_engine: Which tokenizer engine the pipeline uses
+    :param cache_size: The most distinct tokens to remember stems and the pipeline's results for. Unbounded if not
+        given
+    """
+
+    global DEFAULT_ENGINE
+
+    DEFAULT_ENGINE = Pipeline.TOKENIZER_ENGINE = tokenizer_engine
+
+    # A server runs for as long as it is left to, and clients can send any number of distinct tokens
+    STEM_CACHE.limit(cache_size)
+    Pipeline.FUSED_MEMO_SIZE = cache_size
+    Pipeline.BATCH_PASSES.clear()
+
+    Pipeline.run_batch(["Warming up the pipeline's tokenizer, stemmer and stopwords."])
+
+
+def make_server(host: str = '127.0.0.1', port: int = 8021,
+                socket_path: Optional[Path] = None) -> Union[ThreadingHTTPServer, UnixHTTPServer]:
+    """
+    :param host: The address to listen on over HTTP
+    :param port: The port to listen on over HTTP. 0 picks any free port
+    :param socket_path: Listen on this Unix socket instead of over TCP, if given
+    :return: A server, ready to `serve_forever()`
+    """
+
+    if socket_path is None:
+        return ThreadingHTTPServer((host, port), RequestHandler)
+
+    # A socket left behind by a server that didn't shut down cleanly would stop this one from starting
+    if socket_path.is_socket():
+        socket_path.unlink()
+
+    return UnixHTTPServer(str(socket_path), UnixRequestHandler)
+
+
+@server_app.command(options_metavar='[--help] [--host <ADDRESS>] [--port <NUMBER>] [--socket <path.sock>] [--tokenizer <ENGINE>] [--stem-cache <cache.json>] [--stem-cache-size <NUMBER>]',
+                    epilog="Thanks for using my data pipeline! :boom:",
+                    help="""Run the pipeline as a long-running server, so its models and stopwords stay loaded.
+
+                    [not dim]
+                    Every other command pays the cost of importing NLTK and loading its models each time it runs.
+                    The server pays it once at startup, then answers JSON requests over HTTP, or over a Unix socket
+                    with [bold yellow]--socket[/], in milliseconds.
+
+                    Each request is a [bold yellow]POST[/] to 1 of [bold yellow]/tokenize[/], [bold yellow]/lowercase[/],
+                    [bold yellow]/stem[/], [bold yellow]/remove_stopwords[/] or [bold yellow]/pipeline[/], with a body
+                    like [bold yellow]{"inputs": [...]}[/]. Every input in a request is processed as 1 batch, and the
+                    response looks like [bold yellow]{"outputs": [...]}[/], with 1 output per input.
+
+                    [bold yellow]/tokenize[/] and [bold yellow]/pipeline[/] take texts. The others take lists of tokens.
+                    [bold yellow]/tokenize[/] also accepts an [bold yellow]"engine"[/],
+                    [bold yellow]/remove_stopwords[/] a list of [bold yellow]"stopwords"[/] files, and
+                    [bold yellow]/pipeline[/] a list of steps to [bold yellow]"emit"[/].
+
+                    Stems, and what the pipeline makes of each distinct token, are remembered between requests. By
+                    default they are kept forever, so memory grows with every distinct token clients send. With
+                    [bold yellow]--stem-cache-size[/], at most that many are kept.
+
+                    [bold yellow]Example Usages[/]:
+                    python server.py
+                    python server.py --port 9000 --tokenizer regex
+                    python server.py --socket /tmp/reuters.sock --stem-cache stems.json
+                    python server.py --stem-cache-size 100000
+                    curl -d '{"inputs": ["Some text to tokenize."]}' http://127.0.0.1:8021/tokenize
+                    """)
+def serve(host: Annotated[str, HOST_OPTION] = '127.0.0.1',
+          port: Annotated[int, PORT_OPTION] = 8021,
+          socket_path: Annotated[Optional[Path], SOCKET_OPTION] = None,
+          tokenizer_engine: Annotated[str, TOKENIZER_OPTION] = 'nltk',
+          stem_cache_file: Annotated[Optional[Path], STEM_CACHE_OPTION] = None,
+          stem_cache_size: Annotated[Optional[int], CACHE_SIZE_OPTION] = None) -> None:
+    """
+    Run the pipeline as a server until interrupted
+
+    :param host: The address to listen on over HTTP. Default is 127.0.0.1
+    :param port: The port to listen on over HTTP. Default is 8021
+    :param socket_path: Listen on this Unix socket instead of over TCP, if given
+    :param tokenizer_engine: Which tokenizer engine to use by default. "nltk" or "regex". Default is "nltk"
+    :param stem_cache_file: A file to load known stems from at startup, and save them to at shutdown
+    :param stem_cache_size: The most distinct tokens to remember stems and the pipeline's results for. Unbounded if
+        not given
+    """
+
+    STEM_CACHE.limit(stem_cache_size)
+
+    if stem_cache_file:
+        STEM_CACHE.load(stem_cache_file)
+
+    warm_up(tokenizer_engine, stem_cache_size)
+
+    server = make_server(host, port, socket_path)
+    address = socket_path if socket_path else f"http://{host}:{server.server_address[1]}"
+    rich.print(f"\n[bold green]Serving[/] on {address}. Press Ctrl+C to stop")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+        if socket_path and socket_path.is_socket():
+            socket_path.unlink()
+
+    if stem_cache_file:
+        STEM_CACHE.save(stem_cache_file)
+
+    rich.print(f"\n[bold blue]Stemming cache:[/] {STEM_CACHE.summary()}")
+
+
+if __name__ == '__main__':
+    run_app(server_app)
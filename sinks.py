@@ -0,0 +1,364 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Tuple, Union
+
+import rich
+import typer
+
+from file_writing import write_to_file
+from instrumentation import STATS
+from stages import STAGE_FILES
+
+# Where shards are written, and how big a shard may grow before a new one is started
+SHARD_DIRECTORY = Path("output/shards")
+SHARD_SIZE = 256 * 1024 * 1024
+
+# Shards are written in large blocks rather than a line at a time
+BUFFER_SIZE = 1024 * 1024
+
+
+class DirectorySink:
+    """
+    Writes each step's output for each article to its own file, as `output/articleN/<step file>`
+    """
+
+    def location(self, article_num: int, stage: str) -> Path:
+        """
+        :param article_num: Which article this is
+        :param stage: Which step of the pipeline the output is from
+        :return: Where the output is written
+        """
+
+        return Path(f"article{article_num}/{STAGE_FILES[stage]}")
+
+    def write(self, article_num: int, stage: str, content: Union[str, List[str]]) -> None:
+        """
+        Write a step's output for an article
+
+        :param article_num: Which article this is
+        :param stage: Which step of the pipeline the output is from
+        :param content: The output. A string for the "text" step, and a list of tokens for the others
+        """
+
+        write_to_file(self.location(article_num, stage), content)
+
+    def describe(self, article_num: int, stage: str) -> str:
+        """
+        :return: Where the output of the given article and step is written, for printing
+        """
+
+        return f"{'output' / self.location(article_num, stage)}"
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class ShardSink(ABC):
+    """
+    Appends each step's output for every article to a few large shard files, 1 set of shards per step.
+
+    Every shard has an index file alongside it, holding an (article number, offset, length) triple per article, so any
+    article can be read back without scanning the shard. Each process writes its own shards, so worker processes never
+    share a file.
+    """
+
+    EXTENSION = ''
+
+    def __init__(self, directory: Path = SHARD_DIRECTORY, shard_size: int = SHARD_SIZE):
+        """
+        :param directory: Where to write shards
+        :param shard_size: How many bytes a shard may hold before a new one is started
+        """
+
+        self.directory = directory
+        self.shard_size = shard_size
+
+        # The open shard, its index, its sequence number and how much has been written to it, for each step
+        self.shards: Dict[str, Tuple[BinaryIO, BinaryIO, int, int]] = {}
+
+    @abstractmethod
+    def encode(self, article_num: int, content: Union[str, List[str]]) -> bytes:
+        """
+        :param article_num: Which article this is
+        :param content: The output of a step
+        :return: The bytes to append to the shard for this article
+        """
+
+    def _shard_path(self, stage: str, sequence: int) -> Path:
+        return self.directory / f"{stage}.{os.getpid()}.{sequence:03}{self.EXTENSION}"
+
+    def _open(self, stage: str, sequence: int) -> Tuple[BinaryIO, BinaryIO, int, int]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._shard_path(stage, sequence)
+
+        return (open(path, "ab", buffering=BUFFER_SIZE), open(path.with_suffix(".idx"), "ab", buffering=BUFFER_SIZE),
+                sequence, path.stat().st_size)
+
+    def write(self, article_num: int, stage: str, content: Union[str, List[str]]) -> None:
+        """
+        Append a step's output for an article to that step's current shard
+
+        :param article_num: Which article this is
+        :param stage: Which step of the pipeline the output is from
+        :param content: The output. A string for the "text" step, and a list of tokens for the others
+        """
+
+        data = self.encode(article_num, content)
+
+        shard, index, sequence, size = self.shards.get(stage) or self._open(stage, 0)
+
+        # Start a new shard once the current one is full
+        if size and size + len(data) > self.shard_size:
+            shard.close()
+            index.close()
+            shard, index, sequence, size = self._open(stage, sequence + 1)
+
+        shard.write(data)
+        index.write(array('Q', (article_num, size, len(data))).tobytes())
+        self.shards[stage] = (shard, index, sequence, size + len(data))
+
+        if STATS.enabled:
+            STATS.count('bytes written', len(data))
+
+    def describe(self, article_num: int, stage: str) -> str:
+        """
+        :return: Where the output of the given article and step is written, for printing
+        """
+
+        _, _, sequence, _ = self.shards.get(stage, (None, None, 0, 0))
+        return f"{self._shard_path(stage, sequence)}"
+
+    def flush(self) -> None:
+        """
+        Make sure everything written so far is on disk
+        """
+
+        for shard, index, _, _ in self.shards.values():
+            shard.flush()
+            index.flush()
+
+    def close(self) -> None:
+        """
+        Flush and close all shards
+        """
+
+        for shard, index, _, _ in self.shards.values():
+            shard.close()
+            index.close()
+
+        self.shards = {}
+
+
+class JsonlSink(ShardSink):
+    """
+    Writes shards of JSON lines, each like {"article": 1, "tokens": [...]}, or {"article": 1, "text": "..."}
+    """
+
+    EXTENSION = '.jsonl'
+
+    def encode(self, article_num: int, content: Union[str, List[str]]) -> bytes:
+        key = 'text' if isinstance(content, str) else 'tokens'
+        return (json.dumps({'article': article_num, key: content}, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class BinarySink(ShardSink):
+    """
+    Writes compact shards of raw UTF-8. Tokens are separated by newlines, and articles are only delimited by the index
+    """
+
+    EXTENSION = '.bin'
+
+    def encode(self, article_num: int, content: Union[str, List[str]]) -> bytes:
+        return (content if isinstance(content, str) else '\n'.join(content)).encode('utf-8')
+
+
+# Every available output format
+SINKS = {'dirs': DirectorySink, 'jsonl': JsonlSink, 'binary': BinarySink}
+
+# The sink of each format opened by each process. Forked worker processes inherit their parent's sinks, so they must
+# be told apart from their own
+_OPEN_SINKS: Dict[Tuple[int, str], Union[DirectorySink, ShardSink]] = {}
+
+
+def format_callback(output_format: str) -> str:
+    """
+    A callback function for the Pipeline Typer app, to validate the output format the user asked for.
+
+    :param output_format: The value the user entered for the output format
+    :return: The value, if it was valid
+    """
+
+    if output_format not in SINKS:
+        rich.print(f"\n[red bold]Only the formats[/] {', '.join(SINKS)} [red bold]are permitted[/]\n")
+        raise typer.Exit(1)
+
+    return output_format
+
+
+def get_sink(output_format: str) -> Union[DirectorySink, ShardSink]:
+    """
+    Get this process' sink for the given output format, opening it on first use
+
+    :param output_format: One of the formats in `SINKS`
+    :return: The sink
+    """
+
+    key = (os.getpid(), output_format)
+
+    if key not in _OPEN_SINKS:
+        _OPEN_SINKS[key] = SINKS[output_format]()
+
+    return _OPEN_SINKS[key]
+
+
+def close_sinks() -> None:
+    """
+    Flush and close every sink opened in this process
+    """
+
+    for key in [key for key in _OPEN_SINKS if key[0] == os.getpid()]:
+        _OPEN_SINKS.pop(key).close()
+
+
+def clear_shards(stages: List[str], directory: Path = SHARD_DIRECTORY) -> None:
+    """
+    Remove the shards of the given steps left over from an earlier run, since shards are only ever appended to
+
+    :param stages: Which steps' shards to remove
+    :param directory: Where shards are written
+    """
+
+    for stage in stages:
+        for path in directory.glob(f"{stage}.*"):
+            path.unlink()
+
+
+def trim_shards(stages: List[str], last_article: int, directory: Path = SHARD_DIRECTORY) -> None:
+    """
+    Cut the shards of the given steps back to the articles up to `last_article`, dropping anything an interrupted run
+    wrote after it, including a partly written last article. Each process appends articles to its shards in increasing
+    order, so those are always at the end of a shard
+
+    :param stages: Which steps' shards to trim
+    :param last_article: The last article to keep
+    :param directory: Where shards are written
+    """
+
+    for stage in stages:
+        for index_file in directory.glob(f"{stage}.*.idx"):
+            shard = next((index_file.with_suffix(sink.EXTENSION) for sink in (JsonlSink, BinarySink)
+                          if index_file.with_suffix(sink.EXTENSION).is_file()), None)
+
+            # An index whose shard is gone has nothing left to point into
+            if shard is None:
+                index_file.unlink()
+                continue
+
+            size = shard.stat().st_size
+
+            data = index_file.read_bytes()
+            entries = array('Q')
+            entries.frombytes(data[:len(data) - len(data) % 24])
+
+            # Keep the leading entries for articles up to the last one, as long as their output was fully written
+            kept = 0
+            while kept < len(entries) and entries[kept] <= last_article and entries[kept + 1] + entries[kept + 2] <= size:
+                kept += 3
+
+            if not kept:
+                index_file.unlink()
+                shard.unlink()
+                continue
+
+            os.truncate(index_file, kept * entries.itemsize)
+            os.truncate(shard, entries[kept - 2] + entries[kept - 1])
+
+
+class ShardReader:
+    """
+    Reads a step's output for any article back out of shards, without scanning them.
+
+    Only the small index files are read up front. Each article is then read with a single seek.
+    """
+
+    def __init__(self, stage: str, directory: Path = SHARD_DIRECTORY):
+        """
+        :param stage: Which step of the pipeline to read the output of
+        :param directory: Where the shards were written
+        """
+
+        self.stage = stage
+
+        # Where each article is, as (shard, offset, length)
+        self.locations: Dict[int, Tuple[Path, int, int]] = {}
+
+        for index_file in sorted(directory.glob(f"{stage}.*.idx")):
+            shard = next((index_file.with_suffix(sink.EXTENSION) for sink in (JsonlSink, BinarySink)
+                          if index_file.with_suffix(sink.EXTENSION).is_file()), None)
+
+            # An index whose shard is gone has no output left to read
+            if shard is None:
+                continue
+
+            entries = array('Q')
+            entries.frombytes(index_file.read_bytes())
+
+            for i in range(0, len(entries), 3):
+                self.locations[entries[i]] = (shard, entries[i + 1], entries[i + 2])
+
+        self.files: Dict[Path, BinaryIO] = {}
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __contains__(self, article_num: int) -> bool:
+        return article_num in self.locations
+
+    def articles(self) -> List[int]:
+        """
+        :return: The numbers of all articles in the shards, in order
+        """
+
+        return sorted(self.locations)
+
+    def __getitem__(self, article_num: int) -> Union[str, List[str]]:
+        """
+        Read the output of the given article
+
+        :param article_num: Which article to read
+        :return: A string for the "text" step, and a list of tokens for the others
+        """
+
+        shard, offset, length = self.locations[article_num]
+
+        if shard not in self.files:
+            self.files[shard] = open(shard, "rb")
+
+        file = self.files[shard]
+        file.seek(offset)
+        data = file.read(length).decode('utf-8')
+
+        if shard.suffix == '.jsonl':
+            record = json.loads(data)
+            return record['text'] if 'text' in record else record['tokens']
+
+        if self.stage == 'text':
+            return data
+
+        return data.split('\n') if data else []
+
+    def __iter__(self) -> Iterator[Tuple[int, Union[str, List[str]]]]:
+        for article_num in self.articles():
+            yield article_num, self[article_num]
+
+    def close(self) -> None:
+        for file in self.files.values():
+            file.close()
+
+        self.files = {}
@@ -0,0 +1,342 @@
+# Which steps the pipeline runs, in what order and with what options, declared in a TOML file or built in Python, and
+# a planner that runs adjacent per-token steps as a single pass over the tokens
+
+from array import array
+from itertools import accumulate, compress
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from batching import TokenBatch
+from stem_cache import STEM_CACHE, STEMMERS
+from stopword_index import StopwordIndex, load_stopwords, DEFAULT_STOPWORDS_FILE
+from treebank import ENGINES
+
+# Every operation a stage can run, with the step of the pipeline whose output it produces
+OPERATIONS = {
+    'textualize': 'text',
+    'tokenize': 'tokens',
+    'lowercase': 'lowercase',
+    'stem': 'stems',
+    'remove_stopwords': 'final',
+}
+
+# The operations that work on each token by itself. They can run in any order once articles are tokenized
+PER_TOKEN_OPERATIONS = ('lowercase', 'stem', 'remove_stopwords')
+
+# The options each operation takes, and which values are valid for each
+OPTIONS = {
+    'tokenize': {'engine': tuple(ENGINES)},
+    'stem': {'stemmer': tuple(STEMMERS)},
+    'remove_stopwords': {'stopwords': None},
+}
+
+
+class Stage:
+    """
+    1 step of the pipeline: the operation it runs, and any options it was given. Options it wasn't given are left to
+    whoever runs it, like the pipeline's own command line options.
+    """
+
+    def __init__(self, operation: str, **options):
+        """
+        :param operation: One of `OPERATIONS`
+        :param options: The operation's options. "engine" for tokenize, one of `treebank.ENGINES`. "stemmer" for stem,
+            one of `stem_cache.STEMMERS`. "stopwords" for remove_stopwords, a list of stopwords files
+        :raises ValueError: If the operation or any option isn't valid
+        """
+
+        if operation not in OPERATIONS:
+            raise ValueError(f"\"{operation}\" is not a stage. Stages are: {', '.join(OPERATIONS)}")
+
+        allowed = OPTIONS.get(operation, {})
+
+        for name, value in options.items():
+            if name not in allowed:
+                raise ValueError(f"The {operation} stage has no \"{name}\" option")
+
+            if allowed[name] is not None and value not in allowed[name]:
+                raise ValueError(f"The {operation} stage's {name} must be one of: {', '.join(allowed[name])}")
+
+        if 'stopwords' in options:
+            files = options['stopwords']
+
+            if not isinstance(files, list) or not files or not all(isinstance(file, str) for file in files):
+                raise ValueError("The remove_stopwords stage's stopwords must be a list of files")
+
+            missing = [file for file in files if not Path(file).is_file()]
+            if missing:
+                raise ValueError(f"Stopwords files not found: {', '.join(missing)}")
+
+        self.operation = operation
+        self.options = options
+
+    @property
+    def output(self) -> str:
+        """The step of the pipeline whose output this stage produces, as in `stages.STAGE_FILES`"""
+
+        return OPERATIONS[self.operation]
+
+    def __repr__(self) -> str:
+        options = ''.join(f", {name}={value!r}" for name, value in self.options.items())
+        return f"Stage({self.operation!r}{options})"
+
+
+class StageGraph:
+    """
+    The steps of the pipeline, in the order they run.
+
+    Every graph starts by textualizing then tokenizing each article. The per-token steps, lowercasing, stemming and
+    stopword removal, follow in any order, and any of them can be left out. Each step runs at most once, so its output
+    is always written to the same file.
+    """
+
+    def __init__(self, stages: Sequence[Stage]):
+        """
+        :param stages: The stages, in the order they run
+        :raises ValueError: If the stages can't run in that order
+        """
+
+        operations = [stage.operation for stage in stages]
+
+        if operations[:2] != ['textualize', 'tokenize']:
+            raise ValueError("The first stages must be textualize, then tokenize")
+
+        repeated = sorted({operation for operation in operations if operations.count(operation) > 1})
+        if repeated:
+            raise ValueError(f"Each stage can only run once, but these run more than once: {', '.join(repeated)}")
+
+        self.stages = list(stages)
+
+    @property
+    def outputs(self) -> List[str]:
+        """The step each stage produces the output of, in the order they run"""
+
+        return [stage.output for stage in self.stages]
+
+    @property
+    def final(self) -> str:
+        """The step whose output is the pipeline's final tokens, which is the last one to run"""
+
+        return self.stages[-1].output
+
+    def option(self, operation: str, name: str, default=None):
+        """
+        :param operation: Which operation's option to look up
+        :param name: The option
+        :param default: What to use if the stage wasn't given the option, or isn't in the graph
+        :return: The option's value
+        """
+
+        for stage in self.stages:
+            if stage.operation == operation:
+                return stage.options.get(name, default)
+
+        return default
+
+    def plan(self, needed: Iterable[str]) -> List[List[Stage]]:
+        """
+        Group the per-token stages into the passes over the tokens that will run them. Stages run in 1 pass unless a
+        stage's output is needed, which ends the pass. Stages after the last needed output aren't run at all
+
+        :param needed: The steps whose output is needed, i.e. to write to file or to index
+        :return: The stages of each pass, in order
+        """
+
+        needed = set(needed)
+        passes: List[List[Stage]] = []
+        current: List[Stage] = []
+
+        for stage in self.stages[2:]:
+            current.append(stage)
+
+            if stage.output in needed:
+                passes.append(current)
+                current = []
+
+        return passes
+
+    def __repr__(self) -> str:
+        return f"StageGraph({self.stages!r})"
+
+
+def load_graph(graph_file: Path) -> StageGraph:
+    """
+    Read a stage graph from a TOML file, with 1 [[stage]] table per stage, in the order they run. Each table names its
+    operation with "run", and can set that operation's options:
+
+        [[stage]]
+        run = "textualize"
+
+        [[stage]]
+        run = "tokenize"
+        engine = "regex"
+
+        [[stage]]
+        run = "lowercase"
+
+        [[stage]]
+        run = "remove_stopwords"
+        stopwords = ["Stopwords-used-for-output.txt"]
+
+        [[stage]]
+        run = "stem"
+        stemmer = "snowball"
+
+    :param graph_file: Where the stage graph is
+    :return: The stage graph
+    :raises ValueError: If the file isn't valid TOML, or doesn't describe a valid stage graph, or there is nothing to
+        read TOML with
+    """
+
+    # Only in the standard library from Python 3.11, so only needed when a graph is read from file
+    try:
+        import tomllib
+    except ImportError:
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ValueError("reading a stage graph needs Python 3.11 or newer, or the tomli package: "
+                             "pip install tomli") from None
+
+    with open(graph_file, "rb") as file:
+        spec = tomllib.load(file)
+
+    tables = spec.get('stage')
+    if not isinstance(tables, list) or not tables:
+        raise ValueError("A stage graph needs a [[stage]] table for each stage")
+
+    stages = []
+
+    for number, table in enumerate(tables, start=1):
+        options = dict(table)
+        operation = options.pop('run', None)
+
+        if not isinstance(operation, str):
+            raise ValueError(f"Stage {number} needs \"run\", the name of its operation")
+
+        stages.append(Stage(operation, **options))
+
+    return StageGraph(stages)
+
+
+class FusedStages:
+    """
+    Runs several per-token stages over a whole batch as 1 pass, instead of 1 pass per stage.
+
+    Each stage's result for a token only depends on the token, so the combined result of every stage is worked out
+    once per distinct token and remembered. Each pass over a batch is then 2 lookups per token, however many stages
+    there are: whether the token is kept, and what it becomes.
+    """
+
+    def __init__(self, stages: Sequence[Stage], stopwords_files: Sequence[Path] = (DEFAULT_STOPWORDS_FILE,),
+                 max_size: Optional[int] = None):
+        """
+        :param stages: The stages to run, in order. All of them must be in `PER_TOKEN_OPERATIONS`. Tokens are stemmed
+            with the shared `STEM_CACHE`, whichever stemmer it uses
+        :param stopwords_files: Which stopwords to remove, if the remove_stopwords stage wasn't given any
+        :param max_size: The most distinct tokens to remember. Once there would be more, every token is forgotten and
+            learned again as it comes up. Unbounded if not given
+        """
+
+        self.max_size = max_size
+
+        self.operations = [stage.operation for stage in stages]
+        self.name = '+'.join(self.operations)
+
+        options = {stage.operation: stage.options for stage in stages}
+        self.stopwords_files = tuple(map(Path, options.get('remove_stopwords', {}).get('stopwords', stopwords_files)))
+
+        # What each distinct token becomes, and whether it is kept at all
+        self.results: Dict[str, str] = {}
+        self.keep: Dict[str, bool] = {}
+        self.stopword_index: Optional[StopwordIndex] = None
+
+    def _learn(self, tokens: List[str], stopword_index: Optional[StopwordIndex]) -> int:
+        """
+        Run every stage over the given new tokens, and remember what each becomes
+
+        :param tokens: Distinct tokens not seen before
+        :param stopword_index: The stopwords to remove, if any
+        :return: How many tokens were looked up in `STEM_CACHE`
+        """
+
+        stemmed = 0
+
+        # Each token's position in `tokens`, for the tokens still kept, and what each has become so far
+        kept = list(range(len(tokens)))
+        current = tokens
+
+        for operation in self.operations:
+            if operation == 'lowercase':
+                current = [token.lower() for token in current]
+
+            elif operation == 'stem':
+                current = STEM_CACHE.stem_tokens(current)
+                stemmed = len(current)
+
+            else:
+                stopwords = stopword_index.stopwords
+                mask = [token not in stopwords for token in current]
+                kept, current = list(compress(kept, mask)), list(compress(current, mask))
+
+        self.keep.update(dict.fromkeys(tokens, False))
+        self.keep.update((tokens[position], True) for position in kept)
+        self.results.update((tokens[position], result) for position, result in zip(kept, current))
+
+        return stemmed
+
+    def __call__(self, batch: TokenBatch) -> TokenBatch:
+        """
+        :param batch: The tokens of several articles
+        :return: A batch of the same articles, with every stage applied
+        """
+
+        stopword_index = load_stopwords(*self.stopwords_files) if 'remove_stopwords' in self.operations else None
+
+        # The stopwords changed, so what was learned is stale
+        if stopword_index is not self.stopword_index:
+            self.results, self.keep = {}, {}
+            self.stopword_index = stopword_index
+
+        tokens, keep = batch.tokens, self.keep
+        stemmed = 0
+
+        try:
+            mask = list(map(keep.__getitem__, tokens))
+
+        # Only tokens not seen before need working out, after which every token is known
+        except KeyError:
+            new_tokens = [token for token in dict.fromkeys(tokens) if token not in keep]
+
+            # Start afresh rather than grow past the limit. The batch's own tokens are all learned again
+            if self.max_size and len(keep) + len(new_tokens) > self.max_size:
+                self.results, self.keep = {}, {}
+                keep, new_tokens = self.keep, list(dict.fromkeys(tokens))
+
+            stemmed = self._learn(new_tokens, stopword_index)
+            mask = list(map(keep.__getitem__, tokens))
+
+        results = list(map(self.results.__getitem__, compress(tokens, mask)))
+
+        # A batch with more distinct tokens than the limit is too big to remember, once it's worked out
+        if self.max_size and len(keep) > self.max_size:
+            self.results, self.keep = {}, {}
+
+        # Every token that reaches the stem stage counts as a cache lookup, as it would stemmed on its own. Only the
+        # new ones were actually looked up, and the rest are hits
+        if 'stem' in self.operations:
+            operations = self.operations
+            reached = (len(results) if 'remove_stopwords' in operations
+                       and operations.index('remove_stopwords') < operations.index('stem') else len(tokens))
+            STEM_CACHE.hits += reached - stemmed
+
+        if 'remove_stopwords' not in self.operations:
+            return batch.with_tokens(results)
+
+        # How many tokens are kept before each position, which is where each article now starts
+        kept_before = list(accumulate(mask, initial=0))
+        return TokenBatch(results, array('Q', map(kept_before.__getitem__, batch.offsets)))
+
+
+# The pipeline's steps as they have always run
+DEFAULT_GRAPH = StageGraph([Stage(operation) for operation in OPERATIONS])
@@ -0,0 +1,75 @@
+# Each step of the pipeline as a plain function, so it can be used as a library. Nothing here imports Typer, rich, NLTK
+# or BeautifulSoup. NLTK is only imported once something is tokenized or stemmed with it
+
+from pathlib import Path
+from typing import List
+
+from normalizer import NORMALIZER
+from stem_cache import STEM_CACHE
+from stopword_index import load_stopwords, DEFAULT_STOPWORDS_FILE
+from treebank import ENGINES
+
+# The file each step of the pipeline writes its output to, for each article, in the order the steps run
+STAGE_FILES = {
+    'text': "1. Initial-text.txt",
+    'tokens': "2. Tokenizer-output.txt",
+    'lowercase': "3. Lowercased-output.txt",
+    'stems': "4. Stemmed-output.txt",
+    'final': "5. No-stopword-output.txt",
+}
+
+
+def clean_text(article) -> str:
+    """
+    Take the given article (of type bs4.element.Tag) and turn it into normal text, without writing anything to file
+
+    :param article: The article as a bs4.element.Tag, or as text already produced by `stream_texts()`
+    :return: The 'stringified' version of the article
+    """
+
+    # Bring all children together into 1 string. Streamed articles have already been joined
+    if isinstance(article, str):
+        text = article
+    else:
+        text = '\n'.join(child.text for child in article.children)
+
+    # Clean up the text, as found in experiment. See `Normalizer` for each rule applied
+    return NORMALIZER.normalize(text)
+
+
+def tokenize_text(text: str, engine: str = 'nltk') -> List[str]:
+    """
+    :param text: The cleaned text of an article
+    :param engine: Which tokenizer engine to use. One of `treebank.ENGINES`
+    :return: The tokens of the text
+    """
+
+    return ENGINES[engine](text)
+
+
+def lowercase_tokens(tokens: List[str]) -> List[str]:
+    """
+    :param tokens: The tokens of an article
+    :return: Each token, lowercased
+    """
+
+    return [token.lower() for token in tokens]
+
+
+def stem_tokens(tokens: List[str]) -> List[str]:
+    """
+    :param tokens: The lowercased tokens of an article
+    :return: Each token, stemmed with the shared Porter stemming cache
+    """
+
+    return STEM_CACHE.stem_tokens(tokens)
+
+
+def filter_stopwords(tokens: List[str], *stopwords_files: Path) -> List[str]:
+    """
+    :param tokens: The stemmed tokens of an article
+    :param stopwords_files: The files where stopwords are defined. Defaults to `Stopwords-used-for-output.txt`
+    :return: The tokens that aren't stopwords
+    """
+
+    return load_stopwords(*(stopwords_files or (DEFAULT_STOPWORDS_FILE,))).filter(tokens)
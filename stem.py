@@ -4,34 +4,73 @@ from typing_extensions import Annotated
 
 import rich
 import typer
-from typer import rich_utils
-
-from nltk import PorterStemmer
 
+from batching import TokenBatch
+from cli import run_app, stream_stage, JSONL_OPTION, BATCH_SIZE_OPTION
 from file_writing import write_to_file
-
-# Define certain colors and styles
-rich_utils.OPTIONS_PANEL_TITLE = "[not dim]Options"
-rich_utils.ARGUMENTS_PANEL_TITLE = "[not dim]Arguments"
-rich_utils.STYLE_REQUIRED_LONG = 'not dim red'
-rich_utils.STYLE_OPTION_DEFAULT = 'not dim white'
+from stem_cache import STEM_CACHE, STEMMERS
+from streaming import STDIN, STREAM_BATCH_SIZE
 
 # Define stemmer app
 stemmer = typer.Typer(add_completion=False, rich_markup_mode='rich', no_args_is_help=True)
 
+
+def stemmer_callback(engine: Optional[str]) -> Optional[str]:
+    """
+    A callback function for Typer apps, to validate which stemmer the user asked for.
+
+    :param engine: The value the user entered for the stemmer
+    :return: The value, if it was valid
+    """
+
+    if engine is not None and engine not in STEMMERS:
+        rich.print(f"\n[red bold]Only the stemmers[/] {', '.join(STEMMERS)} [red bold]are permitted[/]\n")
+        raise typer.Exit(1)
+
+    # The lemmatizer looks tokens up in WordNet, which NLTK doesn't come with
+    if engine == 'wordnet':
+        import nltk
+
+        try:
+            nltk.data.find('corpora/wordnet')
+        except LookupError:
+            rich.print("\n[red bold]The wordnet stemmer needs NLTK's WordNet data:[/] python -m nltk.downloader wordnet\n")
+            raise typer.Exit(1)
+
+    return engine
+
+
 # Define certain app arguments and options. Makes later code cleaner
 ARTICLE_NUM_OPTION = typer.Option(help="Which article in the corpus this is. Used in logging.", hidden=True)
 FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to save this result to.")
+CACHE_FILE_OPTION = typer.Option("--cache-file", "-c", help="Specify an optional file to load previously stemmed tokens "
+                                                            "from, and save newly stemmed tokens to.")
+STEMMER_OPTION = typer.Option("--stemmer", "-s", callback=stemmer_callback,
+                              help=f"Which stemmer to use. One of {', '.join(STEMMERS)}.")
 
 
-@stemmer.command(short_help='Stems all tokens according to the Porter stemmer.', no_args_is_help=True,
-                 epilog="Thanks for using my stemmer! :boom:", options_metavar='[--help] [--file <dir/file.txt>]',
-                 help="""Stems all tokens according to the Porter stemmer.
+def stem_batch(articles: List[List[str]]) -> List[List[str]]:
+    """
+    :param articles: The tokens of several articles
+    :return: The tokens of each article, stemmed
+    """
+
+    batch = TokenBatch.from_articles(articles)
+    return batch.with_tokens(STEM_CACHE.stem_tokens(batch.tokens)).articles()
+
+
+@stemmer.command(short_help='Stems all tokens according to the Porter stemmer, or another stemmer.', no_args_is_help=True,
+                 epilog="Thanks for using my stemmer! :boom:", options_metavar='[--help] [--file <dir/file.txt>] [--cache-file <cache.json>] [--stemmer <STEMMER>] [--jsonl]',
+                 help="""Stems all tokens according to the Porter stemmer, or another stemmer.
                  
                  [not dim]
                  The arguments to this command are a list of tokens. These tokens are all stemmed using
                  NLTKs built-in Porter stemmer.
                  
+                 With [bold yellow]--stemmer[/], NLTK's [bold yellow]snowball[/] (Porter2) or
+                 [bold yellow]lancaster[/] stemmer can be used instead, or its [bold yellow]wordnet[/] lemmatizer,
+                 which only ever gives real words but is far slower.
+                 
                  It is possible to specify a custom file to save results to. Files should always look like: [bold yellow]<nested/directories/file.txt>[/].
                  Regardless of the nesting of directories and filename you specify, results will always be saved to the [bold yellow]output/[/] directory.
                    
@@ -42,24 +81,44 @@ FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to sav
                  will save to [bold yellow]output/my_article/stem.txt[/]. If no file is specified, it will save to
                  [bold yellow]output/custom_article/3. Stemmed-output.txt[/]
                  
+                 Each distinct token is only stemmed once. With [bold yellow]--cache-file[/], known stems are loaded
+                 from and saved to the given file, so later runs can skip stemming entirely.
+
+                 With [bold yellow]-[/] as the only token, lines are read from stdin and each is written to stdout
+                 once stemmed, instead of to a file. Each line is space-separated tokens, or a JSON list of tokens with
+                 [bold yellow]--jsonl[/]. This chains with the other steps, without any temporary files.
+                                  
                  [bold yellow]Example Usages[/]:
                  python stem.py interesting tokens are sometimes longer than others
                  python stem.py interesting tokens are sometimes longer than others --file my_article/stem.txt
+                 python stem.py interesting tokens are sometimes longer than others --cache-file stems.json
+                 python stem.py interesting tokens are sometimes longer than others --stemmer lancaster
+                 python lowercase.py - < tokens.txt | python stem.py - --cache-file stems.json
                  """)
 def stem(
         tokens: Annotated[List[str], typer.Argument(help="The tokens to use.", show_default=False)],
         article_num: Annotated[Optional[int], ARTICLE_NUM_OPTION] = 0,
         file_path: Annotated[Optional[Path], FILE_OPTION] = None,
-        pipeline: Annotated[bool, typer.Option(hidden=True)] = False
+        cache_file: Annotated[Optional[Path], CACHE_FILE_OPTION] = None,
+        engine: Annotated[Optional[str], STEMMER_OPTION] = None,
+        pipeline: Annotated[bool, typer.Option(hidden=True)] = False,
+        jsonl: Annotated[bool, JSONL_OPTION] = False,
+        batch_size: Annotated[int, BATCH_SIZE_OPTION] = STREAM_BATCH_SIZE
 ) -> List[str]:
     """
-    Stem the given list of tokens for an article with the Porter stemmer
+    Stem the given list of tokens for an article with the Porter stemmer, or another of the `STEMMERS`
 
     :param tokens: The list of tokens to stem
     :param article_num: Which article this is
     :param file_path: A file path to save the file to. Must take form of directory/file.txt
+    :param cache_file: A file to load known stems from before stemming, and save them to after
+    :param engine: Which of the `STEMMERS` to use. Keeps whichever `STEM_CACHE` already uses if not given, which is
+        "porter" unless something else chose another
     :param pipeline: Whether this command is running as part of the pipeline. Changes file writing
-    :return: The stemmed version of the list of tokens, stemmed using the Porter stemmer
+    :param jsonl: When streaming, whether each line is a JSON record
+    :param batch_size: When streaming, how many lines to process at a time
+    :return: The stemmed version of the list of tokens. Empty when streaming, as the
+        results are written to stdout instead
     """
 
     # Ensure list of tokens is not blank
@@ -67,11 +126,27 @@ def stem(
         rich.print("\n[red bold]Empty list of tokens is not permitted.")
         raise typer.Exit(1)
 
-    # Create a default Porter stemmer
-    STEMMER = PorterStemmer()
+    # Only stems from the same stemmer are loaded from the cache file, so the stemmer must be chosen first
+    if engine is not None:
+        STEM_CACHE.use(engine)
 
-    # Stem each token in the given list of tokens with the Porter stemmer
-    STEMMED: List[str] = [STEMMER.stem(token) for token in tokens]
+    if cache_file:
+        STEM_CACHE.load(cache_file)
+
+    # Stem each line of stdin, instead of the given tokens. Every batch shares the same stemming cache
+    if tokens == [STDIN]:
+        stream_stage(stem_batch, 'tokens', jsonl, batch_size)
+
+        if cache_file:
+            STEM_CACHE.save(cache_file)
+
+        return []
+
+    # Stem each token in the given list of tokens, reusing any stems already known
+    STEMMED: List[str] = STEM_CACHE.stem_tokens(tokens)
+
+    if cache_file:
+        STEM_CACHE.save(cache_file)
 
     # If this is running as the pipeline, this will be the 4th file written
     if pipeline:
@@ -99,8 +174,11 @@ def stem(
         # When not in pipeline, print output to screen
         rich.print(f"\n[bold blue]Output:[/]\n{' '.join(t for t in STEMMED)}")
 
+        if cache_file:
+            rich.print(f"\n[bold blue]Stemming cache:[/] {STEM_CACHE.summary()}")
+
     return STEMMED
 
 
 if __name__ == '__main__':
-    stemmer()
+    run_app(stemmer)
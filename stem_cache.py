@@ -0,0 +1,256 @@
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class LazyStemmer:
+    """
+    Stands in for an NLTK stemmer, and only creates it the first time a token needs stemming. Importing NLTK takes
+    longer than everything else the pipeline imports put together, and a warm stem cache may never need it at all.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], object]):
+        """
+        :param name: The name of the stemmer `factory` creates, i.e. "PorterStemmer"
+        :param factory: Creates the stemmer
+        """
+
+        self.name = name
+        self.factory = factory
+
+    def stem(self, token: str) -> str:
+        """
+        :param token: The token to stem
+        :return: The stemmed token
+        """
+
+        # From now on, calls go straight to the real stemmer
+        self.stem = self.factory().stem
+        return self.stem(token)
+
+
+class StemCache:
+    """
+    Remembers the stem of every token it has seen, so each distinct token is only ever stemmed once.
+
+    Reuters vocabulary is heavily skewed, so a few thousand distinct tokens make up most of the corpus. By default the
+    cache is unbounded. Given a `max_size`, it instead keeps only the most recently used stems.
+    """
+
+    def __init__(self, engine, max_size: Optional[int] = None):
+        """
+        :param engine: Any object with a `stem(token)` method, like NLTKs `PorterStemmer`
+        :param max_size: The most stems to keep. Unbounded if not given
+        """
+
+        self.engine = engine
+        self.max_size = max_size
+        self.stems: Dict[str, str] = OrderedDict() if max_size else {}
+        self.hits = 0
+        self.misses = 0
+
+        # Stems added since the last call to `drain()`. Lets worker processes send their new stems back
+        self.added: Dict[str, str] = {}
+
+        # The stems of every other stemmer this cache has used, by the stemmer's name
+        self.others: Dict[str, Dict[str, str]] = {}
+
+    @property
+    def name(self) -> str:
+        """The name of the wrapped stemmer. Persisted caches are only reused by the same stemmer"""
+
+        return self.engine.name if isinstance(self.engine, LazyStemmer) else type(self.engine).__name__
+
+    def use(self, stemmer: str) -> None:
+        """
+        Switch to one of the `STEMMERS`. Each stemmer keeps its own stems, so switching back to one finds its stems
+        still there, and stems from different stemmers are never mixed
+
+        :param stemmer: The name of the stemmer in `STEMMERS`
+        """
+
+        engine = STEMMERS[stemmer]
+        if engine is self.engine:
+            return
+
+        self.others[self.name] = self.stems
+        self.engine = engine
+        self.stems = self.others.pop(self.name, OrderedDict() if self.max_size else {})
+        self.added = {}
+
+    def stem_tokens(self, tokens: List[str]) -> List[str]:
+        """
+        Stem each of the given tokens, only running the stemmer for tokens not seen before
+
+        :param tokens: The list of tokens to stem
+        :return: The stemmed version of the list of tokens
+        """
+
+        stems = self.stems
+        misses_before = self.misses
+        result: List[str] = []
+
+        for token in tokens:
+            stemmed = stems.get(token)
+
+            if stemmed is None:
+                stemmed = self.engine.stem(token)
+                stems[token] = stemmed
+                self.added[token] = stemmed
+                self.misses += 1
+
+                # Evict the least recently used stem once the cache is full
+                if self.max_size and len(stems) > self.max_size:
+                    stems.popitem(last=False)
+
+            elif self.max_size:
+                stems.move_to_end(token)
+
+            result.append(stemmed)
+
+        self.hits += len(tokens) - (self.misses - misses_before)
+        return result
+
+    def drain(self) -> Tuple[Dict[str, str], int, int]:
+        """
+        Take everything this cache learned since the last call, and reset those counts
+
+        :return: The newly added stems, the number of hits and the number of misses
+        """
+
+        delta = (self.added, self.hits, self.misses)
+        self.added, self.hits, self.misses = {}, 0, 0
+        return delta
+
+    def merge(self, delta: Tuple[Dict[str, str], int, int]) -> None:
+        """
+        Take in what another cache learned, as returned by its `drain()`
+
+        :param delta: The newly added stems, the number of hits and the number of misses
+        """
+
+        added, hits, misses = delta
+        self.stems.update(added)
+        self.added.update(added)
+        self.hits += hits
+        self.misses += misses
+
+    def load(self, cache_file: Path) -> None:
+        """
+        Load stems previously saved with `save()`. Missing files and files saved by a different stemmer are ignored
+
+        :param cache_file: Where the stems were saved
+        """
+
+        if not cache_file.is_file():
+            return
+
+        with open(cache_file, "r", encoding="utf-8") as file:
+            saved = json.load(file)
+
+        if saved.get("stemmer") == self.name:
+            self.stems.update(saved["stems"])
+            self.limit(self.max_size)
+
+    def limit(self, max_size: Optional[int]) -> None:
+        """
+        Keep at most the given number of stems from now on, dropping the least recently used ones beyond it
+
+        :param max_size: The most stems to keep. Unbounded if not given
+        """
+
+        self.max_size = max_size
+
+        if max_size:
+            if not isinstance(self.stems, OrderedDict):
+                self.stems = OrderedDict(self.stems)
+
+            while len(self.stems) > max_size:
+                self.stems.popitem(last=False)
+
+    def save(self, cache_file: Path) -> None:
+        """
+        Save every known stem, so later runs can skip stemming entirely
+
+        :param cache_file: Where to save the stems
+        """
+
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(cache_file, "w", encoding="utf-8") as file:
+            json.dump({"stemmer": self.name, "stems": self.stems}, file)
+
+    def summary(self) -> str:
+        """
+        :return: A short description of how effective the cache has been
+        """
+
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0
+
+        return (f"[bold green]{self.hits}[/] hits, [bold green]{self.misses}[/] misses "
+                f"([bold green]{rate:.1%}[/] hit rate, [bold green]{len(self.stems)}[/] distinct tokens)")
+
+
+class WordNetStemmer:
+    """
+    Gives NLTK's `WordNetLemmatizer` the same `stem(token)` method as its stemmers. Lemmatizing looks each token up in
+    WordNet, so it is far slower than stemming, but only ever gives real words
+    """
+
+    def __init__(self):
+        from nltk.stem import WordNetLemmatizer
+
+        self.lemmatize = WordNetLemmatizer().lemmatize
+
+    def stem(self, token: str) -> str:
+        """
+        :param token: The token to lemmatize, as a noun
+        :return: The token's lemma
+        """
+
+        return self.lemmatize(token)
+
+
+def porter_stemmer():
+    """
+    :return: A new NLTK `PorterStemmer`
+    """
+
+    from nltk.stem.porter import PorterStemmer
+
+    return PorterStemmer()
+
+
+def snowball_stemmer():
+    """
+    :return: A new NLTK `SnowballStemmer` for English, also known as Porter2
+    """
+
+    from nltk.stem.snowball import SnowballStemmer
+
+    return SnowballStemmer('english')
+
+
+def lancaster_stemmer():
+    """
+    :return: A new NLTK `LancasterStemmer`. The most aggressive, cutting tokens down the furthest
+    """
+
+    from nltk.stem.lancaster import LancasterStemmer
+
+    return LancasterStemmer()
+
+
+# The stemmers the stem step can use, by name. Each is created at most once per process, the first time it is needed
+STEMMERS: Dict[str, LazyStemmer] = {
+    'porter': LazyStemmer('PorterStemmer', porter_stemmer),
+    'snowball': LazyStemmer('SnowballStemmer', snowball_stemmer),
+    'lancaster': LazyStemmer('LancasterStemmer', lancaster_stemmer),
+    'wordnet': LazyStemmer('WordNetStemmer', WordNetStemmer),
+}
+
+# Stems with the Porter stemmer by default, and is shared by every call, whether from the pipeline or the CLI. Switch
+# stemmer with `STEM_CACHE.use()`
+STEM_CACHE = StemCache(STEMMERS['porter'])
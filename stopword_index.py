@@ -0,0 +1,81 @@
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Tuple
+
+# The stopwords file used when none is specified
+DEFAULT_STOPWORDS_FILE = Path("Stopwords-used-for-output.txt")
+
+
+class StopwordIndex:
+    """
+    The combined stopwords of 1 or more stopword files, held in a frozenset for constant-time lookups.
+
+    Remembers the modification time of each file it was built from, so callers can tell when it has gone stale.
+    """
+
+    def __init__(self, stopwords_files: Tuple[Path, ...]):
+        """
+        :param stopwords_files: The files where stopwords are defined, 1 per line
+        """
+
+        self.files = stopwords_files
+        self.versions = self._versions()
+
+        words = set()
+        for stopwords_file in stopwords_files:
+            with open(stopwords_file, "r") as file:
+                words.update(word.strip() for word in file.readlines())
+
+        self.stopwords: FrozenSet[str] = frozenset(words)
+
+    def _versions(self) -> Tuple[int, ...]:
+        """
+        :return: The modification time of each stopwords file
+        """
+
+        return tuple(stopwords_file.stat().st_mtime_ns for stopwords_file in self.files)
+
+    def is_current(self) -> bool:
+        """
+        :return: Whether none of the stopwords files have changed since this index was built
+        """
+
+        try:
+            return self._versions() == self.versions
+        except FileNotFoundError:
+            return False
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.stopwords
+
+    def filter(self, tokens: List[str]) -> List[str]:
+        """
+        Remove all stopwords from the given tokens
+
+        :param tokens: The list of tokens to filter stopwords out of
+        :return: The tokens that are not stopwords, in their original order
+        """
+
+        stopwords = self.stopwords
+        return [word for word in tokens if word not in stopwords]
+
+
+# Every stopword index built in this process, keyed by the files it was built from
+_INDEXES: Dict[Tuple[Path, ...], StopwordIndex] = {}
+
+
+def load_stopwords(*stopwords_files: Path) -> StopwordIndex:
+    """
+    Get the stopword index for the given stopword files. Each index is only built once per process, and only rebuilt
+    if one of its files changes
+
+    :param stopwords_files: The files where stopwords are defined, 1 per line
+    :return: The combined stopwords of all the given files
+    """
+
+    key = tuple(Path(stopwords_file) for stopwords_file in stopwords_files)
+    index = _INDEXES.get(key)
+
+    if index is None or not index.is_current():
+        index = _INDEXES[key] = StopwordIndex(key)
+
+    return index
@@ -0,0 +1,99 @@
+# Reading records from stdin and writing results to stdout, so the stage CLIs can be chained into Unix pipelines
+
+import json
+import sys
+from itertools import islice
+from typing import Callable, List, Optional, TextIO, Union
+
+# The argument that makes a stage CLI read from stdin instead of its arguments
+STDIN = '-'
+
+# How many records are read, processed and written at a time. Bounds memory use, however large the input is
+STREAM_BATCH_SIZE = 1000
+
+
+def parse_record(line: str, key: str, jsonl: bool, line_num: int) -> Union[str, List[str], dict]:
+    """
+    Turn 1 line of input into a record
+
+    :param line: The line, including its newline
+    :param key: What the stage reads. "text" for a string, or "tokens" for a list of strings
+    :param jsonl: Whether the line is JSON. If not, it is text, or space-separated tokens
+    :param line_num: Which line of the input this is. Used in errors
+    :return: The text or tokens of the line. With JSON, an object like {"article": 1, "tokens": [...]} is kept whole
+    """
+
+    if not jsonl:
+        return line.rstrip('\n') if key == 'text' else line.split()
+
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as error:
+        raise ValueError(f"Line {line_num} is not valid JSON: {error}") from None
+
+    content = record.get(key) if isinstance(record, dict) else record
+    valid = isinstance(content, str) if key == 'text' else (isinstance(content, list) and
+                                                            all(isinstance(token, str) for token in content))
+
+    if not valid:
+        expected = "a string" if key == 'text' else "a list of strings"
+        raise ValueError(f"Line {line_num} should be {expected}, or an object with \"{key}\" as {expected}")
+
+    return record
+
+
+def format_record(record: Union[str, List[str], dict], key: str, tokens: List[str], jsonl: bool) -> str:
+    """
+    Turn the result for 1 record into a line of output
+
+    :param record: The record, as returned by `parse_record()`
+    :param key: What the stage read from the record
+    :param tokens: The stage's output for the record
+    :param jsonl: Whether to write JSON. If not, the tokens are written space-separated
+    :return: The line, including its newline
+    """
+
+    if not jsonl:
+        return ' '.join(tokens) + '\n'
+
+    # Objects keep their other fields, like "article", with the stage's input replaced by its output
+    if isinstance(record, dict):
+        output = {name: value for name, value in record.items() if name != key}
+        output['tokens'] = tokens
+        return json.dumps(output, ensure_ascii=False) + '\n'
+
+    return json.dumps(tokens, ensure_ascii=False) + '\n'
+
+
+def stream(process: Callable[[list], List[List[str]]], key: str, jsonl: bool = False,
+           batch_size: int = STREAM_BATCH_SIZE, stdin: Optional[TextIO] = None,
+           stdout: Optional[TextIO] = None) -> int:
+    """
+    Run a stage over every line of stdin, writing 1 line of output per line of input. Lines are processed a batch at a
+    time, and each batch's output is flushed before the next is read, so only 1 batch is ever held in memory
+
+    :param process: The stage. Takes the text or tokens of a batch of records, and returns the tokens of each
+    :param key: What the stage reads. "text" for a string, or "tokens" for a list of strings
+    :param jsonl: Whether each line is JSON, rather than text or space-separated tokens
+    :param batch_size: How many lines to process at a time
+    :param stdin: Where to read from. Defaults to `sys.stdin`
+    :param stdout: Where to write to. Defaults to `sys.stdout`
+    :return: How many records were processed
+    """
+
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    count = 0
+
+    while True:
+        lines = list(islice(stdin, batch_size))
+        if not lines:
+            return count
+
+        records = [parse_record(line, key, jsonl, count + i + 1) for i, line in enumerate(lines)]
+        contents = [record[key] if isinstance(record, dict) else record for record in records]
+
+        stdout.writelines(format_record(record, key, tokens, jsonl) for record, tokens in zip(records, process(contents)))
+        stdout.flush()
+
+        count += len(lines)
@@ -0,0 +1,62 @@
+from array import array
+
+import pytest
+
+import batching
+from batching import TokenBatch, filter_ids_batch, filter_stopwords_batch, lowercase_batch
+from handle_stopwords import StopwordIndex
+from vocabulary import Vocabulary
+
+ARTICLES = [["The", "Bank", "of", "England"], [], ["Rates", "ROSE", "the", "most"], ["of"]]
+
+
+@pytest.fixture
+def index(tmp_path):
+    (tmp_path / "stopwords.txt").write_text("the\nof\nmost\n")
+    return StopwordIndex((tmp_path / "stopwords.txt",))
+
+
+def test_round_trip():
+    batch = TokenBatch.from_articles(ARTICLES)
+
+    assert len(batch) == 4
+    assert batch.articles() == ARTICLES
+    assert batch[2] == ARTICLES[2]
+
+
+def test_lowercase_batch():
+    assert lowercase_batch(TokenBatch.from_articles(ARTICLES)).articles() == [
+        [token.lower() for token in article] for article in ARTICLES
+    ]
+
+
+def test_filter_stopwords_batch(index):
+    lowered = lowercase_batch(TokenBatch.from_articles(ARTICLES))
+
+    assert filter_stopwords_batch(lowered, index).articles() == [
+        index.filter([token.lower() for token in article]) for article in ARTICLES
+    ]
+
+
+@pytest.mark.parametrize("numpy_available", [True, False])
+def test_filter_ids_batch(index, monkeypatch, numpy_available):
+    if numpy_available:
+        pytest.importorskip("numpy")
+    monkeypatch.setattr(batching, "NUMPY_AVAILABLE", numpy_available)
+
+    vocabulary = Vocabulary(lambda tokens: tokens)
+    batch = TokenBatch.from_articles(ARTICLES)
+    ids = batch.with_tokens(vocabulary.lowercase(vocabulary.intern(batch.tokens)))
+
+    filtered = vocabulary.filter_stopwords_batch(ids, index)
+
+    assert isinstance(filtered.tokens, array)
+    assert [vocabulary.decode(article) for article in filtered.articles()] == [
+        index.filter([token.lower() for token in article]) for article in ARTICLES
+    ]
+
+
+def test_filter_empty_batch():
+    batch = TokenBatch(array('I'), array('Q', [0, 0]))
+
+    assert filter_ids_batch(batch, bytearray()).articles() == [array('I')]
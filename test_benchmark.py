@@ -0,0 +1,42 @@
+import pytest
+
+from benchmark import generate_corpus, compare, cold_start, compare_stemmers
+from utilities import stream_texts
+
+
+def test_generated_corpus_is_readable(tmp_path):
+    files = generate_corpus(tmp_path, article_count=25, articles_per_file=10)
+    assert len(files) == 3
+
+    articles = list(stream_texts(str(tmp_path), 'all'))
+    assert len(articles) == 25
+    assert all(article.strip().endswith('Reuter\n\x03') for article in articles)
+
+
+def test_generated_corpus_is_deterministic(tmp_path):
+    first = generate_corpus(tmp_path / "first", article_count=5)
+    second = generate_corpus(tmp_path / "second", article_count=5)
+    assert first[0].read_text() == second[0].read_text()
+
+
+def test_compare_flags_regressions():
+    baseline = {'stem': {'articles_per_sec': 100.0}, 'tokenize': {'articles_per_sec': 100.0}}
+    results = {'stem': {'articles_per_sec': 70.0}, 'tokenize': {'articles_per_sec': 90.0}}
+    assert compare(results, baseline, tolerance=0.2) == ['stem']
+
+
+def test_stages_import_without_slow_dependencies():
+    results = cold_start(['stages'])
+    assert results['stages']['seconds'] > 0
+    assert results['stages']['imports'] == []
+
+
+def test_compare_stemmers():
+    results = compare_stemmers([['running', 'runs', 'ran'], ['runner', 'running', 'maximum']], repeat=1)
+
+    # WordNet's data may not be installed
+    assert {'porter', 'snowball', 'lancaster'} <= set(results)
+    assert results['porter']['distinct_tokens'] == 5
+    assert results['porter']['distinct_stems'] == 4
+    assert results['porter']['reduction'] == pytest.approx(0.2)
+    assert all(result['tokens_per_sec'] > 0 for result in results.values())
@@ -0,0 +1,54 @@
+import pytest
+
+from checkpoint import Checkpoint
+
+SETTINGS = {'count': 'all', 'emit': ['final'], 'format': 'dirs', 'steps': {'final': 'abc'}}
+
+
+@pytest.fixture
+def checkpoint():
+    checkpoint = Checkpoint()
+    checkpoint.enabled = True
+    checkpoint.settings = dict(SETTINGS)
+    return checkpoint
+
+
+def test_chunks_commit_in_order(checkpoint):
+    checkpoint.finish(1, 5)
+    checkpoint.finish(70, 64)
+    assert checkpoint.committed == 5
+
+    # The chunk in between finishing commits both
+    checkpoint.finish(6, 64)
+    assert checkpoint.committed == 133
+    assert checkpoint.finished == {}
+
+
+def test_save_and_resume(checkpoint, tmp_path):
+    checkpoint_file = tmp_path / "checkpoint.json"
+    checkpoint.finish(1, 2000)
+    checkpoint.file_counts = {'reut2-000.sgm': [100, 200, 1000]}
+    assert checkpoint.due()
+
+    checkpoint.save(checkpoint_file)
+    assert not checkpoint.due()
+    assert [path.name for path in tmp_path.iterdir()] == ["checkpoint.json"]
+
+    resumed = Checkpoint()
+    resumed.settings = dict(SETTINGS)
+    assert resumed.load(checkpoint_file)
+    assert (resumed.committed, resumed.file_counts) == (2000, checkpoint.file_counts)
+
+    resumed.clear(checkpoint_file)
+    assert not resumed.load(checkpoint_file)
+
+
+def test_resume_needs_same_settings(checkpoint, tmp_path):
+    checkpoint_file = tmp_path / "checkpoint.json"
+    checkpoint.save(checkpoint_file)
+
+    changed = Checkpoint()
+    changed.settings = dict(SETTINGS, emit=['tokens', 'final'])
+
+    with pytest.raises(ValueError, match="emit"):
+        changed.load(checkpoint_file)
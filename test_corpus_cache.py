@@ -0,0 +1,73 @@
+import contextlib
+import io
+import json
+import os
+
+import pytest
+
+from benchmark import generate_corpus
+from corpus_cache import CorpusCache, MAGIC, compile_corpus, open_corpus_cache, cached_texts, layout
+from utilities import stream_texts
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    generate_corpus(tmp_path / "corpus", article_count=30, articles_per_file=10)
+    return tmp_path / "corpus"
+
+
+def read(texts):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return list(texts)
+
+
+def test_cache_matches_streaming(corpus, tmp_path):
+    cache_file = tmp_path / "cache.bin"
+
+    assert compile_corpus(str(corpus), cache_file) == 30
+    assert read(cached_texts(str(corpus), 'all', cache_file)) == read(stream_texts(str(corpus), 'all'))
+    assert read(cached_texts(str(corpus), '7', cache_file)) == read(stream_texts(str(corpus), '7'))
+
+
+def test_metadata(corpus, tmp_path):
+    compile_corpus(str(corpus), tmp_path / "cache.bin")
+    cache = CorpusCache(tmp_path / "cache.bin")
+
+    assert len(cache) == 30
+    assert list(cache.new_ids) == list(range(1, 31))
+    assert cache.metadata(4)['NEWID'] == '5'
+    assert cache.metadata(4)['LEWISSPLIT'] == 'TRAIN'
+    cache.close()
+
+
+def test_rebuilt_when_corpus_changes(corpus, tmp_path):
+    cache_file = tmp_path / "cache.bin"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        open_corpus_cache(str(corpus), cache_file).close()
+
+        # Drop the last file of the corpus, and make sure the cache notices
+        os.remove(sorted(corpus.glob("*.sgm"))[-1])
+        cache = open_corpus_cache(str(corpus), cache_file)
+
+    assert len(cache) == 20
+    assert cache.is_current(str(corpus))
+    cache.close()
+
+
+def test_not_a_cache(tmp_path):
+    (tmp_path / "cache.bin").write_bytes(b"something else entirely")
+
+    with pytest.raises(ValueError):
+        CorpusCache(tmp_path / "cache.bin")
+
+
+@pytest.mark.parametrize("size", [0, 1, 7, 9, 95, 9_990, 99_990])
+def test_layout_describes_itself(size):
+    # Section positions that gain a digit make the header longer, which moves every section again
+    header = {'count': size}
+    encoded_header = layout(header, {'first': bytes(size), 'second': bytes(size)})
+
+    assert json.loads(encoded_header) == header
+    assert header['first'] == (len(MAGIC) + 8 + len(encoded_header) + 7) // 8 * 8
+    assert header['texts'] == header['second'] + (size + 7) // 8 * 8
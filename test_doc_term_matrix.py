@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+from doc_term_matrix import export_matrix
+from inverted_index import IndexBuilder
+
+ARTICLES = {
+    1: ["bank", "rate", "bank"],
+    2: ["oil", "ölpreis"],
+    3: ["bank", "oil", "rate", "rise"],
+    5: [],
+}
+
+
+@pytest.fixture
+def index_file(tmp_path):
+    builder = IndexBuilder()
+    for article_num, tokens in ARTICLES.items():
+        builder.add(article_num, tokens)
+
+    return builder.write_partial(tmp_path)
+
+
+def dense(matrix):
+    rows, columns = matrix['shape']
+    values = [[0.0] * columns for _ in range(rows)]
+
+    for column in range(columns):
+        for position in range(matrix['indptr'][column], matrix['indptr'][column + 1]):
+            values[matrix['indices'][position]][column] = float(matrix['data'][position])
+
+    return values
+
+
+# A tiny buffer makes every array get written across many chunks
+@pytest.mark.parametrize("buffer_size", [1, 1 << 20])
+def test_counts(index_file, tmp_path, buffer_size):
+    numpy = pytest.importorskip("numpy")
+
+    assert export_matrix(index_file, tmp_path / "matrix.npz", 'count', buffer_size) == (4, 5, 8)
+
+    with numpy.load(tmp_path / "matrix.npz") as matrix:
+        assert matrix['format'].item() == b'csc'
+        assert list(matrix['vocabulary']) == ["bank", "oil", "rate", "rise", "ölpreis"]
+        assert list(matrix['articles']) == [1, 2, 3, 5]
+        assert dense(matrix) == [[2, 0, 1, 0, 0], [0, 1, 0, 0, 1], [1, 1, 1, 1, 0], [0, 0, 0, 0, 0]]
+
+
+def test_tf(index_file, tmp_path):
+    numpy = pytest.importorskip("numpy")
+
+    export_matrix(index_file, tmp_path / "matrix.npz", 'tf')
+
+    with numpy.load(tmp_path / "matrix.npz") as matrix:
+        assert dense(matrix)[0] == pytest.approx([2 / 3, 0, 1 / 3, 0, 0])
+        assert sum(dense(matrix)[2]) == pytest.approx(1)
+
+
+def test_tfidf(index_file, tmp_path):
+    numpy = pytest.importorskip("numpy")
+
+    export_matrix(index_file, tmp_path / "matrix.npz", 'tfidf')
+
+    with numpy.load(tmp_path / "matrix.npz") as matrix:
+        values = dense(matrix)
+
+    # As scikit-learn's `TfidfVectorizer()` would weight article 1: "bank" is in 2 of 4 articles, as is "rate"
+    idf = math.log(5 / 3) + 1
+    norm = math.hypot(2 * idf, idf)
+    assert values[0] == pytest.approx([2 * idf / norm, 0, idf / norm, 0, 0])
+
+    assert [math.hypot(*row) for row in values] == pytest.approx([1, 1, 1, 0])
@@ -0,0 +1,53 @@
+from pathlib import Path
+
+import pytest
+
+import file_writing
+from file_writing import write_to_file, start_background_writer, flush_background_writer, stop_background_writer
+
+
+@pytest.fixture
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    stop_background_writer()
+
+
+def test_write_list(in_tmp_path):
+    write_to_file(Path("article/tokens.txt"), ["some", "tokens"])
+    assert (in_tmp_path / "output/article/tokens.txt").read_text() == "some\ntokens\n"
+
+
+def test_write_empty_list(in_tmp_path):
+    write_to_file(Path("article/tokens.txt"), [])
+    assert (in_tmp_path / "output/article/tokens.txt").read_text() == ""
+
+
+def test_background_writer(in_tmp_path):
+    start_background_writer(threads=2, max_pending=4)
+
+    for i in range(50):
+        write_to_file(Path(f"article{i}/text.txt"), f"Article {i}")
+
+    flush_background_writer()
+    assert all((in_tmp_path / f"output/article{i}/text.txt").read_text() == f"Article {i}" for i in range(50))
+
+
+def test_background_writer_reports_errors(in_tmp_path):
+    start_background_writer()
+
+    # A file can't be written where a directory already is
+    (in_tmp_path / "output/article/text.txt").mkdir(parents=True)
+    write_to_file(Path("article/text.txt"), "Article")
+
+    with pytest.raises(OSError):
+        flush_background_writer()
+
+
+def test_stopped_writer_writes_directly(in_tmp_path):
+    start_background_writer()
+    stop_background_writer()
+
+    assert file_writing._WRITER is None
+    write_to_file(Path("article/text.txt"), "Article")
+    assert (in_tmp_path / "output/article/text.txt").read_text() == "Article"
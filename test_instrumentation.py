@@ -0,0 +1,58 @@
+from instrumentation import Stats
+
+
+def test_disabled_costs_nothing():
+    stats = Stats()
+    items = [1, 2, 3]
+
+    assert stats.timer() is None
+    assert stats.timed('read', items) is items
+
+
+def test_records_stages_and_counters():
+    stats = Stats()
+    stats.enabled = True
+
+    timer = stats.timer()
+    timer.lap('tokenize')
+    timer.lap('tokenize')
+    stats.count('tokens processed', 10)
+
+    assert stats.stages['tokenize'][2] == 2
+    assert stats.counters == {'tokens processed': 10}
+
+
+def test_timed_iterable():
+    stats = Stats()
+    stats.enabled = True
+
+    assert list(stats.timed('read', iter("abc"))) == ['a', 'b', 'c']
+    assert stats.stages['read'][2] == 3
+
+
+def test_drain_and_merge():
+    worker, main = Stats(), Stats()
+    worker.enabled = True
+    worker.timer().lap('stem')
+    worker.count('bytes written', 5)
+
+    main.merge(worker.drain())
+    main.merge(({'stem': [1.0, 0.5, 1]}, {'bytes written': 5}))
+
+    assert worker.stages == {} and worker.counters == {}
+    assert main.stages['stem'][2] == 2
+    assert main.counters['bytes written'] == 10
+
+
+def test_overlapping_stages_are_left_out_of_the_share():
+    stats = Stats()
+    stats.merge(({'write': [3.0, 1.0, 1], 'stem': [1.0, 1.0, 1], 'file writes': [2.0, 1.0, 1]}, {}))
+    stats.overlapping.add('file writes')
+
+    from rich.console import Console
+    console = Console(width=200, record=True)
+    console.print(stats.table())
+    rows = {line.split()[1]: line for line in console.export_text().splitlines() if '│' in line}
+
+    assert '75.0%' in rows['write'] and '25.0%' in rows['stem']
+    assert 'overlaps' in rows['file']
@@ -0,0 +1,114 @@
+import pytest
+
+from inverted_index import IndexBuilder, InvertedIndex, merge_indexes, write_index
+
+ARTICLES = {
+    1: ["bank", "rate", "rise", "bank"],
+    2: ["oil", "price"],
+    3: ["bank", "oil", "rate"],
+    4: [],
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    builder = IndexBuilder()
+    for article_num, tokens in ARTICLES.items():
+        builder.add(article_num, tokens)
+
+    index = InvertedIndex(builder.write_partial(tmp_path))
+    yield index
+    index.close()
+
+
+def test_lookup(index):
+    assert len(index) == 5
+    assert [term for term, _, _ in index] == ["bank", "oil", "price", "rate", "rise"]
+
+    articles, frequencies = index.postings("bank")
+    assert (list(articles), list(frequencies)) == ([1, 3], [2, 1])
+    assert index.document_frequency("bank") == 2
+    assert index.collection_frequency("bank") == 3
+
+    assert "gold" not in index
+    assert index.document_frequency("gold") == 0
+    assert [index.length(article) for article in (1, 4, 5)] == [4, 0, 0]
+
+
+def test_search(index):
+    assert index.search("bank") == [1, 3]
+    assert index.search("bank", "oil") == [3]
+    assert index.search("rate", "bank", "rate") == [1, 3]
+    assert index.search("bank", "gold") == []
+    assert index.search() == []
+
+
+def test_workers_merge_out_of_order(tmp_path):
+    workers = [IndexBuilder(), IndexBuilder()]
+    for article_num, tokens in ARTICLES.items():
+        workers[article_num % 2].add(article_num, tokens)
+
+    main = IndexBuilder()
+    for worker in reversed(workers):
+        main.merge(worker.drain())
+
+    index = InvertedIndex(main.write_partial(tmp_path))
+    assert [(term, list(articles)) for term, articles, _ in index][:2] == [("bank", [1, 3]), ("oil", [2, 3])]
+    assert [index.length(article) for article in ARTICLES] == [4, 2, 3, 0]
+    index.close()
+
+    # Nothing collected, so nothing to write
+    assert main.write_partial(tmp_path) is None
+
+
+def test_merge_replaces_reindexed_articles(tmp_path):
+    older, newer = IndexBuilder(), IndexBuilder()
+    for article_num, tokens in ARTICLES.items():
+        older.add(article_num, tokens)
+
+    # Article 1 changed, and article 5 is new
+    newer.add(1, ["gold"])
+    newer.add(5, ["oil"])
+
+    sources = [older.write_partial(tmp_path / "older"), newer.write_partial(tmp_path / "newer")]
+    assert merge_indexes(sources, tmp_path / "index.idx") == 5
+
+    index = InvertedIndex(tmp_path / "index.idx")
+    assert index.search("bank") == [3]
+    assert index.search("oil") == [2, 3, 5]
+    assert "rise" not in index
+    assert [index.length(article) for article in (1, 5)] == [1, 1]
+    index.close()
+
+
+def test_empty_index(tmp_path):
+    write_index(tmp_path / "empty.idx", [], {})
+
+    index = InvertedIndex(tmp_path / "empty.idx")
+    assert len(index) == 0
+    assert index.search("bank") == []
+    index.close()
+
+
+def test_checkpointed_partials_survive_a_resume(tmp_path):
+    builder = IndexBuilder()
+
+    # Article 4 finished before article 3, so only up to article 2 is checkpointed
+    for article_num in (1, 2, 4):
+        builder.add(article_num, ARTICLES[article_num])
+    first = builder.write_partial(tmp_path, up_to=2)
+    assert list(builder.lengths) == [4]
+
+    # The resumed run redoes articles 3 and 4, so its partial holds the same newest article as the one left over
+    resumed = IndexBuilder()
+    for article_num in (3, 4):
+        resumed.add(article_num, ARTICLES[article_num])
+    second = resumed.write_partial(tmp_path)
+
+    assert first != second and first.is_file()
+    assert resumed.finish(tmp_path / "index.idx") == 5
+
+    index = InvertedIndex(tmp_path / "index.idx")
+    assert index.search("bank") == [1, 3]
+    assert list(index.documents) == [1, 2, 3, 4]
+    index.close()
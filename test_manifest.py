@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+
+from file_writing import write_to_file
+from manifest import Manifest, content_hash, read_stage_output, stage_fingerprints
+from utilities import STAGE_FILES
+
+CONFIGS = ['normalizer', 'tokenizer', 'lower', 'porter', 'stopwords-v1']
+
+
+@pytest.fixture
+def manifest(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    manifest = Manifest()
+    manifest.enabled = True
+    manifest.fingerprints = stage_fingerprints(CONFIGS)
+    return manifest
+
+
+def write_outputs(article_num):
+    write_to_file(Path(f"article{article_num}/{STAGE_FILES['text']}"), "Some text\n")
+    for stage in ('tokens', 'lowercase', 'stems', 'final'):
+        write_to_file(Path(f"article{article_num}/{STAGE_FILES[stage]}"), ["some", "text"])
+
+
+def test_fingerprints_chain():
+    before = stage_fingerprints(CONFIGS)
+    after = stage_fingerprints(CONFIGS[:3] + ['snowball', CONFIGS[4]])
+
+    assert [before[stage] == after[stage] for stage in STAGE_FILES] == [True, True, True, False, False]
+
+
+def test_new_and_changed_articles_run_fully(manifest):
+    assert manifest.plan(1, content_hash("article"), list(STAGE_FILES)) == -1
+
+    write_outputs(1)
+    manifest.record(1, content_hash("article"), list(STAGE_FILES))
+
+    assert manifest.plan(1, content_hash("edited article"), list(STAGE_FILES)) == -1
+
+
+def test_unchanged_articles_are_skipped(manifest):
+    write_outputs(1)
+    manifest.record(1, content_hash("article"), list(STAGE_FILES))
+
+    assert manifest.plan(1, content_hash("article"), list(STAGE_FILES)) is None
+    assert manifest.skipped == 1
+
+
+def test_stopword_change_resumes_from_stems(manifest):
+    write_outputs(1)
+    manifest.record(1, content_hash("article"), list(STAGE_FILES))
+
+    manifest.fingerprints = stage_fingerprints(CONFIGS[:4] + ['stopwords-v2'])
+
+    assert manifest.plan(1, content_hash("article"), list(STAGE_FILES)) == list(STAGE_FILES).index('stems')
+    assert read_stage_output(1, 'stems') == ["some", "text"]
+
+
+def test_reordered_steps_resume_in_their_own_order(manifest):
+    order = ['text', 'tokens', 'lowercase', 'final', 'stems']
+    configs = ['normalizer', 'tokenizer', 'lower', 'stopwords-v1', 'porter']
+
+    manifest.fingerprints = stage_fingerprints(configs, order)
+    write_outputs(1)
+    manifest.record(1, content_hash("article"), order)
+
+    # Stems now come after stopword removal, so a new stemmer leaves the stopword-free tokens current
+    manifest.fingerprints = stage_fingerprints(configs[:4] + ['snowball'], order)
+
+    assert manifest.plan(1, content_hash("article"), order) == order.index('final')
+
+
+def test_missing_output_is_rewritten(manifest, tmp_path):
+    write_outputs(1)
+    manifest.record(1, content_hash("article"), list(STAGE_FILES))
+
+    (tmp_path / "output" / "article1" / STAGE_FILES['final']).unlink()
+
+    assert manifest.plan(1, content_hash("article"), list(STAGE_FILES)) == list(STAGE_FILES).index('stems')
+
+
+def test_save_load_and_merge(manifest, tmp_path):
+    write_outputs(1)
+    manifest.record(1, content_hash("article"), ['final'])
+    manifest.save(tmp_path / "manifest.json")
+
+    loaded = Manifest()
+    loaded.fingerprints = manifest.fingerprints
+    loaded.load(tmp_path / "manifest.json")
+    assert loaded.plan(1, content_hash("article"), ['final']) is None
+
+    other = Manifest()
+    other.merge(manifest.drain())
+    assert other.entries == manifest.entries
+    assert manifest.drain() == ({}, 0, 0)
+
+
+def test_read_empty_token_list(manifest):
+    write_to_file(Path(f"article1/{STAGE_FILES['final']}"), [])
+
+    assert read_stage_output(1, 'final') == []
@@ -0,0 +1,49 @@
+import random
+from re import sub
+
+import pytest
+
+from normalizer import NORMALIZER
+from utilities import stream_texts, corpus_files
+
+
+def original_textualize(text: str) -> str:
+    # The chain of substitutions textualize() used before the Normalizer, kept as the reference to compare against
+    text = text.replace('\n', '\n ')
+    text = sub(r'-{2,}', ' ', text)
+    text = sub(r'(?![A-Za-z])-(?![A-Za-z])', ' ', text)
+    text = sub(r'\x03|\x02', '', text)
+    text = sub(r"[()<>!:;?\"]+", ' ', text)
+    text = sub(r"\.{2,}", ' ', text)
+    text = sub(r"(?<!\w)([A-Za-z])\.", r'\1', text)
+    text = sub(r"(?!\d)\.(?!\d)", ' ', text)
+    text = sub(r"(?!\d),(?!\d)", ' ', text)
+    text = sub(r"(?<=[A-Za-z])'(?=[A-Za-z])", '', text)
+    text = sub(r"'", ' ', text)
+    text = sub(r"(?!\d)/(?!\d)", ' ', text)
+    return text
+
+
+@pytest.mark.parametrize("text", [
+    "\x02\nBAHIA COCOA REVIEW\n\n    SALVADOR, Feb 26 - \nShowers continued\n Reuter\n\x03",
+    "The U.S. and U.K. paid 1,000.50 dlrs, up 1.5 pct... it's a once-in-a-lifetime deal -- or not",
+    "March/April 1987/88 shares' worth 'quoted' (NYSE: XYZ) <ABC> \"said\"!?",
+    "-\x03a .\x03. !\x02! a.'b U.'s x.a.5 ,. ,5 /' a''b",
+])
+def test_matches_original(text):
+    assert NORMALIZER.normalize(text) == original_textualize(text)
+
+
+def test_matches_original_on_random_text():
+    generator = random.Random(21578)
+    alphabet = "aZq19 \n-.,'/()<>!:;?\"\x02\x03_"
+
+    for _ in range(5000):
+        text = ''.join(generator.choice(alphabet) for _ in range(generator.randint(0, 30)))
+        assert NORMALIZER.normalize(text) == original_textualize(text), repr(text)
+
+
+@pytest.mark.skipif(not corpus_files(), reason="The Reuters corpus is not available")
+def test_matches_original_on_corpus():
+    for text in stream_texts(article_count='all'):
+        assert NORMALIZER.normalize(text) == original_textualize(text)
@@ -0,0 +1,136 @@
+import json
+import threading
+from http.client import HTTPConnection
+
+import pytest
+
+import Pipeline
+import server
+from server import UnixHTTPConnection, call, make_server, warm_up
+from stem_cache import STEM_CACHE
+
+TEXT = "The Bank of England raised rates, and the markets were RISING."
+
+
+@pytest.fixture(scope="module", autouse=True)
+def regex_engine():
+    # NLTK's word_tokenize() needs the Punkt model, which the regex engine doesn't
+    warm_up('regex')
+    yield
+    Pipeline.TOKENIZER_ENGINE = server.DEFAULT_ENGINE = 'nltk'
+
+
+def start(tcp_server):
+    thread = threading.Thread(target=tcp_server.serve_forever, daemon=True)
+    thread.start()
+    return tcp_server
+
+
+@pytest.fixture
+def connection():
+    tcp_server = start(make_server(port=0))
+    connection = HTTPConnection('127.0.0.1', tcp_server.server_address[1], timeout=10)
+
+    yield connection
+
+    connection.close()
+    tcp_server.shutdown()
+    tcp_server.server_close()
+
+
+def test_stages_on_one_connection(connection):
+    tokens = call(connection, 'tokenize', [TEXT, "Another one."])
+    assert tokens[1] == ["Another", "one", "."]
+
+    lowered = call(connection, 'lowercase', tokens)
+    assert lowered[0] == [token.lower() for token in tokens[0]]
+
+    stems = call(connection, 'stem', lowered)
+    assert "rais" in stems[0]
+
+    final = call(connection, 'remove_stopwords', stems)
+    assert "the" not in final[0] and "rais" in final[0]
+
+
+def test_pipeline_matches_stages(connection):
+    outputs = call(connection, 'pipeline', [TEXT, ""], emit=['tokens', 'final'])
+
+    assert set(outputs[0]) == {'tokens', 'final'}
+    assert outputs[0]['final'] == call(connection, 'remove_stopwords',
+                                       call(connection, 'stem', call(connection, 'lowercase', [outputs[0]['tokens']])))[0]
+    assert outputs[1] == {'tokens': [], 'final': []}
+
+
+def test_bad_requests(connection):
+    with pytest.raises(ValueError, match="inputs"):
+        call(connection, 'lowercase', "not a list")
+
+    with pytest.raises(ValueError, match="engine"):
+        call(connection, 'tokenize', [TEXT], engine="whitespace")
+
+    with pytest.raises(ValueError, match="does not exist"):
+        call(connection, 'remove_stopwords', [["a"]], stopwords=["missing.txt"])
+
+    with pytest.raises(ValueError, match="Unknown stage"):
+        call(connection, 'translate', [TEXT])
+
+    # Options of the wrong type
+    with pytest.raises(ValueError, match="engine"):
+        call(connection, 'tokenize', [TEXT], engine=[])
+
+    with pytest.raises(ValueError, match="emit"):
+        call(connection, 'pipeline', [TEXT], emit=[{}])
+
+    connection.request('GET', '/health')
+    assert json.loads(connection.getresponse().read())['stages'] == list(server.STAGES)
+
+
+def test_bad_content_length(connection):
+    connection.putrequest('POST', '/tokenize')
+    connection.putheader('Content-Length', 'lots')
+    connection.endheaders()
+
+    response = connection.getresponse()
+    assert response.status == 400
+    assert "Content-Length" in json.loads(response.read())['error']
+
+
+def test_missing_data_is_a_server_error(connection, monkeypatch):
+    def tokenize_batch(texts, engine):
+        raise LookupError("Resource punkt_tab not found.")
+
+    monkeypatch.setattr(server, 'tokenize_batch', tokenize_batch)
+
+    with pytest.raises(ValueError, match="punkt_tab"):
+        call(connection, 'tokenize', [TEXT])
+
+    connection.request('POST', '/tokenize', json.dumps({'inputs': [TEXT]}))
+    assert connection.getresponse().status == 500
+
+
+def test_cache_size_bounds_memory(connection):
+    warm_up('regex', 3)
+
+    try:
+        outputs = call(connection, 'pipeline', [TEXT, "Other words entirely, stemmed and filtered."],
+                       emit=['tokens', 'final'])
+        assert outputs[0]['final'] == call(connection, 'remove_stopwords',
+                                           call(connection, 'stem', call(connection, 'lowercase',
+                                                                         [outputs[0]['tokens']])))[0]
+
+        assert len(STEM_CACHE.stems) <= 3
+        assert all(len(stages.keep) <= 3 for passes in Pipeline.BATCH_PASSES.values() for _, _, stages in passes)
+    finally:
+        warm_up('regex')
+
+
+def test_unix_socket(tmp_path):
+    socket_path = tmp_path / "server.sock"
+    unix_server = start(make_server(socket_path=socket_path))
+
+    connection = UnixHTTPConnection(socket_path, timeout=10)
+    assert call(connection, 'tokenize', ["Some text."]) == [["Some", "text", "."]]
+
+    connection.close()
+    unix_server.shutdown()
+    unix_server.server_close()
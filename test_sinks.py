@@ -0,0 +1,91 @@
+import pytest
+
+from sinks import JsonlSink, BinarySink, ShardReader, ShardSink, trim_shards
+
+
+@pytest.mark.parametrize("sink_type", [JsonlSink, BinarySink])
+def test_random_access(tmp_path, sink_type):
+    sink = sink_type(directory=tmp_path)
+    for article_num in range(1, 101):
+        sink.write(article_num, 'final', [f"token{article_num}", "shared"])
+        sink.write(article_num, 'text', f"Text of article {article_num}\n")
+    sink.close()
+
+    final = ShardReader('final', directory=tmp_path)
+    assert len(final) == 100
+    assert final[57] == ['token57', 'shared']
+    assert final[3] == ['token3', 'shared']
+
+    text = ShardReader('text', directory=tmp_path)
+    assert text[100] == "Text of article 100\n"
+
+
+@pytest.mark.parametrize("sink_type", [JsonlSink, BinarySink])
+def test_shards_rotate(tmp_path, sink_type):
+    sink = sink_type(directory=tmp_path, shard_size=64)
+    for article_num in range(1, 21):
+        sink.write(article_num, 'final', ["a", "few", "tokens", str(article_num)])
+    sink.close()
+
+    assert len(list(tmp_path.glob("final.*.idx"))) > 1
+
+    reader = ShardReader('final', directory=tmp_path)
+    assert reader.articles() == list(range(1, 21))
+    assert reader[20] == ["a", "few", "tokens", "20"]
+
+
+def test_empty_token_list(tmp_path):
+    sink = BinarySink(directory=tmp_path)
+    sink.write(1, 'final', [])
+    sink.close()
+
+    assert ShardReader('final', directory=tmp_path)[1] == []
+
+
+@pytest.mark.parametrize("sink_type", [JsonlSink, BinarySink])
+def test_trim_shards(tmp_path, sink_type):
+    sink = sink_type(directory=tmp_path)
+    for article_num in range(1, 11):
+        sink.write(article_num, 'final', ["tokens", str(article_num)])
+    sink.close()
+
+    # Leave a partly written article at the end, as an interrupted run might
+    shard = next(tmp_path.glob("final.*.idx")).with_suffix(sink_type.EXTENSION)
+    with open(shard, "ab") as file:
+        file.write(b"partial")
+
+    trim_shards(['final'], 7, directory=tmp_path)
+
+    reader = ShardReader('final', directory=tmp_path)
+    assert reader.articles() == list(range(1, 8))
+    assert reader[7] == ["tokens", "7"]
+
+    _, offset, length = reader.locations[7]
+    assert shard.stat().st_size == offset + length
+
+
+def test_trim_orphaned_index(tmp_path):
+    sink = BinarySink(directory=tmp_path)
+    sink.write(1, 'final', [])
+    sink.close()
+
+    index_file = next(tmp_path.glob("final.*.idx"))
+    index_file.with_suffix(BinarySink.EXTENSION).unlink()
+
+    trim_shards(['final'], 1, directory=tmp_path)
+    assert not index_file.exists()
+
+
+def test_reader_skips_orphaned_index(tmp_path):
+    sink = JsonlSink(directory=tmp_path)
+    sink.write(1, 'final', ["tokens"])
+    sink.close()
+
+    (tmp_path / "final.1.000.idx").write_bytes(b"")
+
+    assert ShardReader('final', directory=tmp_path).articles() == [1]
+
+
+def test_shard_sink_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        ShardSink(directory=tmp_path)
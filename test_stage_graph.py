@@ -0,0 +1,162 @@
+import sys
+
+import pytest
+from nltk import PorterStemmer
+
+import stage_graph
+from batching import TokenBatch
+from stage_graph import DEFAULT_GRAPH, FusedStages, Stage, StageGraph, load_graph
+from stem_cache import STEM_CACHE, StemCache
+from stopword_index import StopwordIndex
+
+ARTICLES = [["The", "Banks", "of", "England"], [], ["Rates", "ROSE", "the", "most"], ["of"], ["banks", "rose"]]
+
+
+@pytest.fixture
+def stopwords_file(tmp_path):
+    (tmp_path / "stopwords.txt").write_text("the\nof\nmost\nrose\n")
+    return tmp_path / "stopwords.txt"
+
+
+def graph_of(*operations):
+    return StageGraph([Stage('textualize'), Stage('tokenize')] + [Stage(operation) for operation in operations])
+
+
+def test_default_graph():
+    assert DEFAULT_GRAPH.outputs == ['text', 'tokens', 'lowercase', 'stems', 'final']
+    assert DEFAULT_GRAPH.final == 'final'
+
+
+@pytest.mark.parametrize("build", [
+    lambda: Stage('translate'),
+    lambda: Stage('stem', stemmer='unknown'),
+    lambda: Stage('lowercase', locale='tr'),
+    lambda: Stage('remove_stopwords', stopwords="stopwords.txt"),
+    lambda: Stage('remove_stopwords', stopwords=["missing.txt"]),
+    lambda: StageGraph([Stage('tokenize'), Stage('textualize')]),
+    lambda: graph_of('stem', 'lowercase', 'stem'),
+])
+def test_invalid_graphs(build):
+    with pytest.raises(ValueError):
+        build()
+
+
+def test_load_graph(tmp_path, stopwords_file):
+    (tmp_path / "stages.toml").write_text(f"""
+        [[stage]]
+        run = "textualize"
+
+        [[stage]]
+        run = "tokenize"
+        engine = "regex"
+
+        [[stage]]
+        run = "lowercase"
+
+        [[stage]]
+        run = "remove_stopwords"
+        stopwords = ["{stopwords_file.as_posix()}"]
+
+        [[stage]]
+        run = "stem"
+        stemmer = "snowball"
+        """)
+
+    graph = load_graph(tmp_path / "stages.toml")
+
+    assert graph.outputs == ['text', 'tokens', 'lowercase', 'final', 'stems']
+    assert graph.final == 'stems'
+    assert graph.option('tokenize', 'engine') == 'regex'
+    assert graph.option('stem', 'stemmer') == 'snowball'
+    assert graph.option('lowercase', 'locale', 'en') == 'en'
+
+
+def test_load_graph_without_stages(tmp_path):
+    (tmp_path / "stages.toml").write_text("run = \"tokenize\"\n")
+
+    with pytest.raises(ValueError):
+        load_graph(tmp_path / "stages.toml")
+
+
+def test_plan_fuses_stages_until_an_output_is_needed():
+    graph = graph_of('lowercase', 'stem', 'remove_stopwords')
+
+    def operations(needed):
+        return [[stage.operation for stage in stages] for stages in graph.plan(needed)]
+
+    assert operations({'final'}) == [['lowercase', 'stem', 'remove_stopwords']]
+    assert operations({'lowercase', 'final'}) == [['lowercase'], ['stem', 'remove_stopwords']]
+    assert operations({'tokens', 'stems'}) == [['lowercase', 'stem']]
+    assert operations({'text', 'tokens'}) == []
+
+
+@pytest.mark.parametrize("operations", [
+    ('lowercase', 'stem', 'remove_stopwords'),
+    ('lowercase', 'remove_stopwords', 'stem'),
+    ('remove_stopwords', 'stem'),
+    ('stem', 'lowercase'),
+])
+def test_fused_stages_match_each_stage_in_turn(stopwords_file, operations):
+    index = StopwordIndex((stopwords_file,))
+    expected = ARTICLES
+
+    for operation in operations:
+        if operation == 'lowercase':
+            expected = [[token.lower() for token in article] for article in expected]
+        elif operation == 'stem':
+            expected = [STEM_CACHE.stem_tokens(article) for article in expected]
+        else:
+            expected = [index.filter(article) for article in expected]
+
+    fused = FusedStages([Stage(operation) for operation in operations], (stopwords_file,))
+
+    # The second batch is only looked up, from what the first taught it
+    for _ in range(2):
+        assert fused(TokenBatch.from_articles(ARTICLES)).articles() == expected
+
+    assert fused.name == '+'.join(operations)
+
+
+@pytest.mark.parametrize("operations", [
+    ('lowercase', 'stem', 'remove_stopwords'),
+    ('lowercase', 'remove_stopwords', 'stem'),
+])
+def test_fused_stages_count_every_stem_lookup(stopwords_file, monkeypatch, operations):
+    index = StopwordIndex((stopwords_file,))
+    unfused = StemCache(PorterStemmer())
+
+    for _ in range(2):
+        for article in ARTICLES:
+            tokens = [token.lower() for token in article]
+            if operations.index('remove_stopwords') < operations.index('stem'):
+                tokens = index.filter(tokens)
+            unfused.stem_tokens(tokens)
+
+    fused_cache = StemCache(PorterStemmer())
+    monkeypatch.setattr(stage_graph, 'STEM_CACHE', fused_cache)
+    fused = FusedStages([Stage(operation) for operation in operations], (stopwords_file,))
+
+    for _ in range(2):
+        fused(TokenBatch.from_articles(ARTICLES))
+
+    assert (fused_cache.hits, fused_cache.misses) == (unfused.hits, unfused.misses)
+
+
+def test_load_graph_without_a_toml_reader(tmp_path, monkeypatch):
+    (tmp_path / "stages.toml").write_text("[[stage]]\nrun = \"textualize\"\n")
+    monkeypatch.setitem(sys.modules, 'tomllib', None)
+    monkeypatch.setitem(sys.modules, 'tomli', None)
+
+    with pytest.raises(ValueError, match="tomli"):
+        load_graph(tmp_path / "stages.toml")
+
+
+def test_fused_stages_forget_past_their_limit(stopwords_file):
+    operations = ('lowercase', 'stem', 'remove_stopwords')
+    fused = FusedStages([Stage(operation) for operation in operations], (stopwords_file,), max_size=4)
+    unlimited = FusedStages([Stage(operation) for operation in operations], (stopwords_file,))
+
+    for article in ARTICLES:
+        batch = TokenBatch.from_articles([article])
+        assert fused(batch).articles() == unlimited(batch).articles()
+        assert len(fused.keep) <= 4
@@ -1,7 +1,10 @@
 import pytest
 import typer
 
+from nltk import PorterStemmer
+
 from stem import stem
+from stem_cache import STEM_CACHE, StemCache
 
 
 def test_simple_stem():
@@ -27,3 +30,63 @@ def test_list_of_blanks():
 def test_no_tokens():
     with pytest.raises(TypeError):
         stem()
+
+
+def test_cache_counts_hits_and_misses():
+    cache = StemCache(PorterStemmer())
+    assert cache.stem_tokens(['running', 'runs', 'running']) == ['run', 'run', 'run']
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_bounded_cache_evicts_least_recently_used():
+    cache = StemCache(PorterStemmer(), max_size=2)
+    cache.stem_tokens(['running', 'jumping', 'running', 'walking'])
+    assert list(cache.stems) == ['running', 'walking']
+
+
+def test_cache_persists(tmp_path):
+    cache_file = tmp_path / "stems.json"
+    first = StemCache(PorterStemmer())
+    first.stem_tokens(['greetings', 'interesting'])
+    first.save(cache_file)
+
+    second = StemCache(PorterStemmer())
+    second.load(cache_file)
+    assert second.stem_tokens(['greetings', 'interesting']) == ['greet', 'interest']
+    assert second.misses == 0
+
+
+def test_other_stemmers():
+    try:
+        assert stem(['generously', 'maximum'], engine='lancaster') == ['gen', 'maxim']
+        assert stem(['generously', 'maximum'], engine='snowball') == ['generous', 'maximum']
+
+        # Without an engine, the stemmer already chosen is kept
+        assert stem(['generously', 'maximum']) == ['generous', 'maximum']
+    finally:
+        STEM_CACHE.use('porter')
+
+
+def test_each_stemmer_keeps_its_own_stems():
+    cache = StemCache(PorterStemmer())
+    assert cache.stem_tokens(['generously']) == ['gener']
+
+    cache.use('lancaster')
+    assert cache.name == 'LancasterStemmer'
+    assert cache.stem_tokens(['generously']) == ['gen']
+
+    # Switching back finds the Porter stems still cached
+    cache.use('porter')
+    assert cache.stem_tokens(['generously']) == ['gener']
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_limit_drops_least_recently_used():
+    cache = StemCache(PorterStemmer())
+    cache.stem_tokens(['running', 'jumps', 'greetings'])
+
+    cache.limit(2)
+    assert list(cache.stems) == ['jumps', 'greetings']
+
+    cache.stem_tokens(['jumps', 'interesting'])
+    assert list(cache.stems) == ['jumps', 'interesting']
@@ -1,7 +1,9 @@
+import os
+
 import pytest
 import typer
 
-from handle_stopwords import remove_stopwords
+from handle_stopwords import remove_stopwords, load_stopwords
 
 
 def test_simple_stem():
@@ -27,3 +29,23 @@ def test_list_of_blanks():
 def test_no_tokens():
     with pytest.raises(TypeError):
         remove_stopwords()
+
+
+def test_combined_stopword_files(tmp_path):
+    first, second = tmp_path / "first.txt", tmp_path / "second.txt"
+    first.write_text("the\na\n")
+    second.write_text("of\n")
+
+    assert remove_stopwords(['the', 'end', 'of', 'a', 'story'], stopwords_files=[first, second]) == ['end', 'story']
+
+
+def test_index_reloads_changed_file(tmp_path):
+    stopwords_file = tmp_path / "stopwords.txt"
+    stopwords_file.write_text("the\n")
+    assert 'the' in load_stopwords(stopwords_file)
+    assert load_stopwords(stopwords_file) is load_stopwords(stopwords_file)
+
+    stopwords_file.write_text("end\n")
+    os.utime(stopwords_file, ns=(0, 0))
+    assert 'the' not in load_stopwords(stopwords_file)
+    assert 'end' in load_stopwords(stopwords_file)
@@ -0,0 +1,48 @@
+import io
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from lowercase import lowercaser
+from streaming import stream
+
+
+def lowercase(articles):
+    return [[token.lower() for token in tokens] for tokens in articles]
+
+
+def test_plain_lines():
+    stdout = io.StringIO()
+    count = stream(lowercase, 'tokens', stdin=io.StringIO("The BANK\n\nof England\n"), stdout=stdout, batch_size=2)
+
+    assert count == 3
+    assert stdout.getvalue() == "the bank\n\nof england\n"
+
+
+def test_jsonl_keeps_other_fields():
+    lines = [json.dumps({'article': 7, 'text': "Some Text"}), json.dumps("More Text")]
+    stdout = io.StringIO()
+    stream(lambda texts: [text.split() for text in texts], 'text', jsonl=True,
+           stdin=io.StringIO('\n'.join(lines) + '\n'), stdout=stdout)
+
+    assert [json.loads(line) for line in stdout.getvalue().splitlines()] == [
+        {'article': 7, 'tokens': ["Some", "Text"]}, ["More", "Text"]
+    ]
+
+
+@pytest.mark.parametrize("line, message", [
+    ("{not json", "not valid JSON"),
+    ('"a string"', "list of strings"),
+    ('{"text": "wrong key"}', "list of strings"),
+])
+def test_bad_jsonl(line, message):
+    with pytest.raises(ValueError, match=f"Line 2 .*{message}"):
+        stream(lowercase, 'tokens', jsonl=True, stdin=io.StringIO(f'["ok"]\n{line}\n'), stdout=io.StringIO())
+
+
+def test_cli_reads_stdin():
+    result = CliRunner().invoke(lowercaser, ['-'], input="SOME Tokens\nMORE\n")
+
+    assert result.exit_code == 0
+    assert result.stdout == "some tokens\nmore\n"
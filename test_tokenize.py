@@ -1,7 +1,12 @@
+import random
+
 import pytest
 import typer
+from nltk.tokenize import NLTKWordTokenizer
 
-from tokenization import tokenize
+from tokenization import tokenize, engine_callback
+from treebank import ENGINES, diff_report, regex_tokenize, tokenize_batch
+from utilities import clean_text
 
 
 def test_simple_tokenization():
@@ -20,3 +25,44 @@ def test_blank_text():
 def test_no_text():
     with pytest.raises(TypeError):
         tokenize()
+
+
+@pytest.mark.parametrize("text", [
+    "Good muffins cost $3.88 (roughly 3,36 euros) in New York.",
+    "I cannot gonna wanna go--now... a,b 1,000 x: y",
+    "wanna-x ^cannot $gonna ```quoted`` end.",
+    "Prices rose 1.5 pct to 1,000 dlrs in March 1998/99 & [not] {much} <ABC> #1 @home 50% *",
+])
+def test_regex_engine_matches_treebank(text):
+    assert regex_tokenize(text) == NLTKWordTokenizer().tokenize(text)
+
+
+def test_regex_engine_matches_treebank_on_cleaned_text():
+    generator = random.Random(21578)
+    alphabet = "abcXY 12 .,:;-/'\"()[]{}<>!?$%&@#*`«»“”–\n\t_+=~^|"
+    words = ["cannot", "gonna", "wanna", "1,000", "3.5", "U.S.", "--", "...", "it's", " "]
+
+    for _ in range(2000):
+        text = clean_text(''.join(generator.choice(alphabet) if generator.random() < 0.7 else generator.choice(words)
+                                  for _ in range(generator.randint(0, 40))))
+        assert regex_tokenize(text) == NLTKWordTokenizer().tokenize(text)
+
+
+def test_tokenize_batch():
+    assert tokenize_batch(["One text", "Another $5 text"], engine='regex') == [["One", "text"],
+                                                                                ["Another", "$", "5", "text"]]
+
+
+def test_diff_report(monkeypatch):
+    monkeypatch.setitem(ENGINES, 'nltk', NLTKWordTokenizer().tokenize)
+
+    report = diff_report(["plain text", "it's \"quoted\""])
+    assert report['texts'] == 2
+    assert report['texts_differing'] == 1
+    assert report['tokens_differing'] > 0
+    assert report['examples']
+
+
+def test_unknown_engine():
+    with pytest.raises(typer.Exit):
+        engine_callback('nope')
@@ -0,0 +1,124 @@
+import importlib.util
+import os
+
+import pytest
+
+from benchmark import generate_corpus
+from utilities import stream_texts, get_texts, corpus_files, file_texts_beautifulsoup, BACKENDS
+
+SAMPLE_SGM = """<!DOCTYPE lewis SYSTEM "lewis.dtd">
+<REUTERS TOPICS="YES" LEWISSPLIT="TRAIN" CGISPLIT="TRAINING-SET" OLDID="5544" NEWID="1">
+<DATE>26-FEB-1987 15:01:01.79</DATE>
+<TOPICS><D>cocoa</D></TOPICS>
+<UNKNOWN>
+&#5;&#5;&#5;C T
+&#22;&#22;&#1;f0704&#31;reute
+u f BC-BAHIA-COCOA-REVIEW   02-26 0105</UNKNOWN>
+<TEXT>&#2;
+<TITLE>BAHIA COCOA REVIEW</TITLE>
+<DATELINE>    SALVADOR, Feb 26 - </DATELINE><BODY>Showers continued throughout the week in
+the Bahia cocoa zone, &lt;Comissaria Smith> said.
+    The U.S. price was 1,000.50 dlrs -- it's "up" 1987/88 &amp; March/April...
+ Reuter
+&#3;</BODY></TEXT>
+</REUTERS>
+<REUTERS TOPICS="NO" NEWID="2">
+<TEXT TYPE="BRIEF">&#2;
+******<TITLE>STANDARD OIL &lt;SRD> TO FORM FINANCIAL UNIT
+</TITLE>
+Blah blah blah.
+&#3;
+
+</TEXT>
+</REUTERS>
+<REUTERS TOPICS="NO" NEWID="3"><TEXT TYPE="UNPROC">&#2;
+Unprocessed text &#150; with &foo; and &#x41; here.
+ &#3;
+
+</TEXT></REUTERS>
+"""
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    (tmp_path / "reut2-000.sgm").write_text(SAMPLE_SGM)
+    (tmp_path / "reut2-001.sgm").write_text(SAMPLE_SGM.replace('NEWID="', 'NEWID="1'))
+    return tmp_path
+
+
+def test_stream_matches_beautifulsoup(corpus):
+    expected = ['\n'.join(child.text for child in article.children) for article in get_texts(str(corpus), 'all')]
+    assert list(stream_texts(str(corpus), 'all')) == expected
+
+
+def test_stream_stops_at_count(corpus):
+    assert len(list(stream_texts(str(corpus), '4'))) == 4
+
+
+def test_stream_more_than_available(corpus):
+    assert len(list(stream_texts(str(corpus), '100'))) == 6
+
+
+@pytest.fixture
+def many_files(tmp_path):
+    for n in range(5):
+        (tmp_path / f"reut2-{n:03}.sgm").write_text(SAMPLE_SGM.replace("Blah blah blah.", f"File {n}."))
+    return tmp_path
+
+
+def test_parallel_parsing_keeps_order(many_files):
+    expected = list(stream_texts(str(many_files), 'all'))
+
+    assert list(stream_texts(str(many_files), 'all', parse_workers=3)) == expected
+    assert get_texts(str(many_files), 'all', parse_workers=3) == expected
+
+
+def test_parallel_parsing_stops_at_count(many_files):
+    assert list(stream_texts(str(many_files), '4', parse_workers=2)) == list(stream_texts(str(many_files), 'all'))[:4]
+    assert len(get_texts(str(many_files), '4', parse_workers=2)) == 4
+
+
+def test_stream_skips_counted_files(many_files):
+    expected = list(stream_texts(str(many_files), 'all'))
+
+    file_counts = {}
+    assert list(stream_texts(str(many_files), 'all', skip=1, file_counts=file_counts)) == expected[1:]
+    assert [count for _, _, count in file_counts.values()] == [3] * 5
+
+    # Blank out the first file without changing its size or modification time. It's known to hold only skipped
+    # articles, so it isn't read at all
+    first = many_files / "reut2-000.sgm"
+    stat = first.stat()
+    first.write_text(' ' * stat.st_size)
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert list(stream_texts(str(many_files), '5', skip=3, file_counts=file_counts)) == expected[3:5]
+
+    # Once its modification time changes too, it is read again, and found to hold no articles any more
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert list(stream_texts(str(many_files), 'all', skip=3, file_counts=file_counts)) == expected[6:]
+    assert file_counts["reut2-000.sgm"][2] == 0
+
+
+def backends():
+    # lxml is optional, so only check it where it is installed
+    return [pytest.param(name, marks=pytest.mark.skipif(name == 'lxml' and importlib.util.find_spec('lxml') is None,
+                                                       reason="lxml is not installed"))
+            for name in BACKENDS]
+
+
+@pytest.mark.parametrize("backend", backends())
+def test_backends_conform_on_synthetic_corpus(tmp_path, backend):
+    files = generate_corpus(tmp_path, article_count=200, articles_per_file=50)
+
+    for file in files:
+        assert BACKENDS[backend](file) == file_texts_beautifulsoup(file)
+
+    assert list(stream_texts(str(tmp_path), 'all', backend=backend)) == get_texts(str(tmp_path), 'all', backend='regex')
+
+
+@pytest.mark.parametrize("backend", backends())
+@pytest.mark.skipif(not corpus_files(), reason="The Reuters corpus is not available")
+def test_backends_conform_on_corpus(backend):
+    for file in corpus_files():
+        assert BACKENDS[backend](file) == file_texts_beautifulsoup(file)
@@ -0,0 +1,85 @@
+from nltk.stem import PorterStemmer
+
+from handle_stopwords import StopwordIndex
+from stem_cache import StemCache
+from vocabulary import Vocabulary
+
+TOKENS = ["The", "Bank", "raised", "rates", "the", "BANK", "Rates", "rising", "the"]
+STEMMER = PorterStemmer()
+
+
+def stem_tokens(tokens):
+    return [STEMMER.stem(token) for token in tokens]
+
+
+def stopword_index(path, words):
+    path.write_text("\n".join(words) + "\n")
+    return StopwordIndex((path,))
+
+
+def test_round_trip():
+    vocabulary = Vocabulary(stem_tokens)
+    ids = vocabulary.intern(TOKENS)
+
+    assert vocabulary.decode(ids) == TOKENS
+    assert len(vocabulary) == len(set(TOKENS))
+    assert ids[0] != ids[4] and ids[4] == ids[8]
+
+
+def test_steps_match_lists(tmp_path):
+    vocabulary = Vocabulary(stem_tokens)
+    index = stopword_index(tmp_path / "stopwords.txt", ["the", "rate"])
+
+    lowered = vocabulary.lowercase(vocabulary.intern(TOKENS))
+    assert vocabulary.decode(lowered) == [token.lower() for token in TOKENS]
+
+    stemmed = vocabulary.stem(lowered)
+    assert vocabulary.decode(stemmed) == stem_tokens([token.lower() for token in TOKENS])
+
+    kept = vocabulary.filter_stopwords(stemmed, index)
+    assert vocabulary.decode(kept) == index.filter(stem_tokens([token.lower() for token in TOKENS]))
+
+
+def test_new_tokens_after_maps_are_built():
+    vocabulary = Vocabulary(stem_tokens)
+    vocabulary.stem(vocabulary.lowercase(vocabulary.intern(TOKENS)))
+
+    ids = vocabulary.intern(["Stopped", "Running"])
+    assert vocabulary.decode(vocabulary.stem(vocabulary.lowercase(ids))) == ["stop", "run"]
+
+
+def test_mask_rebuilt_when_stopwords_change(tmp_path):
+    vocabulary = Vocabulary(stem_tokens)
+    ids = vocabulary.intern(["a", "b", "c"])
+
+    assert vocabulary.decode(vocabulary.filter_stopwords(ids, stopword_index(tmp_path / "a.txt", ["a"]))) == ["b", "c"]
+    assert vocabulary.decode(vocabulary.filter_stopwords(ids, stopword_index(tmp_path / "c.txt", ["c"]))) == ["a", "b"]
+
+
+def test_stems_follow_the_cache_stemmer():
+    cache = StemCache(PorterStemmer())
+    vocabulary = Vocabulary(cache.stem_tokens, cache)
+    ids = vocabulary.intern(["generously", "running"])
+
+    assert vocabulary.decode(vocabulary.stem(ids)) == ["gener", "run"]
+
+    cache.use('lancaster')
+    assert vocabulary.decode(vocabulary.stem(ids)) == ["gen", "run"]
+
+    # Switching back finds the Porter stems still there
+    cache.use('porter')
+    assert vocabulary.decode(vocabulary.stem(ids)) == ["gener", "run"]
+
+
+def test_every_stemmed_id_is_a_cache_lookup():
+    cache = StemCache(PorterStemmer())
+    vocabulary = Vocabulary(cache.stem_tokens, cache)
+    ids = vocabulary.intern(["running", "runs", "running", "runs"])
+
+    vocabulary.stem(ids)
+    assert cache.hits + cache.misses >= len(ids)
+
+    # Every ID is already stemmed, so each is a hit
+    hits = cache.hits
+    vocabulary.stem(ids)
+    assert (cache.hits - hits, cache.misses) == (len(ids), 3)
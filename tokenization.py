@@ -1,30 +1,44 @@
 from pathlib import Path
 from typing import List, Optional
 from typing_extensions import Annotated
-from typer import rich_utils
 import rich
 
-from nltk import word_tokenize
 import typer
 
+from cli import run_app, stream_stage, JSONL_OPTION, BATCH_SIZE_OPTION
 from file_writing import write_to_file
-
-# Define certain colors and styles
-rich_utils.OPTIONS_PANEL_TITLE = "[not dim]Options"
-rich_utils.ARGUMENTS_PANEL_TITLE = "[not dim]Arguments"
-rich_utils.STYLE_REQUIRED_LONG = 'not dim red'
-rich_utils.STYLE_OPTION_DEFAULT = 'not dim white'
+from streaming import STDIN, STREAM_BATCH_SIZE
+from treebank import ENGINES, tokenize_batch
 
 # Define tokenizer app
 tokenizer = typer.Typer(add_completion=False, rich_markup_mode="rich", no_args_is_help=True)
 
+
+def engine_callback(engine: str) -> str:
+    """
+    A callback function for Typer apps, to validate which tokenizer engine the user asked for.
+
+    :param engine: The value the user entered for the engine
+    :return: The value, if it was valid
+    """
+
+    if engine not in ENGINES:
+        rich.print(f"\n[red bold]Only the engines[/] {', '.join(ENGINES)} [red bold]are permitted[/]\n")
+        raise typer.Exit(1)
+
+    return engine
+
+
 # Define certain app arguments and options. Makes later code cleaner
 ARTICLE_NUM_OPTION = typer.Option(help="Which article in the corpus this is. Used in logging.", hidden=True)
 FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to save this result to.")
+ENGINE_OPTION = typer.Option("--engine", "-e", callback=engine_callback, help="Which tokenizer to use. \"nltk\" is NLTK's `word_tokenize()`. "
+                                                    "\"regex\" is a much faster single-pattern Treebank tokenizer, "
+                                                    "which skips sentence splitting.")
 
 
 @tokenizer.command(short_help="Tokenize the given text.", rich_help_panel="COMMANDS", no_args_is_help=True,
-                   options_metavar='[--help] [--file <dir/file.txt>]', epilog="Thanks for using my tokenizer! :boom:",
+                   options_metavar='[--help] [--file <dir/file.txt>] [--engine <ENGINE>] [--jsonl]', epilog="Thanks for using my tokenizer! :boom:",
                    help="""Tokenizes the given text using the NLTK `word_tokenize()` method.
                    
                    [not dim]
@@ -40,15 +54,29 @@ FILE_OPTION = typer.Option("--file", "-f", help="Specify an optional file to sav
                    will save to [bold yellow]output/my_article/tokens.txt[/]. If no file is specified, it will save to
                    [bold yellow]output/custom_article/1. Tokenizer-output.txt[/]
                    
+                   With [bold yellow]--engine regex[/], a much faster tokenizer that applies the same Treebank rules in a
+                   single regular expression is used instead. It skips sentence splitting, and doesn't implement the
+                   rules for quotes and apostrophes, which the pipeline removes before tokenizing.
+                   
+                   With [bold yellow]-[/] as the text, lines are read from stdin and each is written to stdout once
+                   tokenized, as space-separated tokens, instead of to a file. With [bold yellow]--jsonl[/], each line
+                   is a JSON string, and is written as a JSON list of tokens. This chains with the other steps, without
+                   any temporary files, or limits on the size of the text.
+                   
                    [bold yellow]Example Usages[/]:
                    python tokenization.py "This is some text"
                    python tokenization.py "This is some text" --file my_article/tokens.txt
+                   python tokenization.py "This is some text" --engine regex
+                   python tokenization.py - --engine regex < articles.txt | python lowercase.py -
                    """)
 def tokenize(
         text: Annotated[str, typer.Argument(help="The text to tokenize, written in quotes.", show_default=False)],
         article_num: Annotated[int, ARTICLE_NUM_OPTION] = 0,
         file_path: Annotated[Optional[Path], FILE_OPTION] = None,
-        pipeline: Annotated[bool, typer.Option(hidden=True)] = False
+        pipeline: Annotated[bool, typer.Option(hidden=True)] = False,
+        engine: Annotated[str, ENGINE_OPTION] = 'nltk',
+        jsonl: Annotated[bool, JSONL_OPTION] = False,
+        batch_size: Annotated[int, BATCH_SIZE_OPTION] = STREAM_BATCH_SIZE
 ) -> List[str]:
     """
     Tokenize the article text
@@ -57,7 +85,11 @@ def tokenize(
     :param article_num: Which article this is
     :param file_path: A file path to save the file to. Must take form of directory/file.txt
     :param pipeline: Whether this command is running as part of the pipeline. Changes file writing
-    :return: A list of strings representing the tokens of the article
+    :param engine: Which tokenizer engine to use. "nltk" or "regex". Default is "nltk"
+    :param jsonl: When streaming, whether each line is a JSON record
+    :param batch_size: When streaming, how many lines to process at a time
+    :return: A list of strings representing the tokens of the article. Empty when streaming, as the results are written
+        to stdout instead
     """
 
     # Test to make sure the given token string isn't blank
@@ -65,8 +97,13 @@ def tokenize(
         rich.print(f"\n[red bold]Blank text is not permitted.")
         raise typer.Exit(1)
 
+    # Tokenize each line of stdin, instead of the given text
+    if text == STDIN:
+        stream_stage(lambda texts: tokenize_batch(texts, engine), 'text', jsonl, batch_size)
+        return []
+
     # Tokenize the given article text string
-    TOKENIZED: List[str] = word_tokenize(text)
+    TOKENIZED: List[str] = ENGINES[engine](text)
 
     # If this is running as the pipeline, this will be the 2nd file written
     if pipeline:
@@ -98,4 +135,4 @@ def tokenize(
 
 
 if __name__ == '__main__':
-    tokenizer()
+    run_app(tokenizer)
@@ -0,0 +1,119 @@
+import re
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Iterable, List
+
+# Characters the Treebank tokenizer always splits off as tokens of their own
+_SPLIT = r";@#$%&?!*\[\](){}<>«“‘„»”’\u2012-\u2015"
+
+# What may follow a period the Treebank tokenizer splits off as the end of the text: closing brackets, quotes and
+# whitespace
+_FINAL = r"[\])}>\"'»”’ ]*\s*\Z"
+
+# The first half of each contraction the Treebank tokenizer splits in 2, like "cannot" and "gonna"
+_CONTRACTION = (r"(?i:can(?=not\b)|gim(?=me\b)|gon(?=na\b)|got(?=ta\b)|lem(?=me\b)"
+                rf"|wan(?=na(?:\s|\Z|[{_SPLIT}`]|--|\.\.|[,:](?!\d))))")
+
+# A character that belongs to the token around it: any other symbol, a period that isn't part of a run or final, a
+# comma or colon in a number, or a hyphen that isn't part of a double dash
+_SYMBOL = rf"[^\w\s{_SPLIT}`.,:-]|\.(?!\.|{_FINAL})|[,:](?=\d)|-(?!-)"
+
+# The Treebank tokenizer's rules, compiled into a single pattern. Alternatives are tried in order at each position:
+#   1. The first half of a contraction that starts a word, then its second half. Each is only tried at a letter it
+#      could start with, since they would otherwise be tried at every position
+#   2. Pairs of backticks, runs of periods, double dashes and characters that are always split off
+#   3. Commas and colons not followed by a digit, and a final period
+#   4. Anything else up to whitespace, keeping commas and colons in numbers, single periods and single hyphens. Stops
+#      before a contraction that starts a word partway through, like in "$cannot"
+TREEBANK_PATTERN = re.compile(
+    rf"\b(?=[cglwCGLW]){_CONTRACTION}"
+    r"|(?=[nmtNMT])(?i:(?<=\bcan)not|(?<=\bgim)me|(?<=\bgon)na|(?<=\bgot)ta|(?<=\blem)me|(?<=\bwan)na)"
+    rf"|``?|\.{{2,}}|--|[{_SPLIT}]"
+    rf"|[,:](?!\d)|\.(?={_FINAL})"
+    rf"|(?:\w+|{_SYMBOL})(?:{_SYMBOL}|(?!{_CONTRACTION})\w+)*"
+)
+
+
+def regex_tokenize(text: str) -> List[str]:
+    """
+    Tokenize text with a single precompiled pattern implementing the Treebank tokenizer's rules, without splitting the
+    text into sentences first.
+
+    Gives exactly the same tokens as `word_tokenize()` for text that has been through `clean_text()`, which removes
+    quotes, apostrophes and sentence-ending periods, so sentence splitting can't change anything. Quote and apostrophe
+    rules aren't implemented, so raw text may be tokenized differently. See `diff_report()`.
+
+    :param text: The text to tokenize
+    :return: The tokens of the text
+    """
+
+    return TREEBANK_PATTERN.findall(text)
+
+
+def nltk_tokenize(text: str) -> List[str]:
+    """
+    :param text: The text to tokenize
+    :return: The tokens of the text, exactly as NLTK's `word_tokenize()` gives them
+    """
+
+    # NLTK is slow to import, so it is only imported once something is actually tokenized with it
+    from nltk import word_tokenize
+
+    return word_tokenize(text)
+
+
+# Every available tokenizer engine, by name. "nltk" is exactly `word_tokenize()`
+ENGINES: Dict[str, Callable[[str], List[str]]] = {
+    'nltk': nltk_tokenize,
+    'regex': regex_tokenize,
+}
+
+
+def tokenize_batch(texts: Iterable[str], engine: str = 'nltk') -> List[List[str]]:
+    """
+    Tokenize many texts at once
+
+    :param texts: The texts to tokenize
+    :param engine: Which tokenizer engine to use. One of `ENGINES`
+    :return: The tokens of each text, in order
+    """
+
+    tokenize_text = ENGINES[engine]
+    return [tokenize_text(text) for text in texts]
+
+
+def diff_report(texts: Iterable[str], engine: str = 'regex', reference: str = 'nltk',
+                examples: int = 5) -> Dict[str, object]:
+    """
+    Quantify how differently 2 tokenizer engines tokenize the same texts
+
+    :param texts: The texts to tokenize, like the cleaned text of every article in the corpus
+    :param engine: The engine to check
+    :param reference: The engine to check it against
+    :param examples: How many differences to keep as examples
+    :return: How many texts and tokens there were, how many of each differ, and a few examples of differences
+    """
+
+    report: Dict[str, object] = {'texts': 0, 'texts_differing': 0, 'reference_tokens': 0, 'tokens_differing': 0,
+                                 'examples': []}
+
+    for text in texts:
+        expected, actual = ENGINES[reference](text), ENGINES[engine](text)
+        report['texts'] += 1
+        report['reference_tokens'] += len(expected)
+
+        if expected == actual:
+            continue
+
+        report['texts_differing'] += 1
+
+        # Count the tokens on either side of each change, so a single split token counts as 1 removed and 2 added
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, expected, actual, autojunk=False).get_opcodes():
+            if tag == 'equal':
+                continue
+
+            report['tokens_differing'] += max(i2 - i1, j2 - j1)
+
+            if len(report['examples']) < examples:
+                report['examples'].append((expected[i1:i2], actual[j1:j2]))
+
+    return report
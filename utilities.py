@@ -1,51 +1,407 @@
+import importlib.util
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
+from itertools import islice
+from html.entities import html5
 from pathlib import Path
-from re import sub
-from typing import List, Union
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Union
 
 import rich
 import typer
-from rich.progress import Progress, SpinnerColumn
-from bs4 import BeautifulSoup
-from bs4.element import Tag
 
 from file_writing import write_to_file
+from stages import clean_text, STAGE_FILES
 
+# BeautifulSoup is slow to import, and only needed by the "bs4" backend, so it is imported where it is used
+if TYPE_CHECKING:
+    from bs4.element import Tag
 
-def get_texts(directory: str = "../reuters21578", article_count: Union[str, int] = 'all') -> List[Tag]:
+# Patterns used by the streaming article reader. Compiled once, since they run over every article in the corpus
+REUTERS_START = '<REUTERS'
+REUTERS_END = '</REUTERS>'
+TEXT_PATTERN = re.compile(r'<TEXT\b[^>]*>(.*?)</TEXT>', re.DOTALL | re.IGNORECASE)
+TAG_PATTERN = re.compile(r'<(/?)([A-Za-z][^\s/>]*)[^>]*>')
+REFERENCE_PATTERN = re.compile(r'&(?:#([0-9]+)|#[xX]([0-9a-fA-F]+)|([A-Za-z][A-Za-z0-9]*));')
+
+
+def corpus_files(directory: str = "../reuters21578") -> List[Path]:
+    """
+    Get the `.sgm` files of the corpus, in a deterministic order
+
+    :param directory: Optionally specify where the reuters corpus is
+    :return: A sorted list of the `.sgm` files in the corpus
+    """
+
+    return sorted(Path(p) for p in glob(f"{directory}/*.sgm"))
+
+
+def _replace_reference(match: re.Match) -> str:
+    """
+    Turn a single character or entity reference into the text BeautifulSoup's `html.parser` would produce for it
+
+    :param match: A match of `REFERENCE_PATTERN`
+    :return: The replacement text
+    """
+
+    decimal, hexadecimal, name = match.groups()
+
+    # Named entities, like "&lt;". Unknown names are kept as literal text, without the semicolon, as bs4 does
+    if name is not None:
+        return html5.get(f"{name};", f"&{name}")
+
+    code = int(decimal) if decimal is not None else int(hexadecimal, 16)
+
+    # Low numeric references are treated as windows-1252, which is what bs4 does
+    if code < 256:
+        try:
+            return bytes([code]).decode('windows-1252')
+        except UnicodeDecodeError:
+            pass
+
+    try:
+        return chr(code)
+    except (ValueError, OverflowError):
+        return '\N{REPLACEMENT CHARACTER}'
+
+
+def _unescape(text: str) -> str:
+    """
+    Resolve the character and entity references in the given SGML text
+
+    :param text: Raw text from a `.sgm` file
+    :return: The text with all references resolved
+    """
+
+    return REFERENCE_PATTERN.sub(_replace_reference, text) if '&' in text else text
+
+
+def _join_children(inner: str) -> str:
+    """
+    Join the top-level children of a <TEXT> element's raw content with newlines, stripping all markup.
+
+    This gives exactly the same string as `'\\n'.join(child.text for child in article.children)` does for the
+    equivalent `bs4.element.Tag`, without having to build a tree.
+
+    :param inner: The raw content between <TEXT> and </TEXT>
+    :return: The text of the article
+    """
+
+    children: List[str] = []
+    current: List[str] = []
+    depth = 0
+    position = 0
+
+    for tag in TAG_PATTERN.finditer(inner):
+        # Text before this tag belongs to whichever child is currently open
+        if tag.start() > position:
+            current.append(inner[position: tag.start()])
+        position = tag.end()
+
+        if tag.group(1):
+            depth -= 1
+
+            # Closing a top-level element finishes that child
+            if depth == 0:
+                children.append(_unescape(''.join(current)))
+                current = []
+        else:
+            # Opening a top-level element finishes any text child before it
+            if depth == 0 and current:
+                children.append(_unescape(''.join(current)))
+                current = []
+            depth += 1
+
+    if position < len(inner):
+        current.append(inner[position:])
+
+    if current:
+        children.append(_unescape(''.join(current)))
+
+    return '\n'.join(children)
+
+
+def reuters_blocks(files: List[Path]) -> Iterator[str]:
+    """
+    Lazily read the raw <REUTERS> blocks of the given files, one at a time. Each file is read line by line, and each
+    block is handed over as soon as it is complete
+
+    :param files: The `.sgm` files to read, in order
+    :return: A generator of raw blocks, from "<REUTERS" to "</REUTERS>"
+    """
+
+    for file in files:
+        with open(file, 'r') as f:
+            block: List[str] = []
+            in_block = False
+
+            for line in f:
+                if not in_block:
+                    # Skip anything between articles. A block may begin partway through a line
+                    start = line.find(REUTERS_START)
+                    if start == -1:
+                        continue
+                    line = line[start:]
+                    in_block = True
+
+                block.append(line)
+
+                if REUTERS_END not in line:
+                    continue
+
+                yield ''.join(block)
+
+                block = []
+                in_block = False
+
+
+def file_texts(file: Path) -> List[str]:
+    """
+    Read every article of a single `.sgm` file, without building a BeautifulSoup tree
+
+    :param file: The `.sgm` file to read
+    :return: The file's articles, already joined into text, in order
+    """
+
+    return [_join_children(inner) for block in reuters_blocks([file]) for inner in TEXT_PATTERN.findall(block)]
+
+
+def file_articles(file: Path) -> List['Tag']:
+    """
+    Parse every article of a single `.sgm` file with BeautifulSoup
+
+    :param file: The `.sgm` file to parse
+    :return: The file's articles as `bs4.element.Tag` objects, in order
+    """
+
+    from bs4 import BeautifulSoup
+
+    # Read the file contents
+    with open(file, 'r') as f:
+        contents = BeautifulSoup(f, features="html.parser")
+
+    # Get all the articles for the file
+    return contents('text')
+
+
+def file_texts_beautifulsoup(file: Path) -> List[str]:
+    """
+    Parse every article of a single `.sgm` file with BeautifulSoup, and turn each into plain text
+
+    :param file: The `.sgm` file to parse
+    :return: The file's articles, joined into text exactly as `clean_text()` joins a `bs4.element.Tag`, in order
+    """
+
+    return ['\n'.join(child.text for child in article.children) for article in file_articles(file)]
+
+
+def file_texts_lxml(file: Path) -> List[str]:
+    """
+    Parse every article of a single `.sgm` file with lxml's HTML parser, which is much faster than BeautifulSoup.
+
+    Gives the same text as `file_texts_beautifulsoup()`, except that an unknown entity reference like "&foo;" keeps its
+    semicolon. The Reuters corpus has none.
+
+    :param file: The `.sgm` file to parse
+    :return: The file's articles, joined into text exactly as `clean_text()` joins a `bs4.element.Tag`, in order
+    """
+
+    # lxml is optional, so only needed if this backend is actually used
+    from lxml import etree
+
+    with open(file, 'r') as f:
+        root = etree.fromstring(f.read(), etree.HTMLParser())
+
+    texts: List[str] = []
+
+    for article in root.iter('text'):
+        # Each top-level child becomes a line, as bs4 does. Text between child elements counts as a child of its own
+        children = [article.text] if article.text else []
+
+        for child in article:
+            children.append(''.join(child.itertext()) if isinstance(child.tag, str) else child.text or '')
+            if child.tail:
+                children.append(child.tail)
+
+        texts.append('\n'.join(children))
+
+    return texts
+
+
+# Every way of extracting article text from a `.sgm` file, by name. All give the same text for the Reuters corpus
+BACKENDS: Dict[str, Callable[[Path], List[str]]] = {
+    'bs4': file_texts_beautifulsoup,
+    'lxml': file_texts_lxml,
+    'regex': file_texts,
+}
+
+
+def parse_files(parse: Callable[[Path], List[str]], files: List[Path], workers: int) -> Iterator[List[str]]:
+    """
+    Parse files concurrently across worker processes, handing each file's articles over in the original file order.
+
+    Only as many files as there are workers are parsed ahead of the one being handed over, so stopping early, like
+    when a definite number of articles was requested, doesn't parse the rest of the corpus.
+
+    :param parse: Parses a single file into plain article strings, which are cheap to send between processes
+    :param files: The files to parse, in order
+    :param workers: How many processes to parse files with
+    :return: A generator of each file's articles, in file order
+    """
+
+    remaining = iter(files)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(parse, file) for file in islice(remaining, workers))
+
+        try:
+            while pending:
+                articles = pending.popleft().result()
+
+                # Keep every worker busy with the next file while this one is handed over
+                for file in remaining:
+                    pending.append(executor.submit(parse, file))
+                    break
+
+                yield articles
+
+        # Stopped early, so don't parse files that haven't been started yet
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def file_fingerprint(file: Path) -> List[int]:
+    """
+    :param file: A file of the corpus
+    :return: The file's size and modification time, which change whenever its contents do
+    """
+
+    stat = file.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def stream_texts(directory: str = "../reuters21578", article_count: Union[str, int] = 'all',
+                 parse_workers: int = 1, backend: str = 'regex', skip: int = 0,
+                 file_counts: Optional[Dict[str, List[int]]] = None) -> Iterator[str]:
+    """
+    Lazily read articles from the corpus, one at a time.
+
+    By default, this never builds a BeautifulSoup tree. Each file is read line by line, and each <REUTERS> block is
+    scanned for its <TEXT> as soon as it is complete. Reading stops as soon as the requested number of articles has
+    been produced.
+
+    With more than 1 parse worker, or another backend, whole files are parsed at a time instead, concurrently in
+    worker processes if asked to. Articles still come out in the same order.
+
+    :param directory: Optionally specify where the reuters corpus is
+    :param article_count: How many articles to retrieve. "all" or a number >= 1
+    :param parse_workers: How many processes to read files with. 1 reads every file in this process
+    :param backend: How to extract article text from each file. One of `BACKENDS`
+    :param skip: How many articles at the start of the corpus to leave out, like those a resumed run already processed.
+        They still count towards `article_count`
+    :param file_counts: How many articles each file holds, with its fingerprint, as [size, modification time, count]
+        by file name. Files known to be skipped entirely aren't read at all. Filled in as each file is read
+    :return: A generator of articles, already joined into text, as `textualize()` accepts them
+    """
+
+    CORPUS_FILES: List[Path] = corpus_files(directory)
+
+    rich.print("\nFound files:\n", [f"{f}" for f in CORPUS_FILES])
+    print()
+
+    LIMIT = int(article_count) if str(article_count).isnumeric() else None
+
+    found = 0
+
+    # Leave out whole files whose articles are all skipped, as long as they haven't changed since they were counted
+    while CORPUS_FILES and file_counts is not None:
+        known = file_counts.get(CORPUS_FILES[0].name)
+
+        if known is None or known[:2] != file_fingerprint(CORPUS_FILES[0]) or found + known[2] > skip:
+            break
+
+        found += known[2]
+        CORPUS_FILES = CORPUS_FILES[1:]
+
+    if parse_workers > 1:
+        files = parse_files(BACKENDS[backend], CORPUS_FILES, parse_workers)
+    elif backend != 'regex':
+        files = (BACKENDS[backend](file) for file in CORPUS_FILES)
+    else:
+        # A whole article is available as soon as its block is, so hand over its text right away
+        files = ((_join_children(inner) for block in reuters_blocks([file]) for inner in TEXT_PATTERN.findall(block))
+                 for file in CORPUS_FILES)
+
+    for file, articles in zip(CORPUS_FILES, files):
+        count = 0
+
+        for text in articles:
+            count += 1
+            found += 1
+
+            if found > skip:
+                yield text
+
+            if LIMIT is not None and found >= LIMIT:
+                files.close()
+                rich.print(f"Number of articles found: [bold green]{found}[/]\n")
+                return
+
+        if file_counts is not None:
+            file_counts[file.name] = file_fingerprint(file) + [count]
+
+    # Print a message if the user requested more articles than exist
+    if LIMIT is not None:
+        rich.print(f"You asked for [green bold]{article_count}[/] articles,"
+                   f" but only [green bold]{found}[/] found\n")
+    else:
+        rich.print(f"Number of articles found: [bold green]{found}[/]\n")
+
+
+def get_texts(directory: str = "../reuters21578", article_count: Union[str, int] = 'all',
+              parse_workers: int = 1, backend: str = 'bs4') -> List[Union['Tag', str]]:
     """
     Get any number of articles in the corpus and return a list of them
 
     :param directory: Optionally specify where the reuters corpus is
     :param article_count: How many articles to retrieve. "all" or a number >= 1
-    :return: A List of articles as `bs4.element.Tag` objects
+    :param parse_workers: How many processes to parse files with. With more than 1, articles are returned as plain
+        text rather than `bs4.element.Tag` objects, which are slow to send between processes
+    :param backend: How to extract article text from each file. One of `BACKENDS`. Anything but "bs4" returns
+        articles as plain text
+    :return: A List of articles as `bs4.element.Tag` objects, or as text
     """
 
     # Create a list of file names in the required Reuters corpus
-    CORPUS_FILES: List[Path] = [Path(p) for p in glob(f"{directory}/*.sgm")]
+    CORPUS_FILES: List[Path] = corpus_files(directory)
 
     rich.print("\nFound files:\n", [f"{f}" for f in CORPUS_FILES])
 
     # This will contain all the newspaper articles in the Reuters corpus
-    all_articles: List[Tag] = []
+    all_articles: List[Union['Tag', str]] = []
 
     print()
 
+    from rich.progress import Progress, SpinnerColumn
+
     # Create a spinner to show that the app isn't frozen
     spinner = Progress(SpinnerColumn(), '[progress.description]{task.description}', SpinnerColumn(), transient=True)
 
     with spinner:
         _ = spinner.add_task("Creating list of articles...")
 
-        # Loop through each file
-        for file in CORPUS_FILES:
-
-            # Read the file contents
-            with open(file, 'r') as f:
-                contents = BeautifulSoup(f, features="html.parser")
+        # Parse files concurrently if asked to. Otherwise, parse each file in turn
+        if parse_workers > 1:
+            parse = file_texts_beautifulsoup if backend == 'bs4' else BACKENDS[backend]
+            parsed = parse_files(parse, CORPUS_FILES, parse_workers)
+        else:
+            parse = file_articles if backend == 'bs4' else BACKENDS[backend]
+            parsed = (parse(file) for file in CORPUS_FILES)
 
-            # Get all the articles for the file
-            articles = contents('text')
+        # Loop through each file's articles
+        for articles in parsed:
 
             # Add each article to the list
             all_articles.extend(articles)
@@ -54,6 +410,9 @@ def get_texts(directory: str = "../reuters21578", article_count: Union[str, int]
             if article_count.isnumeric() and len(all_articles) >= int(article_count):
                 break
 
+        # Stop any worker processes still parsing files that are no longer needed
+        parsed.close()
+
     # If there is a definite article count provided, ensure article list only contains that many
     if article_count.isnumeric() and len(all_articles) > int(article_count):
         all_articles = all_articles[: int(article_count)]
@@ -70,56 +429,16 @@ def get_texts(directory: str = "../reuters21578", article_count: Union[str, int]
     return all_articles
 
 
-def textualize(article: Tag, article_num: int) -> str:
+def textualize(article: Union['Tag', str], article_num: int) -> str:
     """
     Take the given article (of type bs4.element.Tag) and turn it into normal text, as usable throughout the pipeline
 
-    :param article: The article as a bs4.element.Tag
+    :param article: The article as a bs4.element.Tag, or as text already produced by `stream_texts()`
     :param article_num: Which article this is
     :return: The 'stringified' version of the article
     """
 
-    # Bring all children together into 1 string
-    text = '\n'.join(child.text for child in article.children)
-
-    # Make sure all newline characters have a space after, to prevent future tokenization errors
-    # as found in experiment
-    text = text.replace('\n', '\n ')
-
-    # Remove all instances of multiple - in a row
-    text = sub(r'-{2,}', ' ', text)
-
-    # Remove - characters without letters surrounding them. Keeps "once-in-a-lifetime", but not " - "
-    text = sub(r'(?![A-Za-z])-(?![A-Za-z])', ' ', text)
-
-    # Remove certain unicode control characters, as found in experiment
-    text = sub(r'\x03|\x02', '', text)
-
-    # Remove all punctuation except periods and commas. Handle those separately for money values
-    text = sub(r"[()<>!:;?\"]+", ' ', text)
-
-    # Remove all instances of multiple periods in a row
-    text = sub(r"\.{2,}", ' ', text)
-
-    # Simplify acronyms to their constituent letters. i.e. changes "U.S." to "US"
-    text = sub(r"(?<!\w)([A-Za-z])\.", r'\1', text)
-
-    # Remove all periods that aren't surrounded by a number. i.e. keeps "1.1" and "1."
-    text = sub(r"(?!\d)\.(?!\d)", ' ', text)
-
-    # Remove all commas that aren't surrounded by a number. i.e. keeps "1,000"
-    text = sub(r"(?!\d),(?!\d)", ' ', text)
-
-    # Remove all apostrophes surrounded by letters. In other words, replace all "it's" with "its", etc.
-    text = sub(r"(?<=[A-Za-z])'(?=[A-Za-z])", '', text)
-
-    # Remove all apostrophes remaining. (Needed to do this separately, because we needed to replace contraction
-    # apostrophes with nothing. We will replace all other apostrophes with a space
-    text = sub(r"'", ' ', text)
-
-    # Remove all slashes, but not with numbers. For instance, removes / in "March/April", but not "1998/99".
-    # I will treat numbers with slashes in them as 1 concept
-    text = sub(r"(?!\d)/(?!\d)", ' ', text)
+    text = clean_text(article)
 
     file_print = Path(f'output/article{article_num}/1. Initial-text.txt')
 
@@ -152,3 +471,45 @@ def count_callback(count: str) -> str:
         raise typer.Exit(1)
 
     return count
+
+
+def backend_callback(backend: str) -> str:
+    """
+    A callback function for the Pipeline Typer app, to validate which backend the user wants articles extracted with.
+
+    :param backend: The value the user entered for the backend
+    :return: The value, if it was valid
+    """
+
+    if backend not in BACKENDS:
+        rich.print(f"\n[red bold]Only the backends[/] {', '.join(BACKENDS)} [red bold]are permitted[/]\n")
+        raise typer.Exit(1)
+
+    if backend == 'lxml' and importlib.util.find_spec('lxml') is None:
+        rich.print("\n[red bold]The lxml backend needs lxml installed:[/] pip install lxml\n")
+        raise typer.Exit(1)
+
+    return backend
+
+
+def emit_callback(emit: str) -> str:
+    """
+    A callback function for the Pipeline Typer app, to validate which steps' output the user wants written to file.
+
+    The value must either be "all", or a comma-separated list of the steps in `STAGE_FILES`.
+
+    :param emit: The value the user entered for the steps they want written to file
+    :return: The value, if it was valid
+    """
+
+    if emit.lower() == 'all':
+        return emit
+
+    unknown = [stage for stage in emit.split(',') if stage.strip().lower() not in STAGE_FILES]
+
+    if unknown:
+        rich.print(f"\n[red bold]Unknown steps:[/] {', '.join(unknown)}[red bold]. Only \"all\" or a comma-separated "
+                   f"list of[/] {', '.join(STAGE_FILES)} [red bold]are permitted[/]\n")
+        raise typer.Exit(1)
+
+    return emit
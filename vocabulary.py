@@ -0,0 +1,165 @@
+from array import array
+from itertools import compress
+from typing import Callable, Dict, Iterable, List, Optional
+
+from batching import TokenBatch, filter_ids_batch
+from stem_cache import StemCache
+from stopword_index import StopwordIndex
+
+
+class Vocabulary:
+    """
+    Interns every distinct token once, so articles can be carried between steps as compact arrays of integer IDs
+    instead of lists of strings.
+
+    Lowercasing and stemming are worked out once per distinct token, into maps from 1 ID to another, and stopwords
+    into a mask over IDs. Each step then only looks up IDs, however many times a token occurs. IDs are only meaningful
+    to the process that assigned them, so articles are always decoded back to strings before leaving it.
+    """
+
+    def __init__(self, stem_tokens: Callable[[List[str]], List[str]], stem_cache: Optional[StemCache] = None):
+        """
+        :param stem_tokens: Stems a list of tokens, like `StemCache.stem_tokens`. Only called with new tokens
+        :param stem_cache: The cache `stem_tokens` stems through, if any. Stems are kept apart for each stemmer it
+            switches to, and every stemmed ID is counted among its hits or misses
+        """
+
+        self.stem_tokens = stem_tokens
+        self.stem_cache = stem_cache
+        self.tokens: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+        # The ID of each token lowercased, and stemmed. Only cover the IDs they have been needed for so far. Kept as
+        # lists rather than arrays, since looking up an int that already exists is faster than boxing a new one
+        self.lower_ids: List[int] = []
+        self.stem_ids: List[int] = []
+
+        # Which stemmer `stem_ids` came from, and the stem IDs of every other stemmer used, by name
+        self.stemmer = stem_cache.name if stem_cache else None
+        self.other_stem_ids: Dict[str, List[int]] = {}
+
+        # Whether the token with each ID is kept by `stopword_index`. Also kept as 1 byte per ID, which NumPy can view
+        # without copying when filtering whole batches
+        self.keep: List[bool] = []
+        self.keep_bytes = bytearray()
+        self.stopword_index: Optional[StopwordIndex] = None
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def _add(self, token: str) -> int:
+        token_id = self.ids[token] = len(self.tokens)
+        self.tokens.append(token)
+        return token_id
+
+    def intern(self, tokens: List[str]) -> array:
+        """
+        :param tokens: The tokens of an article
+        :return: The ID of each token, assigning new IDs to tokens not seen before
+        """
+
+        ids = self.ids
+
+        try:
+            return array('I', map(ids.__getitem__, tokens))
+
+        # Only tokens not seen before need adding, after which every token has an ID
+        except KeyError:
+            for token in tokens:
+                if token not in ids:
+                    self._add(token)
+
+            return array('I', map(ids.__getitem__, tokens))
+
+    def decode(self, token_ids: Iterable[int]) -> List[str]:
+        """
+        :param token_ids: The IDs of an article's tokens
+        :return: The tokens themselves
+        """
+
+        return list(map(self.tokens.__getitem__, token_ids))
+
+    def lowercase(self, token_ids: array) -> array:
+        """
+        :param token_ids: The IDs of an article's tokens
+        :return: The ID of each token lowercased
+        """
+
+        lower_ids = self.lower_ids
+
+        # Lowercasing a new token can add another, so keep going until every ID is covered
+        while len(lower_ids) < len(self.tokens):
+            lower_ids.extend(self.intern([token.lower() for token in self.tokens[len(lower_ids):]]))
+
+        return array('I', map(lower_ids.__getitem__, token_ids))
+
+    def stem(self, token_ids: array) -> array:
+        """
+        :param token_ids: The IDs of an article's tokens
+        :return: The ID of each token stemmed
+        """
+
+        cache = self.stem_cache
+
+        # The cache switched stemmers, so these stems are another stemmer's
+        if cache is not None and cache.name != self.stemmer:
+            self.other_stem_ids[self.stemmer] = self.stem_ids
+            self.stemmer = cache.name
+            self.stem_ids = self.other_stem_ids.pop(self.stemmer, [])
+
+        stem_ids = self.stem_ids
+        stemmed = 0
+
+        # Stemming a new token can add another, so keep going until every ID is covered
+        while len(stem_ids) < len(self.tokens):
+            new_tokens = self.tokens[len(stem_ids):]
+            stem_ids.extend(self.intern(self.stem_tokens(new_tokens)))
+            stemmed += len(new_tokens)
+
+        # Every token counts as a cache lookup, as it would stemmed on its own. Only the new ones were actually looked
+        # up, and the rest are hits. New tokens also include ones only seen before lowercasing, so there can be more
+        # of them than tokens
+        if cache is not None:
+            cache.hits += max(len(token_ids) - stemmed, 0)
+
+        return array('I', map(stem_ids.__getitem__, token_ids))
+
+    def _update_mask(self, index: StopwordIndex) -> None:
+        """
+        Make sure the stopword mask covers every ID, and matches the given stopwords
+
+        :param index: The stopwords to remove
+        """
+
+        # The stopwords changed, so the whole mask is stale
+        if index is not self.stopword_index:
+            self.keep, self.keep_bytes = [], bytearray()
+            self.stopword_index = index
+
+        if len(self.keep) < len(self.tokens):
+            stopwords = index.stopwords
+            added = [token not in stopwords for token in self.tokens[len(self.keep):]]
+            self.keep.extend(added)
+            self.keep_bytes.extend(added)
+
+    def filter_stopwords(self, token_ids: array, index: StopwordIndex) -> array:
+        """
+        :param token_ids: The IDs of an article's tokens
+        :param index: The stopwords to remove
+        :return: The IDs of the tokens that aren't stopwords, in their original order
+        """
+
+        self._update_mask(index)
+
+        return array('I', compress(token_ids, map(self.keep.__getitem__, token_ids)))
+
+    def filter_stopwords_batch(self, batch: TokenBatch, index: StopwordIndex) -> TokenBatch:
+        """
+        :param batch: The IDs of the tokens of several articles
+        :param index: The stopwords to remove
+        :return: A batch of the same articles, without the IDs of stopwords
+        """
+
+        self._update_mask(index)
+
+        return filter_ids_batch(batch, self.keep_bytes)